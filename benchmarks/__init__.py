@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of boxsimu: a generator of synthetic systems of arbitrary
+size (generator), a runner that times scaling sweeps (runner), and a
+performance regression harness for the reference systems (regression).
+
+"""
+
+__all__ = [
+    'generator',
+    'reference_systems',
+    'regression',
+    'runner',
+]
+
+from .generator import get_synthetic_system
+from .runner import run_benchmark, run_sweep
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from .runner import main
+
+main()
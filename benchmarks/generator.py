@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic BoxModelSystems of arbitrary size.
+
+The generated systems are not meant to be realistic; they exercise all
+parts of the solver (flows, fluxes, processes, reactions) with a
+configurable number of elements and a configurable fraction of dynamic
+(callable) rates. Systems are reproducible for a given seed.
+
+Structure of a generated system:
+    - All boxes contain the same fluid ('water').
+    - The first N_boxes flows form a ring (box i -> box i+1), thus the
+      fluid masses stay constant. Further flows connect random boxes.
+    - Fluxes transport a random variable between two random boxes.
+    - Processes decay (dynamic) or produce (static) a random variable.
+    - Reactions convert one variable into another (or decay if there is
+      only one variable) in a fraction of the boxes.
+
+"""
+
+import os
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../"))
+
+import boxsimu as bs
+from boxsimu import ur
+
+
+def _get_flow_rate(source_name, rate, dynamic):
+    if not dynamic:
+        return rate * ur.kg / ur.year
+    k = rate / 1e16
+    return lambda t, c, s: s.boxes[source_name].fluid.mass * k / ur.year
+
+
+def _get_flux_rate(source_name, variable_name, rate, dynamic):
+    if not dynamic:
+        return rate * ur.kg / ur.year
+    return lambda t, c, s: (c[source_name].variables[variable_name] *
+            rate / ur.year)
+
+
+def _get_process_rate(variable_name, rate, dynamic):
+    if not dynamic:
+        return rate * ur.kg / ur.year
+    return lambda t, c, s: -c[variable_name] * rate / ur.year
+
+
+def _get_reaction_rate(variable_name, rate, dynamic):
+    if not dynamic:
+        return rate * ur.kg / ur.year
+    return lambda t, c, s: c[variable_name] * rate / ur.year
+
+
+def get_synthetic_system(N_boxes=4, N_variables=1, N_reactions=None,
+        N_processes=None, N_flows=None, N_fluxes=None, dynamic_fraction=0.5,
+        reaction_coverage=0.25, seed=0):
+    """Return a synthetic BoxModelSystem.
+
+    Args:
+        N_boxes (int): Number of boxes. Default: 4.
+        N_variables (int): Number of variables. Default: 1.
+        N_reactions (int): Number of reactions. Default: N_variables.
+        N_processes (int): Number of processes. Default: N_variables.
+        N_flows (int): Number of flows. Default: N_boxes (a ring).
+        N_fluxes (int): Number of fluxes. Default: N_boxes.
+        dynamic_fraction (float): Fraction of the rates that are given
+            as callables (dynamic) instead of constants (static).
+            Default: 0.5.
+        reaction_coverage (float): Fraction of the boxes in which every
+            process and reaction takes place. Default: 0.25.
+        seed (int): Seed of the random number generator. Default: 0.
+
+    """
+    N_reactions = N_reactions if N_reactions is not None else N_variables
+    N_processes = N_processes if N_processes is not None else N_variables
+    N_flows = N_flows if N_flows is not None else N_boxes
+    N_fluxes = N_fluxes if N_fluxes is not None else N_boxes
+    rng = np.random.RandomState(seed)
+
+    def is_dynamic():
+        return rng.random_sample() < dynamic_fraction
+
+    def get_box_ids():
+        N = max(1, int(round(reaction_coverage * N_boxes)))
+        return rng.choice(N_boxes, N, replace=False)
+
+    water = bs.Fluid('water', rho=1000*ur.kg/ur.meter**3)
+    variables = [bs.Variable('var{:02d}'.format(i))
+            for i in range(N_variables)]
+    box_names = ['box{:04d}'.format(i) for i in range(N_boxes)]
+    box_processes = [[] for i in range(N_boxes)]
+    box_reactions = [[] for i in range(N_boxes)]
+
+    for i in range(N_processes):
+        variable = variables[rng.randint(N_variables)]
+        dynamic = is_dynamic()
+        rate = 1e-2 if dynamic else 1e-3
+        process = bs.Process('process{:04d}'.format(i), variable=variable,
+                rate=_get_process_rate(variable.name, rate, dynamic))
+        for box_id in get_box_ids():
+            box_processes[box_id].append(process)
+
+    for i in range(N_reactions):
+        educt = variables[rng.randint(N_variables)]
+        coefficients = {educt: -1}
+        if N_variables > 1:
+            product = variables[(variables.index(educt) + 1 +
+                rng.randint(N_variables-1)) % N_variables]
+            coefficients[product] = 1
+        dynamic = is_dynamic()
+        rate = 1e-2 if dynamic else 1e-4
+        reaction = bs.Reaction('reaction{:04d}'.format(i), coefficients,
+                rate=_get_reaction_rate(educt.name, rate, dynamic))
+        for box_id in get_box_ids():
+            box_reactions[box_id].append(reaction)
+
+    boxes = []
+    for i, name in enumerate(box_names):
+        boxes.append(bs.Box(name, 'Synthetic box {}'.format(i),
+            fluid=water.q(rng.uniform(1e15, 1e17)*ur.kg),
+            variables=[var.q(rng.uniform(1, 100)*ur.kg)
+                for var in variables],
+            processes=box_processes[i], reactions=box_reactions[i]))
+
+    flows = []
+    for i in range(N_flows):
+        if i < N_boxes:
+            source, target = i, (i+1) % N_boxes
+            rate = 1e13
+        else:
+            source, target = rng.choice(N_boxes, 2, replace=False)
+            rate = rng.uniform(1e11, 1e12)
+        if source == target:
+            continue
+        flows.append(bs.Flow('flow{:05d}'.format(i), boxes[source],
+            boxes[target], _get_flow_rate(box_names[source], rate,
+                is_dynamic())))
+
+    fluxes = []
+    for i in range(N_fluxes):
+        if N_boxes < 2:
+            break
+        source, target = rng.choice(N_boxes, 2, replace=False)
+        variable = variables[rng.randint(N_variables)]
+        dynamic = is_dynamic()
+        rate = 1e-3 if dynamic else 1e-4
+        fluxes.append(bs.Flux('flux{:05d}'.format(i), boxes[source],
+            boxes[target], variable, _get_flux_rate(box_names[source],
+                variable.name, rate, dynamic)))
+
+    return bs.BoxModelSystem('synthetic', boxes, flows=flows, fluxes=fluxes)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Reference systems of the performance regression harness.
+
+Ports of the example systems examples/scripts/boxmodelsystem{1,2,3}.py to
+the current API (names must be valid identifiers, user-defined functions
+are called with time, context and system, reactions take
+reaction_coefficients). The structure and all rates are unchanged; the
+benchmarks must not depend on future edits of the examples.
+
+"""
+
+import os
+import sys
+
+if not os.path.abspath(__file__ + "/../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../"))
+
+import boxsimu as bs
+from boxsimu import ur
+
+
+def get_boxmodelsystem1():
+    """Two ocean boxes with river inflow, evaporation and overturning."""
+    seawater = bs.Fluid('seawater', rho=1000*ur.kg/ur.meter**3)
+    po4 = bs.Variable('po4')
+
+    upper_ocean = bs.Box(
+        name='upper_ocean',
+        description='Upper Ocean Box',
+        fluid=seawater.q(3e16*1020*ur.kg),
+        condition=bs.Condition(T=333*ur.kelvin),
+    )
+    deep_ocean = bs.Box(
+        name='deep_ocean',
+        description='Deep Ocean Box',
+        fluid=seawater.q(1e18*1030*ur.kg),
+        condition=bs.Condition(T=222*ur.kelvin),
+    )
+
+    flows = [
+        bs.Flow('downwelling', upper_ocean, deep_ocean,
+            6e17*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('upwelling', deep_ocean, upper_ocean,
+            6e17*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('river_inflow', None, upper_ocean, 3e16*ur.kg/ur.year,
+            tracer_transport=True,
+            concentrations={po4: 4.6455e-8*ur.kg/ur.kg}),
+        bs.Flow('upper_ocean_evaporation', upper_ocean, None,
+            3e16*ur.kg/ur.year, tracer_transport=False),
+    ]
+    return bs.BoxModelSystem('boxmodelsystem1', [upper_ocean, deep_ocean],
+            flows=flows, global_condition=bs.Condition(T=111*ur.kelvin))
+
+
+def get_boxmodelsystem2():
+    """Lake, ocean and sediment boxes with a simple nutrient cycle."""
+    seawater = bs.Fluid('seawater', rho=1020*ur.kg/ur.meter**3)
+    sediment_material = bs.Fluid('sediment_material',
+            rho=2720*ur.kg/ur.meter**3)
+
+    po4 = bs.Variable('po4')
+    no3 = bs.Variable('no3')
+    phyto = bs.Variable('phyto')
+
+    processes = [
+        bs.Process('po4_release_upper_ocean', variable=po4,
+            rate=lambda t, c, s: 12345 * ur.kg / ur.year),
+        bs.Process('po4_sink_upper_ocean', variable=po4,
+            rate=lambda t, c, s:
+                -c.upper_ocean.variables.po4 * 0.01 / ur.year),
+        bs.Process('no3_release_upper_ocean', variable=no3,
+            rate=lambda t, c, s: 123456 * ur.kg / ur.year),
+        bs.Process('no3_sink_upper_ocean', variable=no3,
+            rate=lambda t, c, s:
+                -c.upper_ocean.variables.no3 * 0.01 / ur.year),
+    ]
+    photosynthesis = bs.Reaction('photosynthesis',
+            reaction_coefficients={po4: -1, no3: -7, phyto: 114},
+            rate=lambda t, c, s: min(c.po4, c.no3/7) * 0.8 / ur.year)
+    remineralization = bs.Reaction('remineralization',
+            reaction_coefficients={po4: 1, no3: 7, phyto: -114},
+            rate=lambda t, c, s: (c.phyto/114) * 0.4 / ur.year)
+
+    lake = bs.Box(
+        name='lake',
+        description='Lake Box',
+        fluid=seawater.q(1e16*ur.kg),
+        condition=bs.Condition(T=290*ur.kelvin, pH=7.0),
+        variables=[po4.q(1*ur.kg), no3.q(2*ur.kg), phyto.q(3*ur.kg)],
+        reactions=[photosynthesis, remineralization],
+    )
+    upper_ocean = bs.Box(
+        name='upper_ocean',
+        description='Upper Ocean Box',
+        fluid=seawater.q(3e19*ur.kg),
+        processes=processes,
+        condition=bs.Condition(T=280*ur.kelvin, pH=8.3),
+        variables=[po4.q(4*ur.kg), no3.q(5*ur.kg), phyto.q(6*ur.kg)],
+        reactions=[photosynthesis, remineralization],
+    )
+    deep_ocean = bs.Box(
+        name='deep_ocean',
+        description='Deep Ocean Box',
+        fluid=seawater.q(1e21*ur.kg),
+        condition=bs.Condition(T=275*ur.kelvin, pH=8.1),
+        variables=[po4.q(7*ur.kg), no3.q(8*ur.kg), phyto.q(9*ur.kg)],
+        reactions=[remineralization],
+    )
+    sediment = bs.Box(
+        name='sediment',
+        description='Sediment Box',
+        fluid=sediment_material.q(1e10*ur.kg),
+        condition=bs.Condition(T=275*ur.kelvin, pH=7.7),
+        variables=[po4.q(10*ur.kg), no3.q(11*ur.kg), phyto.q(12*ur.kg)],
+    )
+
+    input_concentrations = {po4: 4.6455e-8*ur.kg/ur.kg,
+            no3: 7*4.6455e-8*ur.kg/ur.kg}
+    flows = [
+        bs.Flow('lake_evaporation', lake, None, 1e15*ur.kg/ur.year,
+            tracer_transport=False),
+        bs.Flow('lake_to_upper_ocean', lake, upper_ocean,
+            2e15*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('river_to_lake', None, lake, 3e15*ur.kg/ur.year,
+            tracer_transport=True,
+            concentrations=dict(input_concentrations)),
+        bs.Flow('downwelling', upper_ocean, deep_ocean,
+            6e17*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('upwelling', deep_ocean, upper_ocean,
+            6e17*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('upper_ocean_evaporation', upper_ocean, None,
+            2e15*ur.kg/ur.year, tracer_transport=False),
+        bs.Flow('deep_ocean_percolation', deep_ocean, None,
+            1e11*ur.kg/ur.year, tracer_transport=True),
+        bs.Flow('deep_ocean_fount', None, deep_ocean, 1e11*ur.kg/ur.year,
+            tracer_transport=True,
+            concentrations=dict(input_concentrations)),
+    ]
+    fluxes = [
+        bs.Flux('biological_pump', upper_ocean, deep_ocean, phyto,
+            lambda t, c, s: c.upper_ocean.variables.phyto * 0.1 / ur.year),
+        bs.Flux('oc_burial', deep_ocean, sediment, phyto,
+            lambda t, c, s:
+                (c.upper_ocean.variables.phyto * 0.1) * 0.1 / ur.year),
+        bs.Flux('desert_dust_po4', None, upper_ocean, po4,
+            lambda t, c, s: 1e5*ur.kg/ur.year),
+        bs.Flux('desert_dust_no3', None, upper_ocean, no3,
+            lambda t, c, s: 2e4*ur.kg/ur.year),
+        bs.Flux('oc_material_lithification', sediment, None, phyto,
+            lambda t, c, s: c.sediment.variables.phyto * 0.1 / ur.year),
+    ]
+    return bs.BoxModelSystem('boxmodelsystem2',
+            [lake, upper_ocean, deep_ocean, sediment], flows=flows,
+            fluxes=fluxes,
+            global_condition=bs.Condition(T=288*ur.kelvin, pH=7.3))
+
+
+def get_boxmodelsystem3():
+    """Two boxes with coupled reactions and a conditionally mobile tracer."""
+    water = bs.Fluid('water', rho=1000*ur.kg/ur.meter**3)
+
+    A = bs.Variable('A', description='Variable A')
+    B = bs.Variable('B', description='Variable B')
+    C = bs.Variable('C', description='Variable C')
+    # Variable D is mobile if the temperature is above 298K
+    D = bs.Variable('D', mobility=lambda t, c, s:
+            bool(c.T > 298*ur.kelvin))
+
+    reaction1 = bs.Reaction('reaction1',
+            reaction_coefficients={A: -3, B: -5, C: 2},
+            rate=lambda t, c, s: min(c.A/3, c.B/5) * 2.2 / ur.year)
+
+    def rr2(t, c, s):
+        """If Mass(C) > Mass_crit : C -> D."""
+        m_crit = 0.5 * ur.kg
+        if c.C > m_crit:
+            return (c.C-m_crit) * 0.1 / ur.year
+        return 0 * ur.kg / ur.year
+
+    reaction2 = bs.Reaction('reaction2',
+            reaction_coefficients={C: -1, D: 1}, rate=rr2)
+
+    box1 = bs.Box(
+        name='box1',
+        description='Box 1',
+        fluid=water.q(1e5*ur.kg),
+        condition=bs.Condition(T=290*ur.kelvin),
+        variables=[A.q(1*ur.kg), B.q(3*ur.kg)],
+        reactions=[reaction1, reaction2],
+    )
+    box2 = bs.Box(
+        name='box2',
+        description='Box 2',
+        fluid=water.q(1e5*ur.kg),
+        condition=bs.Condition(T=300*ur.kelvin),
+        variables=[A.q(2*ur.kg), B.q(1*ur.kg)],
+        reactions=[reaction1, reaction2],
+    )
+
+    flows = [
+        bs.Flow('inflow', None, box1, 1e3*ur.kg/ur.year,
+            tracer_transport=True, concentrations={B: 2*ur.gram/ur.kg}),
+        bs.Flow('flow_box1_to_box2', box1, box2, 1e3*ur.kg/ur.year,
+            tracer_transport=True),
+        bs.Flow('outflow', box2, None, 1e3*ur.kg/ur.year,
+            tracer_transport=True),
+    ]
+    return bs.BoxModelSystem('boxmodelsystem3', [box1, box2], flows=flows,
+            global_condition=bs.Condition(T=295*ur.kelvin))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Performance regression harness for the reference systems.
+
+The three reference systems (see reference_systems) are solved with a
+fixed number of timesteps. For every system the timesteps per second
+(fastest of several runs), the peak memory allocated during a solve
+(tracemalloc) and the time of every solver phase are measured. These
+measurements are stored in a baseline file (baseline.json). A later
+measurement is compared against this baseline; a regression is reported
+if a system became slower or needs more memory than the baseline plus a
+relative threshold.
+
+Usage (from the root of the repository):
+    python -m benchmarks.regression --record     # write a new baseline
+    python -m benchmarks.regression --threshold 0.25   # check
+
+The check can also be run with pytest (tests/test_performance.py, only
+if the environment variable BOXSIMU_BENCHMARK is set).
+
+"""
+
+import os
+import sys
+import json
+import platform
+import argparse
+import tracemalloc
+import time as time_module
+
+if not os.path.abspath(__file__ + "/../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../"))
+
+import numpy as np
+import pint
+
+from boxsimu import ur
+from boxsimu.solver import SOLVER_PHASES
+
+from . import reference_systems as bm_reference_systems
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'baseline.json')
+
+# Reference system -> (get_system function, total integration time, dt)
+REFERENCE_RUNS = {
+    'boxmodelsystem1': (bm_reference_systems.get_boxmodelsystem1,
+        100*ur.year, 1*ur.year),
+    'boxmodelsystem2': (bm_reference_systems.get_boxmodelsystem2,
+        50*ur.year, 1*ur.year),
+    'boxmodelsystem3': (bm_reference_systems.get_boxmodelsystem3,
+        1*ur.year, 0.02*ur.year),
+}
+
+# Default relative threshold of a regression (25% slower/more memory)
+DEFAULT_THRESHOLD = 0.25
+
+
+def measure(name, repeat=3):
+    """Return the performance measurements of a reference system.
+
+    Args:
+        name (str): Key of REFERENCE_RUNS.
+        repeat (int): Number of timed runs; the fastest run is reported.
+
+    Returns:
+        measurement (dict): N_timesteps, steps_per_second, peak_memory
+            [bytes] and phases (dict phase -> time [s]).
+
+    """
+    get_system, total_integration_time, dt = REFERENCE_RUNS[name]
+    system = get_system()
+    initial_state = system.snapshot()
+
+    best_time, best_solution = None, None
+    for i in range(repeat):
+        system.restore(initial_state)
+        start = time_module.perf_counter()
+        sol = system.solve(total_integration_time, dt, verbose=False)
+        solve_time = time_module.perf_counter() - start
+        if best_time is None or solve_time < best_time:
+            best_time, best_solution = solve_time, sol
+
+    # Memory is measured in a separate run since tracing slows it down
+    system.restore(initial_state)
+    tracemalloc.start()
+    try:
+        system.solve(total_integration_time, dt, verbose=False)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    N_timesteps = best_solution.N_timesteps
+    return {
+        'N_timesteps': N_timesteps,
+        'steps_per_second': N_timesteps / best_time,
+        'peak_memory': peak_memory,
+        'phases': {phase: best_solution.timings.totals[phase]
+            for phase in SOLVER_PHASES},
+    }
+
+
+def measure_all(repeat=3):
+    """Return the measurements of all reference systems."""
+    return {name: measure(name, repeat) for name in REFERENCE_RUNS}
+
+
+def get_environment():
+    """Return the versions of Python, numpy and pint and the platform."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pint': pint.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def record_baseline(file_name=BASELINE_FILE, repeat=3):
+    """Measure all reference systems and write them to a baseline file."""
+    baseline = {
+        'environment': get_environment(),
+        'systems': measure_all(repeat),
+    }
+    with open(file_name, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    return baseline
+
+
+def load_baseline(file_name=BASELINE_FILE):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def compare(baseline, measurements, threshold=DEFAULT_THRESHOLD):
+    """Return all regressions of measurements compared to baseline.
+
+    Args:
+        baseline (dict): Content of a baseline file.
+        measurements (dict): Reference system -> measurement (see
+            measure).
+        threshold (float): Relative threshold of a regression.
+
+    Returns:
+        regressions (list of str): Description of every regression
+            (empty if there is none).
+
+    """
+    regressions = []
+    for name, current in measurements.items():
+        reference = baseline['systems'].get(name)
+        if reference is None:
+            continue
+        if current['N_timesteps'] != reference['N_timesteps']:
+            regressions.append('{}: number of timesteps changed ({} -> {})'
+                    .format(name, reference['N_timesteps'],
+                        current['N_timesteps']))
+            continue
+        minimal_speed = reference['steps_per_second'] * (1 - threshold)
+        if current['steps_per_second'] < minimal_speed:
+            slowest = sorted(SOLVER_PHASES, key=lambda phase:
+                    reference['phases'][phase] - current['phases'][phase])
+            regressions.append('{}: {:.2f} steps/s < {:.2f} steps/s '
+                    '(baseline {:.2f}; largest increase in phase "{}")'
+                    .format(name, current['steps_per_second'], minimal_speed,
+                        reference['steps_per_second'], slowest[0]))
+        maximal_memory = reference['peak_memory'] * (1 + threshold)
+        if current['peak_memory'] > maximal_memory:
+            regressions.append('{}: peak memory {:.0f} B > {:.0f} B '
+                    '(baseline {:.0f} B)'.format(name,
+                        current['peak_memory'], maximal_memory,
+                        reference['peak_memory']))
+    return regressions
+
+
+def check(file_name=BASELINE_FILE, threshold=DEFAULT_THRESHOLD, repeat=3):
+    """Measure all reference systems and compare them to the baseline."""
+    return compare(load_baseline(file_name), measure_all(repeat), threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Performance regression '
+            'check of the boxsimu reference systems.')
+    parser.add_argument('--record', action='store_true',
+            help='Write a new baseline instead of checking.')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.record:
+        baseline = record_baseline(args.baseline, args.repeat)
+        for name, measurement in baseline['systems'].items():
+            print('{}: {:.2f} steps/s, peak memory {:.0f} B'.format(
+                name, measurement['steps_per_second'],
+                measurement['peak_memory']))
+        return 0
+
+    regressions = check(args.baseline, args.threshold, args.repeat)
+    for regression in regressions:
+        print(regression)
+    if not regressions:
+        print('No performance regressions.')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
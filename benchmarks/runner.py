@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark runner: time BoxModelSystem.solve for scaling sweeps of
+synthetic systems and write the results to CSV and JSON.
+
+Usage (from the root of the repository):
+    python -m benchmarks --sweep boxes --max-boxes 256 --output results
+    python -m benchmarks --sweep variables --timesteps 20 --repeat 3
+
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+import time as time_module
+
+if not os.path.abspath(__file__ + "/../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../"))
+
+from boxsimu import ur
+from boxsimu.solver import SOLVER_PHASES
+
+from . import generator as bm_generator
+
+
+# Scaling sweeps: lists of keyword arguments of get_synthetic_system
+SWEEPS = {
+    'boxes': [dict(N_boxes=N, N_variables=4)
+        for N in (4, 16, 64, 256, 1024, 4096)],
+    'variables': [dict(N_boxes=16, N_variables=N)
+        for N in (1, 2, 4, 8, 16, 32, 64)],
+    'dynamic': [dict(N_boxes=64, N_variables=4, dynamic_fraction=f)
+        for f in (0.0, 0.25, 0.5, 0.75, 1.0)],
+}
+
+
+def get_sweep(name, max_boxes=None, max_variables=None):
+    """Return the configurations of a sweep (see SWEEPS)."""
+    configs = SWEEPS[name]
+    if max_boxes is not None:
+        configs = [c for c in configs if c['N_boxes'] <= max_boxes]
+    if max_variables is not None:
+        configs = [c for c in configs if c['N_variables'] <= max_variables]
+    return configs
+
+
+def run_benchmark(N_timesteps=10, repeat=1, **config):
+    """Build and solve one synthetic system and return the timings.
+
+    The system is solved repeat times (restored to its initial state in
+    between); the fastest run is reported.
+
+    Args:
+        N_timesteps (int): Number of timesteps (dt = 1 year).
+        repeat (int): Number of simulations.
+        **config: Keyword arguments of get_synthetic_system.
+
+    Returns:
+        result (dict): config, number of timesteps, time to build the
+            system [s], time to solve [s], timesteps per second, and the
+            time of every solver phase [s] (of the fastest run).
+
+    """
+    start = time_module.perf_counter()
+    system = bm_generator.get_synthetic_system(**config)
+    build_time = time_module.perf_counter() - start
+
+    initial_state = system.snapshot()
+    best_time, best_solution = None, None
+    for i in range(repeat):
+        system.restore(initial_state)
+        start = time_module.perf_counter()
+        sol = system.solve(N_timesteps*ur.year, 1*ur.year, verbose=False)
+        solve_time = time_module.perf_counter() - start
+        if best_time is None or solve_time < best_time:
+            best_time, best_solution = solve_time, sol
+
+    result = dict(config)
+    result.update({
+        'N_boxes': system.N_boxes,
+        'N_variables': system.N_variables,
+        'N_flows': len(system.flows),
+        'N_fluxes': len(system.fluxes),
+        'N_processes': len(system.processes),
+        'N_reactions': len(system.reactions),
+        'N_timesteps': N_timesteps,
+        'build_time': build_time,
+        'solve_time': best_time,
+        'steps_per_second': N_timesteps / best_time,
+    })
+    for phase in SOLVER_PHASES:
+        result['time_' + phase] = best_solution.timings.totals[phase]
+    return result
+
+
+def run_sweep(configs, N_timesteps=10, repeat=1, verbose=True):
+    """Run run_benchmark for every configuration and return the results."""
+    results = []
+    for config in configs:
+        result = run_benchmark(N_timesteps, repeat, **config)
+        if verbose:
+            print('{N_boxes:>6} boxes {N_variables:>4} variables: '
+                '{solve_time:10.3f}s ({steps_per_second:.2f} steps/s)'.format(
+                    **result))
+        results.append(result)
+    return results
+
+
+def write_csv(results, file_name):
+    """Write results (list of dict) to a CSV file."""
+    fieldnames = []
+    for result in results:
+        fieldnames += [key for key in result if key not in fieldnames]
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(results, file_name):
+    """Write results (list of dict) to a JSON file."""
+    with open(file_name, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Benchmark boxsimu with synthetic systems.')
+    parser.add_argument('--sweep', choices=sorted(SWEEPS), default='boxes')
+    parser.add_argument('--max-boxes', type=int, default=None)
+    parser.add_argument('--max-variables', type=int, default=None)
+    parser.add_argument('--timesteps', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default='benchmark_results',
+            help='Prefix of the output files (<output>.csv/.json).')
+    args = parser.parse_args(argv)
+
+    configs = get_sweep(args.sweep, args.max_boxes, args.max_variables)
+    results = run_sweep(configs, args.timesteps, args.repeat)
+    write_csv(results, args.output + '.csv')
+    write_json(results, args.output + '.json')
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -10,10 +10,11 @@ import os
 import sys
 import inspect
 
-from pint import UnitRegistry
+from .units import get_unit_registry
 # Use this instance of pint.UnitRegistry in order to avoid errors due 
 # to the incompatibility between different instances thereof!
-ur = UnitRegistry() 
+# (The registry is created from an on-disk cache, see units.py)
+ur = get_unit_registry()
 
 
 # realpath() will make your script run, even if you symlink it :)
@@ -38,14 +39,25 @@ if _cmd_subfolder not in sys.path:
 
 __all__ = [
     'box',
+    'cache',
     'condition',
+    'context',
+    'diagnostics',
+    'downsampling',
     'entities',
+    'incremental',
+    'model',
     'process',
+    'profiling',
     'solution',
     'solver',
+    'storage',
     'system',
     'tests',
+    'timing',
+    'tracing',
     'transport',
+    'units',
     'utils',
     'visualize',    
 ]
@@ -53,6 +65,7 @@ __all__ = [
 from .box import Box
 from .condition import Condition
 from .entities import Fluid, Variable
+from .function import Expression
 from .process import Process, Reaction
 from .solution import Solution
 from .solver import Solver
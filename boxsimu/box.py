@@ -24,9 +24,12 @@ from attrdict import AttrDict
 from keyword import iskeyword
 
 from . import condition as bs_condition
+from . import context as bs_context
 from . import descriptors as bs_descriptors
 from . import entities as bs_entities
 from . import errors as bs_errors
+from . import validation as bs_validation
+from . import visualize as bs_visualize
 from . import ur
 
 
@@ -77,6 +80,8 @@ class Box:
         reactions (list of Reaction): Reactions that take place in the box.
         mass (pint Quantity [M]): Total mass of the box. Sum of the masses of
             all variables and the fluid (if present).
+        context (BoxContext): Read-only view of the condition and the
+            variable masses of the box. Passed to user-defined functions.
 
     Methods:
         get_volume(time, system): Return the volume of the box (pint.Quantity
@@ -118,6 +123,8 @@ class Box:
         if len(variable_names) != len(set(variable_names)):
             raise ValueError('Variable names must be unique!')
 
+        self._context = None
+
     def __str__(self):
         return '<Box {}>'.format(self.name)
 
@@ -155,10 +162,19 @@ class Box:
 
     @property
     def context(self):
-        context = self.condition
-        for variable_name, variable in self.variables.items():
-            setattr(context, variable_name, variable.mass)
-        return context
+        """Read-only view of the condition and the variable masses."""
+        if self._context is None:
+            self.init_context()
+        return self._context
+
+    def init_context(self, system=None):
+        """Create the context view of the box.
+
+        The condition of the box is merged with the global condition of
+        system. Run by BoxModelSystem.init_system.
+
+        """
+        self._context = bs_context.BoxContext(self, system)
 
     def get_volume(self, time, system):
         """Return the volume of the box [L^3].
@@ -173,16 +189,16 @@ class Box:
         """Return the mass concentration [kg/kg] of variable."""
         if self.mass.magnitude > 0:
             concentration = self.variables[variable.name].mass / self.mass
-            concentration = concentration.to_base_units()
+            concentration = bs_validation.to_base_units(concentration)
             return concentration
         return 0 * ur.dimensionless
 
     def get_vconcentration(self, variable, time, system):
         """Return the volumetric concentration [kg/m^3] of variable."""
-        volume = self.get_volume(time, self.context, system)
+        volume = self.get_volume(time, system)
         if volume.magnitude > 0:
             concentration = self.variables[variable.name].mass / volume
-            concentration = concentration.to_base_units()
+            concentration = bs_validation.to_base_units(concentration)
             return concentration
         return 0 * ur.kg / ur.meter**3
 
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the compiled (static) arrays of BoxModelSystems.
+
+Before the first timestep the solver assembles the contributions of all
+static rates into source/sink vectors and exchange matrices (see
+solver.StaticContributions). For large systems this evaluates every
+static rate once per variable and takes a noticeable time on every run.
+The arrays only depend on the structure of the system and on its static
+rates, not on the masses; repeated runs of the same model (e.g. an
+ensemble of simulations with different initial states) can therefore
+load the arrays from a cache instead. The cache is opt-in: pass a
+CompilationCache (or True for the default cache) as the argument cache
+of solve, BoxModelSystem.solve or Solver.
+
+The cache key is a hash of the topology (boxes, variables, processes,
+reactions, flows and fluxes), the conditions and the static rates of a
+system (see get_model_hash). Dynamic rates are not evaluated during the
+compilation; only the fact that a rate is dynamic enters the hash. The
+arrays are stored sparsely (mostly zero exchange matrices) as .npz files
+in the directory 'compiled' of the boxsimu cache directory (see
+units.get_cache_dir). If the total size of the files exceeds max_size,
+the least recently used files are removed.
+
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from . import units as bs_units
+
+
+# Increase if the compiled arrays change, such that old files are unused
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 256 * 1024**2
+
+
+def _get_static_magnitude(user_function):
+    """Return the magnitude of a static UserFunction (None if dynamic)."""
+    if user_function.is_dynamic:
+        return None
+    magnitude = user_function.expression.magnitude
+    return np.asarray(magnitude, dtype=float).tolist()
+
+
+def _get_box_name(box):
+    return box.name if box is not None else None
+
+
+def get_model_hash(system):
+    """Return a hash of the topology, conditions and static rates of system.
+
+    Masses and the code of dynamic rates are not part of the hash.
+
+    """
+    signature = {
+        'version': CACHE_VERSION,
+        'variables': list(system.variable_names),
+        'global_condition': dict(system.global_condition),
+        'boxes': [[box.name, [p.name for p in box.processes],
+            [r.name for r in box.reactions], dict(box.condition)]
+            for box in system.box_list],
+        'processes': [[p.name, p.variable.name,
+            _get_static_magnitude(p.rate)] for p in system.processes],
+        'reactions': [[r.name, {variable.name: coefficient for variable,
+            coefficient in r.reaction_coefficients.items()},
+            _get_static_magnitude(r.rate)] for r in system.reactions],
+        'flows': [[f.name, _get_box_name(f.source_box),
+            _get_box_name(f.target_box), f.tracer_transport,
+            _get_static_magnitude(f.rate), {variable.name:
+                _get_static_magnitude(concentration) for variable,
+                concentration in f.concentrations.items()},
+            dict(f.condition or {})] for f in system.flows],
+        'fluxes': [[f.name, _get_box_name(f.source_box),
+            _get_box_name(f.target_box), f.variable.name,
+            _get_static_magnitude(f.rate), dict(f.condition or {})]
+            for f in system.fluxes],
+    }
+    # Condition values that are not JSON types (e.g. quantities) enter
+    # the hash by their representation
+    data = json.dumps(signature, sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class CompilationCache:
+    """Directory of compiled arrays with a least-recently-used size limit.
+
+    Files are written atomically; several processes (e.g. workers of an
+    ensemble) can share the same directory.
+
+    Args:
+        directory (str): Directory of the cache files.
+        max_size (int): Maximal total size [bytes] of the cache files.
+            Default: DEFAULT_MAX_SIZE.
+
+    """
+
+    SUFFIX = '.npz'
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _get_file_name(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _get_files(self):
+        """Return (mtime, size, file_name) of all cache files."""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return files
+        for entry in entries:
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    @property
+    def size(self):
+        """Total size [bytes] of all cache files."""
+        return sum(size for mtime, size, file_name in self._get_files())
+
+    def get(self, key):
+        """Return the dict of arrays stored under key (None if missing).
+
+        Files that cannot be read are removed.
+
+        """
+        file_name = self._get_file_name(key)
+        try:
+            with np.load(file_name, allow_pickle=False) as data:
+                stored = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self._remove(file_name)
+            return None
+
+        # The modification time marks the last use of a file
+        try:
+            os.utime(file_name)
+        except OSError:
+            pass
+
+        arrays = {}
+        for name in stored:
+            if not name.endswith('.shape'):
+                continue
+            name = name[:-len('.shape')]
+            array = np.zeros(stored[name + '.shape'])
+            array.flat[stored[name + '.indices']] = stored[name + '.values']
+            arrays[name] = array
+        return arrays
+
+    def put(self, key, arrays):
+        """Store the dict of float arrays under key.
+
+        Only the nonzero elements of the arrays are stored. Errors (e.g.
+        a read-only cache directory) are ignored.
+
+        """
+        stored = {}
+        for name, array in arrays.items():
+            array = np.asarray(array, dtype=float)
+            indices = np.flatnonzero(array)
+            stored[name + '.shape'] = np.array(array.shape, dtype=int)
+            stored[name + '.indices'] = indices
+            stored[name + '.values'] = array.flat[indices]
+
+        file_name = self._get_file_name(key)
+        tmp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_file_name, 'wb') as f:
+                np.savez(f, **stored)
+            os.replace(tmp_file_name, file_name)
+        except Exception:
+            self._remove(tmp_file_name)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until size <= max_size."""
+        files = sorted(self._get_files())
+        size = sum(size for mtime, size, file_name in files)
+        for mtime, file_size, file_name in files:
+            if size <= self.max_size:
+                break
+            self._remove(file_name)
+            size -= file_size
+
+    def clear(self):
+        """Remove all cache files."""
+        for mtime, size, file_name in self._get_files():
+            self._remove(file_name)
+
+    def _remove(self, file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+
+def get_default_cache():
+    """Return the default CompilationCache (None if it is disabled).
+
+    The cache is stored in the directory 'compiled' of the boxsimu cache
+    directory and is disabled together with it (see units.get_cache_dir).
+
+    """
+    cache_dir = bs_units.get_cache_dir()
+    if not cache_dir:
+        return None
+    return CompilationCache(os.path.join(cache_dir, 'compiled'),
+            max_size=DEFAULT_MAX_SIZE)
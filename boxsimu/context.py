@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only views that are passed as context to user-defined functions.
+
+A BoxContext gives access to the (merged) condition and the variable
+masses of a box. The masses are read on demand, thus the same view can
+be used during the whole simulation and no state is copied into the
+condition of the box. Optionally, all values are returned as floats
+(magnitudes in base units) instead of pint Quantities.
+
+Attribute lookup of a BoxContext (first match is returned):
+    1) Variable masses of the box (e.g. context.po4).
+    2) Condition parameters of the box, supplemented by the global
+       condition of the system (e.g. context.T).
+    3) global_condition: Condition of the system.
+    4) Names of the boxes of the system: BoxState view of the condition
+       and the variable masses of that box
+       (e.g. context.deep_ocean.variables.po4).
+
+"""
+
+from . import condition as bs_condition
+from . import validation as bs_validation
+
+
+def _get_value(value, magnitudes):
+    """Return value or its magnitude in base units (magnitudes=True)."""
+    if magnitudes and hasattr(value, 'units'):
+        return bs_validation.get_base_magnitude(value)
+    return value
+
+
+def _get_mass(entity, magnitudes):
+    """Return the mass of entity (as float [kg] if magnitudes=True)."""
+    if magnitudes:
+        return entity.mass_magnitude
+    return entity.mass
+
+
+class _ReadOnlyView:
+    """Base class of all context views.
+
+    Attribute and item access are handled identically. All internal
+    attributes are set with object.__setattr__, user-code cannot modify
+    a view.
+
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._get(name)
+
+    def __getitem__(self, name):
+        try:
+            return self._get(name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Context views are read-only.')
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(name, self._get(name)) for name in self.keys()]
+
+    def values(self):
+        return [self._get(name) for name in self.keys()]
+
+    def get(self, name, default=None):
+        try:
+            return self._get(name)
+        except AttributeError:
+            return default
+
+    def _get(self, name):
+        raise AttributeError(name)
+
+    def keys(self):
+        return []
+
+
+class VariableMasses(_ReadOnlyView):
+    """View of the variable masses of a box.
+
+    Args:
+        box (Box): Box whose variable masses are returned.
+        magnitudes (bool): If True, masses are returned as floats [kg].
+
+    """
+
+    def __init__(self, box, magnitudes=False):
+        object.__setattr__(self, '_box', box)
+        object.__setattr__(self, '_magnitudes', magnitudes)
+
+    def _get(self, name):
+        try:
+            variable = self._box.variables[name]
+        except KeyError:
+            raise AttributeError(name)
+        return _get_mass(variable, self._magnitudes)
+
+    def keys(self):
+        return list(self._box.variables.keys())
+
+
+class BoxState(_ReadOnlyView):
+    """View of the condition and the variable masses of a box.
+
+    Args:
+        box (Box): Box that is viewed.
+        magnitudes (bool): If True, values are returned as floats.
+
+    Attributes:
+        box (Box): Box that is viewed.
+        condition (Condition): Condition of the box.
+        variables (VariableMasses): Masses of the variables of the box.
+        mass (pint.Quantity [M] or float): Total mass of the box.
+
+    """
+
+    def __init__(self, box, magnitudes=False):
+        object.__setattr__(self, 'box', box)
+        object.__setattr__(self, '_magnitudes', magnitudes)
+        object.__setattr__(self, 'variables',
+                VariableMasses(box, magnitudes))
+
+    def _get(self, name):
+        if name in ('condition', 'cond'):
+            return self.box.condition
+        elif name == 'var':
+            return self.variables
+        elif name == 'mass':
+            return _get_value(self.box.mass, self._magnitudes)
+        raise AttributeError(name)
+
+    def keys(self):
+        return ['condition', 'variables', 'mass']
+
+
+class BoxContext(_ReadOnlyView):
+    """Context of a box that is passed to user-defined functions.
+
+    The condition of the box is merged with the global condition of the
+    system once, when the view is created. Variable masses are read on
+    every access. Therefore, a view must be recreated (see
+    BoxModelSystem.init_system) if conditions are changed, but not if
+    masses change.
+
+    Args:
+        box (Box): Box whose context is viewed. If None, the context of
+            the system (global condition only) or of a transport is
+            viewed.
+        system (BoxModelSystem): System that contains box. If None,
+            neither the global condition nor other boxes are accessible.
+        magnitudes (bool): If True, all quantities are returned as floats
+            (magnitudes in base units). Default: False.
+        condition (Condition): Condition that is used instead of the
+            condition of box (e.g. the condition of a Flow or Flux).
+            Default: None.
+
+    Attributes:
+        box (Box): Box whose context is viewed.
+        system (BoxModelSystem): System that contains box.
+        condition (Condition): Merged condition of the box and the system.
+        magnitudes (bool): True if values are returned as floats.
+
+    """
+
+    def __init__(self, box=None, system=None, magnitudes=False,
+            condition=None):
+        if condition is None and box is not None:
+            condition = box.condition
+        condition = bs_condition.Condition(condition or {})
+        if system is not None:
+            condition.set_superset_condition(system.global_condition)
+
+        object.__setattr__(self, 'box', box)
+        object.__setattr__(self, 'system', system)
+        object.__setattr__(self, 'condition', condition)
+        object.__setattr__(self, 'magnitudes', magnitudes)
+        object.__setattr__(self, '_condition_values', {key: _get_value(
+            value, magnitudes) for key, value in condition.items()})
+        object.__setattr__(self, '_box_states', {})
+
+    def __str__(self):
+        name = self.box.name if self.box is not None else 'system'
+        return '<BoxContext {}>'.format(name)
+
+    def _get(self, name):
+        box = self.box
+        if box is not None and name in box.variables:
+            return _get_mass(box.variables[name], self.magnitudes)
+        try:
+            return self._condition_values[name]
+        except KeyError:
+            pass
+        system = self.system
+        if system is not None:
+            if name == 'global_condition':
+                return system.global_condition
+            if name in system.boxes:
+                return self.get_box_state(system.boxes[name])
+        raise AttributeError(name)
+
+    def get_box_state(self, box):
+        """Return the (cached) BoxState view of box."""
+        try:
+            return self._box_states[box.name]
+        except KeyError:
+            state = BoxState(box, self.magnitudes)
+            self._box_states[box.name] = state
+            return state
+
+    def keys(self):
+        keys = list(self.box.variables.keys()) if self.box else []
+        keys += [k for k in self._condition_values.keys() if k not in keys]
+        return keys
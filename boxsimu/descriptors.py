@@ -43,7 +43,7 @@ class PintQuantityDescriptor:
         if instance is None: return self
         if value is None: return
         bs_validation.raise_if_not(value, self.units)
-        setattr(instance, self.name, value.to_base_units())
+        setattr(instance, self.name, bs_validation.to_base_units(value))
 
 
 class QuantifiedPintQuantityDescriptor(PintQuantityDescriptor):
@@ -59,6 +59,35 @@ class QuantifiedPintQuantityDescriptor(PintQuantityDescriptor):
         instance._quantified = True
 
 
+class StateMassDescriptor(QuantifiedPintQuantityDescriptor):
+    """Mass that is stored in the state array of a BoxModelSystem.
+
+    As long as the instance is not bound to a state array (see
+    BaseEntity.bind_state) the mass is stored on the instance itself.
+    Once bound, the attribute is a view of one element of the state
+    array: reading returns the current element, assigning validates the
+    value and writes its magnitude (in base units) to the array.
+
+    """
+
+    def __get__(self, instance, instance_type):
+        state = getattr(instance, '_state', None)
+        if state is None:
+            return super().__get__(instance, instance_type)
+        array, index, units = state
+        return float(array[index]) * units
+
+    def __set__(self, instance, value):
+        state = getattr(instance, '_state', None)
+        if state is None:
+            return super().__set__(instance, value)
+        if value is None: return
+        bs_validation.raise_if_not(value, self.units)
+        array, index, units = state
+        array[index] = bs_validation.get_base_magnitude(value)
+        instance._quantified = True
+
+
 class ImmutableDescriptor:
     """Check that an attribute is immutable.
 
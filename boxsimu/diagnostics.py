@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Diagnostics of the mass conservation limiters of the solver.
+
+If the sinks of a box would remove more fluid (or variable) mass than
+available, the solver reduces these sinks iteratively by a factor
+(f_flow for the fluid, f_var for the variables). The LimiterLog records
+how many iterations were needed in every timestep and, sparsely, which
+boxes and variables were limited by which factor. Frequent or strong
+limitation indicates a too large timestep (or a problem of the model).
+
+"""
+
+import numpy as np
+
+
+class LimiterLog:
+    """Sparse log of the limiter activity of a simulation.
+
+    Args:
+        system (BoxModelSystem): System that is simulated.
+        N_timesteps (int): Number of timesteps of the simulation.
+
+    Attributes:
+        fluid_iterations (numpy 1D array of int): Number of limiter
+            iterations of the fluid mass flows in every timestep (0 if
+            no box had to be limited).
+        variable_iterations (numpy 1D array of int): Number of limiter
+            iterations of the variable changes in every timestep.
+        fluid_factors (list of tuple): (timestep, box id, f_flow) of every
+            limited box.
+        variable_factors (list of tuple): (timestep, box id, variable id,
+            f_var) of every limited variable.
+
+    """
+
+    def __init__(self, system, N_timesteps):
+        self.box_names = tuple(system.box_names)
+        self.variable_names = tuple(system.variable_names)
+        self.fluid_iterations = np.zeros(N_timesteps, dtype=int)
+        self.variable_iterations = np.zeros(N_timesteps, dtype=int)
+        self.fluid_factors = []
+        self.variable_factors = []
+
+    def record(self, timestep, fluid_iterations, f_flow,
+            variable_iterations, f_var):
+        """Record the limiter activity of one timestep.
+
+        Args:
+            timestep (int): Index of the timestep.
+            fluid_iterations (int): Iterations of the fluid limiter.
+            f_flow (numpy 1D array): Final reduction factors of the
+                fluid sinks of every box.
+            variable_iterations (int): Iterations of the variable limiter.
+            f_var (numpy 2D array): Final reduction factors of the
+                variable sinks of every box (rows) and variable (columns).
+
+        """
+        self.fluid_iterations[timestep] = fluid_iterations
+        self.variable_iterations[timestep] = variable_iterations
+        if fluid_iterations:
+            for box_id in np.flatnonzero(f_flow < 1):
+                self.fluid_factors.append(
+                        (timestep, int(box_id), float(f_flow[box_id])))
+        if variable_iterations:
+            for box_id, var_id in zip(*np.nonzero(f_var < 1)):
+                self.variable_factors.append((timestep, int(box_id),
+                    int(var_id), float(f_var[box_id, var_id])))
+
+    @property
+    def limited_timesteps(self):
+        """Return the indices of all timesteps in which a limiter acted."""
+        return np.flatnonzero(
+                (self.fluid_iterations > 0) | (self.variable_iterations > 0))
+
+    def get_fluid_dataframe(self):
+        """Return the f_flow of all limited boxes (one row per record)."""
+        import pandas as pd
+        return pd.DataFrame(
+                [(step, self.box_names[box_id], f)
+                    for step, box_id, f in self.fluid_factors],
+                columns=['timestep', 'box', 'f_flow'])
+
+    def get_variable_dataframe(self):
+        """Return the f_var of all limited variables (one row per record)."""
+        import pandas as pd
+        return pd.DataFrame(
+                [(step, self.box_names[box_id], self.variable_names[var_id],
+                    f) for step, box_id, var_id, f in self.variable_factors],
+                columns=['timestep', 'box', 'variable', 'f_var'])
+
+    def __str__(self):
+        N_timesteps = len(self.fluid_iterations)
+        return ('Limiter active in {} of {} timesteps (max. iterations: '
+                'fluid {}, variables {}).'.format(
+                    len(self.limited_timesteps), N_timesteps,
+                    self.fluid_iterations.max(initial=0),
+                    self.variable_iterations.max(initial=0)))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Visual downsampling of long time series for plotting.
+
+A plot cannot show more points than it has pixels; passing millions of
+points to matplotlib only makes plotting slow and figures large. The
+series are therefore reduced to a point budget before plotting:
+
+    - minmax: The series is split into buckets of equal numbers of points;
+      the minimum and the maximum of every bucket are kept (in their
+      original order). Spikes are never lost, the envelope of the series
+      is exact.
+    - lttb: Largest-Triangle-Three-Buckets (Steinarsson, 2013). One point
+      per bucket is kept, the one that forms the largest triangle with
+      the point kept in the previous bucket and the mean of the next
+      bucket. Preserves the visual shape of the series well.
+
+"""
+
+import numpy as np
+
+
+METHODS = ('minmax', 'lttb')
+# Smallest point budget of every method
+MIN_POINTS = {'minmax': 2, 'lttb': 3}
+
+
+def _check_budget(N_out, method):
+    if N_out < MIN_POINTS[method]:
+        raise ValueError('{} needs a budget of at least {} points, not '
+                '{}'.format(method, MIN_POINTS[method], N_out))
+
+
+def _get_bucket_edges(N, N_buckets, first=0):
+    return np.linspace(first, N, N_buckets+1).astype(int)
+
+
+def minmax(x, y, N_out):
+    """Return the minimum and maximum of N_out/2 buckets of (x, y).
+
+    NaN values are ignored, unless all values of a bucket are NaN.
+    Raises a ValueError if N_out < 2.
+
+    """
+    _check_budget(N_out, 'minmax')
+    N = len(y)
+    N_buckets = N_out // 2
+    edges = _get_bucket_edges(N, N_buckets)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Pad all buckets to the same size to find argmin/argmax at once
+    indices = starts[:, None] + np.arange((ends - starts).max())[None, :]
+    valid = indices < ends[:, None]
+    indices = np.minimum(indices, N-1)
+    values = y[indices]
+    is_nan = np.isnan(values)
+    argmin = np.where(valid & ~is_nan, values, np.inf).argmin(axis=1)
+    argmax = np.where(valid & ~is_nan, values, -np.inf).argmax(axis=1)
+
+    rows = np.arange(N_buckets)
+    selected = np.stack([indices[rows, argmin], indices[rows, argmax]],
+            axis=1)
+    selected.sort(axis=1)
+    selected = selected.ravel()
+    # Keep a point only once if the minimum is also the maximum
+    selected = selected[np.append(True, np.diff(selected) != 0)]
+    return x[selected], y[selected]
+
+
+def lttb(x, y, N_out):
+    """Return N_out points of (x, y) by Largest-Triangle-Three-Buckets.
+
+    Raises a ValueError if N_out < 3.
+
+    """
+    _check_budget(N_out, 'lttb')
+    N = len(y)
+    # The first and the last point are always kept; the points in
+    # between are split into N_out-2 buckets.
+    edges = _get_bucket_edges(N-1, N_out-2, first=1)
+    starts, ends = edges[:-1], edges[1:]
+    x_mean = np.add.reduceat(x[1:N-1], starts-1) / (ends - starts)
+    y_mean = np.add.reduceat(y[1:N-1], starts-1) / (ends - starts)
+    x_mean = np.append(x_mean, x[-1])
+    y_mean = np.append(y_mean, y[-1])
+
+    selected = np.empty(N_out, dtype=int)
+    selected[0], selected[-1] = 0, N-1
+    previous = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        xa, ya = x[previous], y[previous]
+        xc, yc = x_mean[i+1], y_mean[i+1]
+        areas = np.abs((xa - xc) * (y[start:end] - ya) -
+                (xa - x[start:end]) * (yc - ya))
+        previous = start + int(np.nanargmax(areas)) if not np.all(
+                np.isnan(areas)) else start
+        selected[i+1] = previous
+    return x[selected], y[selected]
+
+
+def downsample(x, y, N_out, method='minmax'):
+    """Return at most N_out points of the series (x, y).
+
+    Args:
+        x (numpy 1D array): Sorted x values (e.g. time).
+        y (numpy 1D array): y values.
+        N_out (int): Point budget, at least MIN_POINTS[method]. If None
+            or len(x) <= N_out, the series is returned unchanged.
+        method (str): 'minmax' (default) or 'lttb' (see module doc).
+
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, not {}'.format(
+            METHODS, method))
+    if N_out is not None:
+        _check_budget(N_out, method)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if N_out is None or len(x) <= N_out:
+        return x, y
+    if method == 'minmax':
+        return minmax(x, y, N_out)
+    return lttb(x, y, N_out)
@@ -29,14 +29,15 @@ class BaseEntity:
             Must be a valid Python expression, meaning a valid 
             Python-variable name.
         description (str): Human readable string describing the entity.
-        mass (pint.Quantity [M]): Mass of the entity.
+        mass (pint.Quantity [M]): Mass of the entity. If the entity
+            belongs to a BoxModelSystem, the mass is a view of an element
+            of the state array of the system (see bind_state).
         molar_mass (pint.Quantity [M/N]): Molar mass of the variable.
 
     """
 
     name = bs_descriptors.ImmutableIdentifierDescriptor('name')
-    mass = bs_descriptors.QuantifiedPintQuantityDescriptor(
-            'mass', ur.kg, 0*ur.kg)
+    mass = bs_descriptors.StateMassDescriptor('mass', ur.kg, 0*ur.kg)
     molar_mass = bs_descriptors.PintQuantityDescriptor(
             'molar_mass', ur.kg/ur.mole, 0*ur.kg/ur.mole)
 
@@ -44,8 +45,7 @@ class BaseEntity:
         self.name = name
         self.molar_mass = molar_mass
         self._quantified = False
-        if not description:
-            self.description = name
+        self.description = description or name
 
     def __hash__(self):
         return hash(self.name)
@@ -86,11 +86,54 @@ class BaseEntity:
     def quantified(self):
         return self._quantified
 
+    @property
+    def mass_magnitude(self):
+        """Return the mass of the entity as a float [kg]."""
+        state = getattr(self, '_state', None)
+        if state is None:
+            return bs_validation.get_base_magnitude(self.mass)
+        array, index, units = state
+        return float(array[index])
+
+    @property
+    def is_bound(self):
+        """True if the mass is stored in the state array of a system."""
+        return getattr(self, '_state', None) is not None
+
+    def bind_state(self, state, index):
+        """Store the mass of the entity in the state array of a system.
+
+        The current mass is written to state[index]. Afterwards, the mass
+        attribute reads from and writes to this element. The state array
+        must therefore only be modified in-place.
+
+        Args:
+            state (numpy ndarray): State array of a BoxModelSystem [kg].
+            index (tuple of int): Index of the element of the entity.
+
+        """
+        mass = bs_validation.to_base_units(self.mass)
+        state[index] = mass.magnitude
+        self._state = (state, index, mass.units)
+
+    def unbind_state(self):
+        """Store the mass on the entity again (see bind_state)."""
+        if self.is_bound:
+            mass = self.mass
+            self._state = None
+            self.mass = mass
+
     def q(self, value):
-        """Returns a 'quantified' deepcopy of the current instance."""
+        """Returns a 'quantified' copy of the current instance.
+
+        The copy is shallow: all attributes except the mass are immutable
+        or user-defined functions that can be shared.
+
+        """
         # value can be a pint.Quantity of units mole or kg
         bs_validation.raise_if_not(value, ur.kg, ur.mole)
-        self_copy = copy.deepcopy(self)
+        self_copy = copy.copy(self)
+        self_copy.unbind_state()
 
         if bs_validation.is_mass(value):
             self_copy.mass = value
@@ -131,7 +174,7 @@ class Fluid(BaseEntity):
     def get_volume(self, time, context, system):
         """Return the volume of the Fluid."""
         rho = self.rho(time, context, system)
-        return (self.mass / rho).to_base_units()
+        return bs_validation.to_base_units(self.mass / rho)
 
 
 class Variable(BaseEntity):
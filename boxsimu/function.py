@@ -16,11 +16,22 @@ with three parameters/arguments:
     condition (Condition): Condition of the Box/Flow/Flux.
     system (BoxModelSystem): System that is solved. Allowes the user
         to access all Variables in all Boxes of the system.
+
+Instead of a Python function, a user-defined function can also be given
+as an Expression (a string that is compiled once). Expressions, unlike
+lambdas and closures, can be pickled cheaply and saved in model files
+(see model.py).
 """
 
+import ast
+import math
+import types
+
+import numpy as np
 import pint
 
 from . import validation as bs_validation
+from . import ur
 
 
 class BaseUserFunction:
@@ -35,7 +46,7 @@ class BaseUserFunction:
     def __init__(self, expression):
         if not callable(expression):
             bs_validation.raise_if_not_pint_quantity(expression)
-            self.expression = expression.to_base_units()
+            self.expression = bs_validation.to_base_units(expression)
             self.dimensionality_verified = True
             self.call_func = self.static_call
             self.is_static = True
@@ -64,11 +75,15 @@ class UserFunction:
 
     """
 
+    # CallStatistics if profiling is enabled (see UserFunctionProfiler)
+    profile = None
+
     def __init__(self, expression, units):
         self.units = units
+        self.declared_inputs = None
         if not callable(expression):
             bs_validation.raise_if_not(expression, units)
-            self.expression = expression.to_base_units()
+            self.expression = bs_validation.to_base_units(expression)
             self.dimensionality_verified = True
             self.call_func = self.static_call
             self.is_static = True
@@ -80,6 +95,23 @@ class UserFunction:
             self.is_static = False
             self.is_dynamic = True
             
+    def declare_inputs(self, *inputs):
+        """Declare the inputs of a dynamic UserFunction.
+
+        Declared inputs replace the tracing of the function (see
+        DependencyGraph). An input is one of the following strings:
+            'time': The function depends on the time.
+            '<variable>': Mass of a Variable of the box the function
+                is evaluated in (e.g. 'po4').
+            '<box>.<variable>': Mass of a Variable of a specific box
+                (e.g. 'upper_ocean.phyto').
+            '<box>.fluid': Fluid mass of a specific box.
+        Condition parameters are constant and need not be declared.
+
+        """
+        self.declared_inputs = list(inputs)
+        return self
+
     def static_call(self, *args):
         """Call method for static UserFunction."""
         return self.expression
@@ -90,9 +122,9 @@ class UserFunction:
         if not self.dimensionality_verified:
             bs_validation.raise_if_not(expression, self.units)
             self.dimensionality_verified = True
-        return expression.to_base_units()
+        return bs_validation.to_base_units(expression)
     
-    def __call__(self, *args):
+    def __call__(self, time, context, system):
         """UserFunction is called with args: time, context, system.
         
         A UserFunction instance is called from an instance of the class 
@@ -103,8 +135,135 @@ class UserFunction:
             context (AttrDict): Condition and Variables of the Box/Flow/Flux.
             system (BoxModelSystem): System that is solved. Allows the user
                 to access all Variables in all Boxes of the system.
+                If incremental evaluation is enabled for the system, a
+                dynamic function is called through its evaluator.
             
         """
-        return self.call_func(*args)
+        call_func = self.call_func
+        args = (time, context, system)
+        if self.is_dynamic:
+            evaluator = getattr(system, 'incremental_evaluator', None)
+            if evaluator is not None:
+                call_func = evaluator.call
+                args = (self,) + args
+        if self.profile is not None:
+            return self.profile.call(call_func, *args)
+        return call_func(*args)
+
+
+class _UnitNamespace:
+    """Read-only access to the units of the unit registry (e.g. ur.kg).
+
+    Methods of the registry (e.g. load_definitions) are not accessible.
+
+    """
+
+    def __getattr__(self, name):
+        units = getattr(ur, name)
+        if not isinstance(units, ur.Unit):
+            raise AttributeError('{} is not a unit'.format(name))
+        return units
+
+
+# Names that can be used in Expressions
+_EXPRESSION_NAMESPACE = {
+    'ur': _UnitNamespace(),
+    'np': types.SimpleNamespace(**{name: getattr(np, name) for name in (
+        'abs', 'arctan', 'ceil', 'clip', 'cos', 'e', 'exp', 'floor',
+        'heaviside', 'inf', 'log', 'log10', 'maximum', 'minimum', 'nan',
+        'pi', 'power', 'sign', 'sin', 'sqrt', 'tan', 'tanh', 'where')}),
+    'math': math,
+    'abs': abs, 'float': float, 'int': int, 'len': len, 'max': max,
+    'min': min, 'pow': pow, 'round': round, 'sum': sum,
+}
+_EXPRESSION_ARGUMENTS = ('t', 'c', 's')
+
+
+def _check_expression(source):
+    """Raise ValueError if source uses names that are not allowed.
+
+    Only the arguments (t, c, s), the names of _EXPRESSION_NAMESPACE and
+    names bound within the expression (comprehensions) can be used.
+    Attributes and names starting with an underscore (e.g. __class__)
+    are rejected, such that no other objects can be reached.
+
+    """
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as error:
+        raise ValueError('Invalid expression {!r}: {}'.format(source,
+            error.msg))
+    bound = {node.id for node in ast.walk(tree) if isinstance(node,
+        ast.Name) and isinstance(node.ctx, ast.Store)}
+    allowed = set(_EXPRESSION_NAMESPACE) | set(_EXPRESSION_ARGUMENTS)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            name = node.id
+            is_allowed = name in allowed or name in bound
+        elif isinstance(node, ast.Attribute):
+            name = node.attr
+            is_allowed = True
+        elif isinstance(node, ast.Lambda):
+            raise ValueError('Invalid expression {!r}: lambdas are not '
+                    'allowed.'.format(source))
+        else:
+            continue
+        if not is_allowed or name.startswith('_'):
+            raise ValueError('Invalid expression {!r}: name {!r} is not '
+                    'allowed.'.format(source, name))
+
+
+class Expression:
+    """User-defined function given as a Python expression.
+
+    The expression is evaluated with the three arguments of user-defined
+    functions: t (time), c (context) and s (system). The units of the
+    unit registry (ur), common numpy functions (np), math, and the
+    builtins abs, float, int, len, max, min, pow, round and sum can be
+    used. E.g.:
+        Process('po4_decay', po4, Expression('-c.po4 * 0.1 / ur.year'))
+
+    Other names (e.g. __import__) and names starting with an underscore
+    are rejected. Note: Expressions can still call public methods of the
+    context and system objects; they are not a sandbox for untrusted
+    code.
+
+    Args:
+        source (str): Python expression.
+
+    Attributes:
+        source (str): Python expression.
+
+    Raises:
+        ValueError: If source is not a valid expression or uses names
+            that are not allowed.
+
+    """
+
+    # Compiled functions of all sources (models contain many rates with
+    # the same expression)
+    _functions = {}
+
+    def __init__(self, source):
+        self.source = source
+        if source not in self._functions:
+            _check_expression(source)
+            namespace = dict(_EXPRESSION_NAMESPACE, __builtins__={})
+            self._functions[source] = eval('lambda {}: ({})'.format(
+                ', '.join(_EXPRESSION_ARGUMENTS), source), namespace)
+        self._function = self._functions[source]
+
+    def __call__(self, t, c, s):
+        return self._function(t, c, s)
+
+    def __reduce__(self):
+        return (self.__class__, (self.source,))
+
+    def __repr__(self):
+        return 'Expression({!r})'.format(self.source)
 
+    def __eq__(self, other):
+        return isinstance(other, Expression) and self.source == other.source
 
+    def __hash__(self):
+        return hash(self.source)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental (dirty-tracking) evaluation of user-defined rates.
+
+A user-defined rate only has to be re-evaluated if one of its inputs
+changed since its last evaluation. The inputs of every rate are known
+from the DependencyGraph of the system (by tracing or declaration). The
+IncrementalEvaluator of a system keeps one cache entry per node of the
+graph, i.e. per UserFunction and context it is evaluated with. If a
+system has an evaluator (BoxModelSystem.incremental_evaluator), every
+call of a dynamic UserFunction with this system is routed through the
+evaluator, which compares the current values of the inputs with these
+of the last evaluation. If no input changed by more than the given
+tolerance, the last value is returned without calling the user-defined
+function.
+
+A trace only records the inputs read in one evaluation: a rate that
+branches (e.g. on the time or on a mass) may read other inputs later.
+Therefore every evaluation of a traced rate is traced again and newly
+read inputs are added to the inputs of its cache entry. Rates whose
+inputs cannot be traced completely (see tracing.py) are evaluated on
+every call.
+
+UserFunctions themselves are not modified: clones of a system share
+their UserFunctions but each clone has its own evaluator and contexts.
+
+"""
+
+import numpy as np
+
+from . import tracing as bs_tracing
+from . import validation as bs_validation
+
+
+class _CacheEntry:
+    """Last value and inputs of one UserFunction in one context.
+
+    Attributes:
+        scope (str): Name of the box or transport that owns the context.
+        box (Box): Box of the context (None for transports).
+        masses (set of tuple): State entries (box_id, column) read by
+            the function.
+        indices (numpy 1D array): Flat state indices of masses.
+        depends_on_time (bool): True if the function reads the time.
+        traced (bool): True if evaluations are traced (neither declared
+            nor incomplete inputs).
+
+    """
+
+    def __init__(self, state, scope, box, traced):
+        self.state = state
+        self.scope = scope
+        self.box = box
+        self.traced = traced
+        self.masses = set()
+        self.indices = np.array([], dtype=int)
+        self.depends_on_time = False
+        self.input_values = None
+        self.time_magnitude = None
+        self.value = None
+
+    def get_input_values(self):
+        return self.state.take(self.indices)
+
+
+class IncrementalEvaluator:
+    """Re-evaluate user-defined rates only if their inputs changed.
+
+    Args:
+        system (BoxModelSystem): System whose dynamic rates are cached.
+        rtol (float): Relative tolerance of the input comparison.
+        atol (float): Absolute tolerance [kg] of the input comparison.
+
+    Attributes:
+        evaluations (int): Number of calls of user-defined functions.
+        hits (int): Number of calls served from the cache.
+
+    """
+
+    def __init__(self, system, rtol=0.0, atol=0.0):
+        self.system = system
+        self.rtol = rtol
+        self.atol = atol
+        self.evaluations = 0
+        self.hits = 0
+        # Entries are keyed by the UserFunction and the context of a node;
+        # both are held by the keys and can therefore not be reused
+        self._entries = {}
+
+        graph = system.get_dependency_graph()
+        for node in graph.nodes:
+            user_function = node.user_function
+            if user_function.is_static:
+                continue
+            scope = node.box.name if node.box else node.owner.name
+            entry = _CacheEntry(system.state, scope, node.box,
+                    traced=user_function.declared_inputs is None)
+            self._add_inputs(entry, node.inputs)
+            self._entries[(user_function, node.context)] = entry
+
+    def _add_inputs(self, entry, inputs):
+        """Add the inputs recorded by an AccessRecorder to entry."""
+        system = self.system
+        if inputs.complete:
+            masses = entry.masses | inputs.masses
+            entry.depends_on_time = entry.depends_on_time or inputs.time
+        else:
+            masses = {(box.id, bs_tracing.get_state_column(variable))
+                    for box in system.box_list
+                    for variable in (None,) + system.variable_list}
+            entry.depends_on_time = True
+            entry.traced = False
+        if masses == entry.masses:
+            return
+
+        # Masses are read as flat indices of the state array of the system
+        entry.masses = masses
+        entry.indices = np.array([np.ravel_multi_index(mass,
+            system.state.shape) for mass in sorted(masses)], dtype=int)
+
+    def _evaluate(self, entry, user_function, time, context, system):
+        """Evaluate user_function and add the inputs it read to entry."""
+        if not entry.traced:
+            return user_function.dynamic_call(time, context, system)
+        recorder = bs_tracing.AccessRecorder()
+        try:
+            value = user_function.dynamic_call(
+                    bs_tracing.get_traced_time(time, recorder),
+                    bs_tracing.TracedContext(context, recorder, entry.scope,
+                        entry.box),
+                    bs_tracing.TracedSystem(system, recorder))
+        except Exception:
+            # Raises again if the error is not caused by the tracing
+            value = user_function.dynamic_call(time, context, system)
+            recorder.complete = False
+        self._add_inputs(entry, recorder)
+        return value
+
+    def reset(self):
+        """Forget all cached values."""
+        for entry in self._entries.values():
+            entry.input_values = None
+            entry.value = None
+
+    def call(self, user_function, time, context, system):
+        """Return the cached value or evaluate user_function.
+
+        Calls with a context that is not part of the DependencyGraph of
+        the system (e.g. traced contexts) are not cached.
+
+        """
+        entry = self._entries.get((user_function, context))
+        if entry is None:
+            self.evaluations += 1
+            return user_function.dynamic_call(time, context, system)
+
+        input_values = entry.get_input_values()
+        time_magnitude = bs_validation.get_base_magnitude(time)
+        if entry.value is not None and self._is_clean(entry, input_values,
+                time_magnitude):
+            self.hits += 1
+            return entry.value
+
+        self.evaluations += 1
+        entry.value = self._evaluate(entry, user_function, time, context,
+                system)
+        # The inputs may have changed during the evaluation
+        entry.input_values = entry.get_input_values()
+        entry.time_magnitude = time_magnitude
+        return entry.value
+
+    def _is_clean(self, entry, input_values, time_magnitude):
+        """True if no input changed beyond the tolerance."""
+        if entry.depends_on_time and time_magnitude != entry.time_magnitude:
+            return False
+        delta = np.abs(input_values - entry.input_values)
+        tolerance = self.atol + self.rtol * np.abs(entry.input_values)
+        return bool(np.all(delta <= tolerance))
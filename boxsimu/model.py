@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative model format of BoxModelSystems.
+
+A model is a JSON document that describes a BoxModelSystem without
+pickling any Python objects (in contrast to dill, which pickles lambdas
+and closures):
+
+    {"format": "boxsimu-model", "version": 1, "name": "lake",
+     "global_condition": {"T": 293},
+     "fluids": {"water": {"rho": 1000}},
+     "variables": {"po4": {"molar_mass": {"magnitude": 30.97,
+                                         "units": "gram / mole"}}},
+     "processes": {"decay": {"variable": "po4",
+                             "rate": {"expression": "-c.po4 / ur.year"}}},
+     "reactions": {"uptake": {"coefficients": {"po4": -1, "phyto": 1},
+                              "rate": {"function": "lake.rates:uptake"}}},
+     "boxes": {"epilimnion": {"description": "Epilimnion",
+                              "fluid": "water", "fluid_mass": 1e9,
+                              "variables": {"po4": 3.5},
+                              "processes": ["decay"],
+                              "reactions": ["uptake"],
+                              "condition": {"depth": 5}}},
+     "flows": [{"name": "inflow", "source": null, "target": "epilimnion",
+                "rate": 1e3, "concentrations": {"po4": 1e-6}}],
+     "fluxes": [{"name": "sedimentation", "source": "epilimnion",
+                 "target": null, "variable": "po4", "rate": 0.1}]}
+
+Quantities are either plain numbers in SI base units (masses in kg,
+rates in kg/s, densities in kg/m^3, concentrations in kg/kg) or dicts
+{"magnitude": ..., "units": "..."}. Dynamic rates (and densities,
+mobilities and fixed concentrations) are given either as the importable
+name of a function {"function": "package.module:name"} or as an
+expression {"expression": "..."} (see function.Expression). The declared
+inputs of a rate (see UserFunction.declare_inputs) are stored next to
+the function: {"expression": "...", "inputs": ["po4"]}.
+
+Security: A model file is code. Functions are only imported from the
+modules given as allowed_modules to the loader (importing a module runs
+its code), and Expressions are restricted to a few names, but they are
+evaluated with access to the system. Only load models from trusted
+sources.
+
+Processes and reactions are defined once and referenced by name from
+the boxes. The loader creates every entity, process, reaction, expression
+and unit only once, so even models with thousands of boxes are
+constructed quickly.
+
+"""
+
+import json
+import functools
+import importlib
+
+import numpy as np
+import pint
+
+from . import box as bs_box
+from . import condition as bs_condition
+from . import entities as bs_entities
+from . import function as bs_function
+from . import process as bs_process
+from . import system as bs_system
+from . import transport as bs_transport
+from . import ur
+
+
+FORMAT = 'boxsimu-model'
+VERSION = 1
+
+# Units of quantities given as plain numbers
+MASS_UNITS = ur.kg
+RATE_UNITS = ur.kg / ur.second
+DENSITY_UNITS = ur.kg / ur.meter**3
+CONCENTRATION_UNITS = ur.kg / ur.kg
+MOLAR_MASS_UNITS = ur.kg / ur.mole
+
+
+# SAVING
+
+def _dump_magnitude(magnitude):
+    if isinstance(magnitude, np.ndarray):
+        return magnitude.tolist()
+    if isinstance(magnitude, np.generic):
+        return magnitude.item()
+    return magnitude
+
+
+def _dump_quantity(quantity):
+    return {'magnitude': _dump_magnitude(quantity.magnitude),
+            'units': str(quantity.units)}
+
+
+def _dump_value(value, owner):
+    """Return a constant (e.g. of a condition) as a JSON value."""
+    if isinstance(value, pint.quantity._Quantity):
+        return _dump_quantity(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_dump_value(v, owner) for v in value]
+    if isinstance(value, dict):
+        return {k: _dump_value(v, owner) for k, v in value.items()}
+    raise ValueError('{} cannot be saved: value {!r} is not a quantity, '
+            'number or string.'.format(owner, value))
+
+
+def _dump_condition(condition, owner):
+    return {key: _dump_value(value, '{}.{}'.format(owner, key))
+            for key, value in condition.items()}
+
+
+def _dump_callable(function, owner):
+    """Return a reference to an expression or an importable function."""
+    if isinstance(function, bs_function.Expression):
+        return {'expression': function.source}
+    module = getattr(function, '__module__', None)
+    qualname = getattr(function, '__qualname__', None)
+    if not module or not qualname or '<' in qualname:
+        raise ValueError('{} cannot be saved: lambdas, closures and '
+                'callable objects cannot be imported. Use an Expression '
+                'or a module-level function instead.'.format(owner))
+    return {'function': '{}:{}'.format(module, qualname)}
+
+
+def _dump_user_function(user_function, owner):
+    """Return a static (base units) or dynamic UserFunction."""
+    if user_function.is_static:
+        return _dump_magnitude(user_function.expression.magnitude)
+    spec = _dump_callable(user_function.expression, owner)
+    if user_function.declared_inputs is not None:
+        spec['inputs'] = list(user_function.declared_inputs)
+    return spec
+
+
+def _get_description(instance):
+    description = getattr(instance, 'description', None)
+    if description and description != instance.name:
+        return description
+
+
+def _dump_fluid(fluid):
+    spec = {'rho': _dump_user_function(fluid.rho,
+        'Density of fluid {}'.format(fluid.name))}
+    if _get_description(fluid):
+        spec['description'] = fluid.description
+    return spec
+
+
+def _dump_variable(variable):
+    spec = {}
+    if variable.molar_mass is not None:
+        spec['molar_mass'] = _dump_quantity(variable.molar_mass)
+    if callable(variable.mobility):
+        spec['mobility'] = _dump_callable(variable.mobility,
+                'Mobility of variable {}'.format(variable.name))
+    elif not variable.mobility:
+        spec['mobility'] = False
+    if _get_description(variable):
+        spec['description'] = variable.description
+    return spec
+
+
+def _dump_process(process):
+    spec = {'variable': process.variable.name,
+            'rate': _dump_user_function(process.rate,
+                'Rate of process {}'.format(process.name))}
+    if _get_description(process):
+        spec['description'] = process.description
+    return spec
+
+
+def _dump_reaction(reaction):
+    spec = {'coefficients': {variable.name: coefficient for variable,
+                coefficient in reaction.reaction_coefficients.items()},
+            'rate': _dump_user_function(reaction.rate,
+                'Rate of reaction {}'.format(reaction.name))}
+    if _get_description(reaction):
+        spec['description'] = reaction.description
+    return spec
+
+
+def _add_unique(specs, instance, dump, kind):
+    """Add the spec of a process/reaction shared by several boxes once."""
+    spec = dump(instance)
+    if specs.setdefault(instance.name, spec) != spec:
+        raise ValueError('{} {} is defined differently in several boxes; '
+                'names must be unique.'.format(kind, instance.name))
+
+
+def _dump_box(box):
+    spec = {'description': box.description}
+    if box.fluid is not None:
+        spec['fluid'] = box.fluid.name
+        spec['fluid_mass'] = box.fluid.mass_magnitude
+    masses = {name: variable.mass_magnitude
+            for name, variable in box.variables.items()}
+    # Variables without mass are added to every box by the system
+    masses = {name: mass for name, mass in masses.items() if mass != 0}
+    if masses:
+        spec['variables'] = masses
+    if box.processes:
+        spec['processes'] = [process.name for process in box.processes]
+    if box.reactions:
+        spec['reactions'] = [reaction.name for reaction in box.reactions]
+    if box.condition:
+        spec['condition'] = _dump_condition(box.condition,
+                'Condition of box {}'.format(box.name))
+    return spec
+
+
+def _dump_transport(transport, kind):
+    spec = {'name': transport.name,
+            'source': getattr(transport.source_box, 'name', None),
+            'target': getattr(transport.target_box, 'name', None)}
+    if kind == 'flux':
+        spec['variable'] = transport.variable.name
+    spec['rate'] = _dump_user_function(transport.rate,
+            'Rate of {} {}'.format(kind, transport.name))
+    if kind == 'flow':
+        if not transport.tracer_transport:
+            spec['tracer_transport'] = False
+        if transport.concentrations:
+            spec['concentrations'] = {variable.name: _dump_user_function(
+                concentration, 'Concentration of {} in flow {}'.format(
+                    variable.name, transport.name)) for variable,
+                concentration in transport.concentrations.items()}
+    if transport.condition:
+        spec['condition'] = _dump_condition(transport.condition,
+                'Condition of {} {}'.format(kind, transport.name))
+    return spec
+
+
+def to_dict(system):
+    """Return the model of system as a JSON-serializable dict.
+
+    Raises:
+        ValueError: If a rate (or another user-defined function) is a
+            lambda or closure, or a condition contains values that are
+            not quantities, numbers or strings.
+
+    """
+    fluids = {}
+    processes = {}
+    reactions = {}
+    boxes = {}
+    for box in system.box_list:
+        if box.fluid is not None:
+            _add_unique(fluids, box.fluid, _dump_fluid, 'Fluid')
+        for process in box.processes:
+            _add_unique(processes, process, _dump_process, 'Process')
+        for reaction in box.reactions:
+            _add_unique(reactions, reaction, _dump_reaction, 'Reaction')
+        boxes[box.name] = _dump_box(box)
+
+    model = {
+        'format': FORMAT,
+        'version': VERSION,
+        'name': system.name,
+        'global_condition': _dump_condition(system.global_condition,
+            'Global condition'),
+        'fluids': fluids,
+        'variables': {variable.name: _dump_variable(variable)
+            for variable in system.variable_list},
+        'processes': processes,
+        'reactions': reactions,
+        'boxes': boxes,
+        'flows': [_dump_transport(flow, 'flow') for flow in system.flows],
+        'fluxes': [_dump_transport(flux, 'flux') for flux in system.fluxes],
+    }
+    if _get_description(system):
+        model['description'] = system.description
+    return model
+
+
+def save(system, file_name, indent=None):
+    """Save the model of system as a JSON file (see to_dict)."""
+    model = to_dict(system)
+    with open(file_name, 'w', encoding='utf-8') as f:
+        json.dump(model, f, indent=indent)
+
+
+# LOADING
+
+@functools.lru_cache(maxsize=None)
+def _get_units(units):
+    return ur.Unit(units)
+
+
+def _is_allowed_module(module_name, allowed_modules):
+    return any(module_name == allowed or module_name.startswith(allowed +
+        '.') for allowed in allowed_modules)
+
+
+def _import_function(name, allowed_modules):
+    """Import a function 'module:qualname' of one of allowed_modules."""
+    module_name, _, qualname = name.partition(':')
+    if (not _is_allowed_module(module_name, allowed_modules) or
+            any(part.startswith('_') for part in qualname.split('.'))):
+        raise ValueError('Function {} cannot be loaded: module {} is not '
+                'in allowed_modules. Importing a module runs its code; only '
+                'allow modules you trust.'.format(name, module_name))
+    return _import_allowed_function(name)
+
+
+@functools.lru_cache(maxsize=None)
+def _import_allowed_function(name):
+    module_name, _, qualname = name.partition(':')
+    function = importlib.import_module(module_name)
+    for attribute in qualname.split('.'):
+        function = getattr(function, attribute)
+    return function
+
+
+def _is_quantity_spec(value):
+    return isinstance(value, dict) and set(value) == {'magnitude', 'units'}
+
+
+def _load_quantity(value, base_units):
+    """Return a quantity given as plain number in base units or dict."""
+    if _is_quantity_spec(value):
+        magnitude = value['magnitude']
+        if isinstance(magnitude, list):
+            magnitude = np.array(magnitude)
+        return ur.Quantity(magnitude, _get_units(value['units']))
+    if isinstance(value, list):
+        value = np.array(value)
+    return ur.Quantity(value, base_units)
+
+
+def _load_value(value):
+    """Return a constant saved by _dump_value."""
+    if _is_quantity_spec(value):
+        return _load_quantity(value, None)
+    if isinstance(value, list):
+        return [_load_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _load_value(v) for k, v in value.items()}
+    return value
+
+
+def _load_condition(spec):
+    return bs_condition.Condition({key: _load_value(value)
+        for key, value in (spec or {}).items()})
+
+
+def _load_callable(spec, allowed_modules):
+    if 'expression' in spec:
+        return bs_function.Expression(spec['expression'])
+    if 'function' in spec:
+        return _import_function(spec['function'], allowed_modules)
+    raise ValueError('Invalid function: {!r}'.format(spec))
+
+
+def _load_user_function(spec, base_units, allowed_modules):
+    """Return a quantity or a callable (argument of a UserFunction)."""
+    if isinstance(spec, dict) and not _is_quantity_spec(spec):
+        return _load_callable(spec, allowed_modules)
+    return _load_quantity(spec, base_units)
+
+
+def _declare_inputs(user_function, spec):
+    if isinstance(spec, dict) and 'inputs' in spec:
+        user_function.declare_inputs(*spec['inputs'])
+
+
+def _load_variable(name, spec, allowed_modules):
+    molar_mass = spec.get('molar_mass')
+    if molar_mass is not None:
+        molar_mass = _load_quantity(molar_mass, MOLAR_MASS_UNITS)
+    mobility = spec.get('mobility', True)
+    if isinstance(mobility, dict):
+        mobility = _load_callable(mobility, allowed_modules)
+    return bs_entities.Variable(name, molar_mass=molar_mass,
+            mobility=mobility, description=spec.get('description'))
+
+
+def _load_fluid(name, spec, allowed_modules):
+    fluid = bs_entities.Fluid(name, _load_user_function(spec['rho'],
+        DENSITY_UNITS, allowed_modules),
+        description=spec.get('description'))
+    _declare_inputs(fluid.rho, spec['rho'])
+    return fluid
+
+
+def _load_process(name, spec, variables, allowed_modules):
+    process = bs_process.Process(name, variables[spec['variable']],
+            _load_user_function(spec['rate'], RATE_UNITS, allowed_modules),
+            description=spec.get('description'))
+    _declare_inputs(process.rate, spec['rate'])
+    return process
+
+
+def _load_reaction(name, spec, variables, allowed_modules):
+    coefficients = {variables[variable_name]: coefficient for
+            variable_name, coefficient in spec['coefficients'].items()}
+    reaction = bs_process.Reaction(name, coefficients,
+            _load_user_function(spec['rate'], RATE_UNITS, allowed_modules),
+            description=spec.get('description'))
+    _declare_inputs(reaction.rate, spec['rate'])
+    return reaction
+
+
+def _load_box(name, spec, fluids, variables, processes, reactions):
+    fluid = None
+    if spec.get('fluid') is not None:
+        fluid = fluids[spec['fluid']].q(_load_quantity(
+            spec.get('fluid_mass', 0), MASS_UNITS))
+    box_variables = [variables[variable_name].q(
+        _load_quantity(mass, MASS_UNITS)) for variable_name, mass in
+        spec.get('variables', {}).items()]
+    return bs_box.Box(name, spec.get('description', name), fluid=fluid,
+            condition=_load_condition(spec.get('condition')),
+            variables=box_variables,
+            processes=[processes[process_name] for process_name in
+                spec.get('processes', [])],
+            reactions=[reactions[reaction_name] for reaction_name in
+                spec.get('reactions', [])])
+
+
+def _load_transport(spec, kind, boxes, variables, allowed_modules):
+    source = boxes[spec['source']] if spec.get('source') else None
+    target = boxes[spec['target']] if spec.get('target') else None
+    rate = _load_user_function(spec['rate'], RATE_UNITS, allowed_modules)
+    if kind == 'flow':
+        concentrations = {variables[variable_name]: _load_user_function(
+            concentration, CONCENTRATION_UNITS, allowed_modules) for
+            variable_name,
+            concentration in spec.get('concentrations', {}).items()}
+        transport = bs_transport.Flow(spec['name'], source, target, rate,
+                tracer_transport=spec.get('tracer_transport', True),
+                concentrations=concentrations)
+        for variable_name, concentration in spec.get('concentrations',
+                {}).items():
+            _declare_inputs(transport.concentrations[
+                variables[variable_name]], concentration)
+    else:
+        transport = bs_transport.Flux(spec['name'], source, target,
+                variables[spec['variable']], rate)
+    _declare_inputs(transport.rate, spec['rate'])
+    if spec.get('condition'):
+        transport.condition = _load_condition(spec['condition'])
+    return transport
+
+
+def from_dict(model, allowed_modules=()):
+    """Return the BoxModelSystem of a model (see to_dict).
+
+    Security: Expressions are restricted to a few names (see
+    function.Expression), but they are evaluated with access to the
+    system. Functions given by name are imported, which runs the code of
+    their module. Only load models from trusted sources.
+
+    Args:
+        model (dict): Model.
+        allowed_modules (iterable of str): Modules (and their submodules)
+            from which functions referenced by the model may be imported.
+            Default: () (no functions, only Expressions).
+
+    Raises:
+        ValueError: If the model is invalid or references a function of
+            a module that is not in allowed_modules.
+
+    """
+    if model.get('format') != FORMAT:
+        raise ValueError('Not a boxsimu model (format: {!r}).'.format(
+            model.get('format')))
+    if model.get('version', 0) > VERSION:
+        raise ValueError('Model version {} is not supported (newest '
+                'supported version: {}).'.format(model['version'], VERSION))
+
+    allowed_modules = tuple(allowed_modules)
+    variables = {name: _load_variable(name, spec, allowed_modules)
+            for name, spec in model.get('variables', {}).items()}
+    fluids = {name: _load_fluid(name, spec, allowed_modules)
+            for name, spec in model.get('fluids', {}).items()}
+    processes = {name: _load_process(name, spec, variables,
+            allowed_modules) for name, spec in
+            model.get('processes', {}).items()}
+    reactions = {name: _load_reaction(name, spec, variables,
+            allowed_modules) for name, spec in
+            model.get('reactions', {}).items()}
+    boxes = {name: _load_box(name, spec, fluids, variables, processes,
+                reactions) for name, spec in model['boxes'].items()}
+    flows = [_load_transport(spec, 'flow', boxes, variables,
+            allowed_modules) for spec in model.get('flows', [])]
+    fluxes = [_load_transport(spec, 'flux', boxes, variables,
+            allowed_modules) for spec in model.get('fluxes', [])]
+    return bs_system.BoxModelSystem(model['name'], list(boxes.values()),
+            global_condition=_load_condition(model.get('global_condition')),
+            flows=flows, fluxes=fluxes,
+            description=model.get('description'))
+
+
+def load(file_name, allowed_modules=()):
+    """Load a BoxModelSystem from a JSON model file (see save).
+
+    Only load model files from trusted sources (see from_dict).
+
+    """
+    with open(file_name, 'r', encoding='utf-8') as f:
+        return from_dict(json.load(f), allowed_modules)
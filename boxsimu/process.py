@@ -62,17 +62,14 @@ class Process(BaseProcess):
     """
 
     name = bs_descriptors.ImmutableIdentifierDescriptor('name')
-    rate = bs_descriptors.PintQuantityDescriptor('rate', 
-            ur.kg/ur.second, 0*ur.kg/ur.second)
 
     def __init__(self, name, variable, rate, description=None):
         self.name = name
         self.variable = variable
         self.rate = bs_function.UserFunction(rate, ur.kg/ur.second)
-        if not description:
-            self.description = name
+        self.description = description or name
 
-    def __call__(self, time, context):
+    def __call__(self, time, context, system):
         """Return rate of the process [M/T]."""
         return self.rate(time, context, system)
 
@@ -141,8 +138,7 @@ class Reaction(BaseProcess):
         for variable, coeff in reaction_coefficients.items():
             self.variables.append(variable)
         self.rate = bs_function.UserFunction(rate, ur.kg/ur.second)
-        if not description:
-            self.description = name
+        self.description = description or name
 
     def __call__(self, time, context, system, variables):
         """Return reaction rates of all variables [M/T].
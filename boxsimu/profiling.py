@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling of user-defined functions.
+
+The UserFunctionProfiler attaches a CallStatistics instance to every
+dynamic UserFunction of a system. UserFunction.__call__ then measures
+every call and records it under the entity that owns the function
+(Process, Reaction, Flow, Flux or Fluid). This identifies slow
+user-defined functions by name, which is not possible with cProfile
+(all lambdas are shown as '<lambda>').
+
+"""
+
+import time as time_module
+
+
+class CallStatistics:
+    """Number of calls, cumulative and maximum time of a UserFunction.
+
+    Args:
+        kind (str): Kind of the owner (e.g. 'process').
+        name (str): Name of the owner.
+        attribute (str): Attribute of the owner that holds the function
+            (e.g. 'rate').
+
+    """
+
+    def __init__(self, kind, name, attribute):
+        self.kind = kind
+        self.name = name
+        self.attribute = attribute
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def call(self, call_func, *args):
+        """Call call_func(*args) and record the elapsed time."""
+        start = time_module.perf_counter()
+        try:
+            return call_func(*args)
+        finally:
+            elapsed = time_module.perf_counter() - start
+            self.calls += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+
+
+class UserFunctionProfiler:
+    """Record calls of all dynamic UserFunctions of a system.
+
+    Args:
+        system (BoxModelSystem): System whose functions are profiled.
+
+    Attributes:
+        statistics (list of CallStatistics): Statistics of every profiled
+            UserFunction.
+
+    """
+
+    def __init__(self, system):
+        self.statistics = []
+        self._user_functions = []
+        for kind, owner, attribute, user_function in self._get_owners(
+                system):
+            if not user_function.is_dynamic:
+                continue
+            if any(user_function is uf for uf in self._user_functions):
+                continue
+            self._user_functions.append(user_function)
+            self.statistics.append(CallStatistics(kind, owner.name,
+                attribute))
+
+    def _get_owners(self, system):
+        """Yield kind, owner, attribute and UserFunction of all owners."""
+        for box in system.box_list:
+            if box.fluid:
+                yield 'fluid', box.fluid, 'rho', box.fluid.rho
+        for process in system.processes:
+            yield 'process', process, 'rate', process.rate
+        for reaction in system.reactions:
+            yield 'reaction', reaction, 'rate', reaction.rate
+        for flow in system.flows:
+            yield 'flow', flow, 'rate', flow.rate
+            for variable, concentration in flow.concentrations.items():
+                yield ('flow', flow, 'concentration of {}'.format(
+                    variable.name), concentration)
+        for flux in system.fluxes:
+            yield 'flux', flux, 'rate', flux.rate
+
+    def enable(self):
+        """Record all calls of the profiled UserFunctions."""
+        for user_function, statistics in zip(self._user_functions,
+                self.statistics):
+            user_function.profile = statistics
+
+    def disable(self):
+        """Stop recording calls."""
+        for user_function in self._user_functions:
+            user_function.profile = None
+
+    def reset(self):
+        """Set all statistics to zero."""
+        for statistics in self.statistics:
+            statistics.reset()
+
+    def get_dataframe(self):
+        """Return the statistics ranked by cumulative time."""
+        import pandas as pd
+        total = sum(s.total_time for s in self.statistics)
+        rows = [(s.kind, s.name, s.attribute, s.calls, s.total_time,
+            s.total_time / s.calls if s.calls else 0.0, s.max_time,
+            s.total_time / total if total else 0.0)
+            for s in self.statistics]
+        df = pd.DataFrame(rows, columns=['kind', 'name', 'attribute',
+            'calls', 'time [s]', 'mean [s]', 'max [s]', 'fraction'])
+        df = df.sort_values('time [s]', ascending=False)
+        return df.reset_index(drop=True)
+
+    def __str__(self):
+        lines = ['{:<10}{:<30}{:>10}{:>12}{:>12}{:>12}'.format(
+            'Kind', 'Name', 'calls', 'time [s]', 'mean [s]', 'max [s]')]
+        for row in self.get_dataframe().itertuples(index=False):
+            name = row.name if row.attribute in ('rate', 'rho') else \
+                    '{} ({})'.format(row.name, row.attribute)
+            lines.append('{:<10}{:<30}{:>10d}{:>12.4f}{:>12.2e}{:>12.2e}'
+                    .format(row.kind, name, row.calls, row[4], row[5],
+                        row[6]))
+        return '\n'.join(lines)
@@ -6,21 +6,21 @@ Created on Thu Jun 17 2017 at 12:07UTC
 
 """
 
+import os
 import copy
+import tempfile
 import time as time_module
 import numpy as np
-import dill as pickle
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
 from attrdict import AttrDict
 
 from . import box as bs_box
 from . import validation as bs_validation
 from . import descriptors as bs_descriptors
+from . import downsampling as bs_downsampling
 from . import entities as bs_entities
 from . import errors as bs_errors
 from . import process as bs_process
+from . import storage as bs_storage
 from . import system as bs_system
 from . import transport as bs_transport
 from . import utils as bs_utils
@@ -35,6 +35,14 @@ class Solution:
     Additionaly, the Solution class offers various plotting functions to
     visualize the result of the simulation
 
+    The time series of all boxes and quantities (fluid mass, volume and
+    the mass of every variable) are stored in the 3D array data. The
+    attribute df is a pandas.DataFrame view of this array.
+
+    A Solution saved with storage='memmap' (see save) is loaded lazily:
+    only the boxes, quantities and timesteps that are requested (see
+    get_values) are read from the file. Such a Solution has no system.
+
     Args:
         system (BoxModelSystem): System that is simulated.
         total_integration_time (pint.Quantity [T]): Total length of the simulation.
@@ -45,46 +53,201 @@ class Solution:
         dt (pint.Quantity): Integration timestep.
         time (list of pint.Quantity): List of all times at which the system
             was solved (at which a result is available).
-        system (BoxModelSystem): System which is simulated.
+        system (BoxModelSystem): System which is simulated (None if the
+            Solution was loaded from a solution file).
+        box_names (list of str): Names of all boxes.
+        quantities (list of str): Names of all quantities: 'mass' (of the
+            fluid), 'volume' and the names of all variables.
+        data (numpy 3D array): Values of all boxes, quantities and
+            timesteps (shape: N_boxes, N_quantities, N_timesteps). Masses
+            in kg, volumes in m^3.
+        df (pandas.DataFrame): View of data with one column per box and
+            quantity.
+        start_time (pint.Quantity): Time at the start of the simulation
+            (0 unless the Solution continues another one, see concat).
+        time_array (numpy 1D array): Time of every timestep (magnitudes
+            in time_units). The values of a timestep are the masses and
+            volumes at the end of the timestep.
         time_units (pint.Units): Units of Quantities within the time attribute.
         time_magnitude (float): Magnitudes of Quantities within the time
             attribute.
         ts (AttrDict of AttrDict): For every box, there
             exists one AttrDict which contains time series of all its
             quantities (Fluid mass, Variable mass...) and the box instance.
+        timings (PhaseTimer): Time spent in the phases of the solver (see
+            PhaseTimer.get_dataframe). None if not set by the solver.
+        user_function_profile (pandas.DataFrame): Calls and run time of
+            the user-defined functions, ranked by run time. None if
+            profiling was not enabled (see
+            BoxModelSystem.enable_profiling).
+        limiter_log (LimiterLog): Iterations and reduction factors of the
+            mass conservation limiters of the solver in every timestep.
+        default_max_points (int): Maximum number of points per time series
+            in plots; longer time series are downsampled (see
+            downsampling.py). None: Plot all points.
+        default_downsampling (str): Downsampling method of plots: 'minmax'
+            or 'lttb'.
 
     """
 
     total_integration_time = bs_descriptors.PintQuantityDescriptor(
             'total_integration_time', ur.second)
     dt = bs_descriptors.PintQuantityDescriptor('dt', ur.second)
+    start_time = bs_descriptors.PintQuantityDescriptor('start_time',
+            ur.second, 0*ur.second)
 
     def __init__(self, system, N_timesteps, dt):
         self.system = system
+        self.name = system.name
+        self.box_names = list(system.box_names)
+        self.quantities = ['mass', 'volume'] + list(system.variable_names)
         self.N_timesteps = N_timesteps
         self.dt = 1 * dt
+        self.start_time = 0 * dt
         self.total_integration_time = N_timesteps * dt
-        self.time_array = np.linspace(0, self.total_integration_time.magnitude,
-                num=self.N_timesteps)
+        self.time_array = self.dt.magnitude * np.arange(1, N_timesteps+1)
         self.time_units = self.dt.units
-
-        self._setup_solution_dataframe()
-
+        self._init_attributes()
+
+        self._data = np.full((len(self.box_names), len(self.quantities),
+            N_timesteps), np.nan)
+        self._setup_rates_dataframe()
+
+    def _init_attributes(self):
+        self.timings = None
+        self.user_function_profile = None
+        self.limiter_log = None
+        self._data = None
+        self._file = None
+        self._df = None
+        self.df_rates = None
         self.default_figsize = [7,4]
         self.default_yaxis_log = False
+        self.default_max_points = 4000
+        self.default_downsampling = 'minmax'
+        self._plot_cache = {}
 
-    def _setup_solution_dataframe(self):
-        """Setup Dataframe for timeseries of quantities (masses, volumes..)."""
-        quantities = ['mass', 'volume'] + self.system.variable_names
-        col_tuples = [(box, quant) for box in self.system.box_names
-                                   for quant in quantities]
+    @classmethod
+    def _from_arrays(cls, name, box_names, quantities, time_array, dt,
+            start_time, data=None, solution_file=None, system=None):
+        """Return a Solution of given axes and values (data or file)."""
+        solution = cls.__new__(cls)
+        solution._init_attributes()
+        solution.system = system
+        solution.name = name
+        solution.box_names = list(box_names)
+        solution.quantities = list(quantities)
+        solution.N_timesteps = len(time_array)
+        solution.dt = dt
+        solution.start_time = start_time
+        solution.total_integration_time = (ur.Quantity(time_array[-1] if
+            len(time_array) else 0, ur.second) - solution.start_time)
+        solution.time_array = time_array
+        solution.time_units = solution.start_time.units
+        solution._data = data
+        solution._file = solution_file
+        return solution
+
+    @classmethod
+    def concat(cls, solutions):
+        """Return one Solution of consecutive simulations of a system.
+
+        Every Solution after the first is assumed to continue the previous
+        one (e.g. a further call of solve or a restart from a checkpoint):
+        its time axis is shifted to start at the end of the previous
+        Solution. The values are copied block-wise into one new array.
+
+        Args:
+            solutions (list of Solution): Solutions of the same system
+                (same boxes and quantities), in chronological order.
+
+        Returns:
+            solution (Solution): Solution with all timesteps. dt is None
+                if the timesteps of the solutions differ; timings,
+                profiles and limiter logs are not kept.
+
+        """
+        solutions = list(solutions)
+        if not solutions:
+            raise ValueError('At least one Solution is required!')
+        first = solutions[0]
+        time_arrays = [np.asarray(first.time_array, dtype=float)]
+        end_time = first.start_time.magnitude
+        if len(first.time_array):
+            end_time = float(first.time_array[-1])
+        for solution in solutions[1:]:
+            if solution.box_names != first.box_names:
+                raise ValueError('Boxes of solution {} do not match: {} != '
+                        '{}'.format(solution.name, solution.box_names,
+                            first.box_names))
+            if solution.quantities != first.quantities:
+                raise ValueError('Quantities of solution {} do not match: '
+                        '{} != {}'.format(solution.name,
+                            solution.quantities, first.quantities))
+            shift = end_time - solution.start_time.magnitude
+            time_arrays.append(np.asarray(solution.time_array,
+                dtype=float) + shift)
+            if len(solution.time_array):
+                end_time = float(time_arrays[-1][-1])
+
+        dts = {solution.dt.magnitude if solution.dt is not None else None
+                for solution in solutions}
+        dt = first.dt if len(dts) == 1 else None
+        data = np.concatenate([solution.data for solution in solutions],
+                axis=2)
+        return cls._from_arrays(first.name, first.box_names,
+                first.quantities, np.concatenate(time_arrays), dt,
+                first.start_time, data=data, system=first.system)
+
+    def extend(self, *solutions):
+        """Append the timesteps of further Solutions (see concat)."""
+        solution = self.concat((self,) + solutions)
+        self.N_timesteps = solution.N_timesteps
+        # The descriptor ignores None (timesteps of different length)
+        self._dt = solution.dt
+        self.total_integration_time = solution.total_integration_time
+        self.time_array = solution.time_array
+        self._data = solution._data
+        self._file = None
+        self._df = None
+        self._plot_cache = {}
+        self.timings = None
+        self.user_function_profile = None
+        self.limiter_log = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            # Solution loaded from a file: read all values
+            self._data = self._file.read(range(len(self.box_names)),
+                    range(len(self.quantities)), slice(None))
+        return self._data
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self._get_dataframe()
+        return self._df
+
+    def _get_dataframe(self):
+        """Return a DataFrame view of data (one column per box/quantity)."""
+        import pandas as pd
+        col_tuples = [(box, quant) for box in self.box_names
+                                   for quant in self.quantities]
         index = pd.MultiIndex.from_tuples(col_tuples,
                 names=['Box', 'Quantity'])
-        self.df = pd.DataFrame(index=index).T
-        self.df.units = ur.kg
-        self.df.index.name = 'Timestep'
-
-        # Setup Dataframe for timeseries of rates (proecesses, flows..)
+        # pandas stores the values of a DataFrame as (columns, rows); the
+        # transposed reshape of data is therefore used without a copy.
+        values = self.data.reshape(len(col_tuples), -1).T
+        df = pd.DataFrame(values, index=range(self.N_timesteps),
+                columns=index, copy=False)
+        df.units = ur.kg
+        df.index.name = 'Timestep'
+        return df
+
+    def _setup_rates_dataframe(self):
+        """Setup Dataframe for timeseries of rates (proecesses, flows..)."""
+        import pandas as pd
         col_tuples = []
         for box_name, box in self.system.boxes.items():
             for variable_name, variable in self.system.variables.items():
@@ -130,25 +293,245 @@ class Solution:
         self.df_rates.units = ur.kg/ur.second
         self.df_rates.index.name = 'Starting Timestep'
 
+    def save_state(self, timestep, state, volumes):
+        """Save the masses and volumes of all boxes of one timestep.
+
+        Args:
+            timestep (int): Index of the timestep.
+            state (numpy 2D array): State array of the system [kg] (see
+                BoxModelSystem.state).
+            volumes (numpy 1D array): Volumes of all boxes [m^3].
+
+        """
+        self._data[:, 0, timestep] = state[:, 0]
+        self._data[:, 1, timestep] = volumes
+        self._data[:, 2:, timestep] = state[:, 1:]
+        if self._plot_cache:
+            self._plot_cache = {}
+
+    def _get_box_id(self, box):
+        return self.box_names.index(getattr(box, 'name', box))
+
+    def _get_quantity_id(self, quantity):
+        if isinstance(quantity, bs_entities.Fluid):
+            quantity = 'mass'
+        elif isinstance(quantity, bs_entities.Variable):
+            quantity = quantity.name
+        return self.quantities.index(quantity)
+
+    def get_values(self, boxes=None, quantities=None, timesteps=None):
+        """Return the values of some boxes, quantities and timesteps.
+
+        If the Solution was loaded from a solution file only the requested
+        values are read from the file.
+
+        Args:
+            boxes (list of Box or str): Boxes (or their names). Default:
+                All boxes.
+            quantities (list of str, Fluid or Variable): Quantities
+                ('mass', 'volume' or the name of a variable). A Fluid
+                stands for 'mass'. Default: All quantities.
+            timesteps (slice or numpy 1D array of int): Timesteps.
+                Default: All timesteps.
+
+        Returns:
+            values (numpy 3D array): Values with shape (number of boxes,
+                number of quantities, number of timesteps).
+
+        """
+        box_ids = list(range(len(self.box_names))) if boxes is None else [
+                self._get_box_id(box) for box in boxes]
+        quantity_ids = list(range(len(self.quantities))) if quantities is \
+                None else [self._get_quantity_id(q) for q in quantities]
+        if timesteps is None:
+            timesteps = slice(None)
+        if self._data is None:
+            return self._file.read(box_ids, quantity_ids, timesteps)
+        return self._data[box_ids][:, quantity_ids][:, :, timesteps]
+
+    def get_series(self, box, quantity, timesteps=None):
+        """Return the time series of one box and quantity (see get_values)."""
+        return self.get_values([box], [quantity], timesteps)[0, 0]
+
+    # TIME QUERIES
+
+    def _get_time_magnitude(self, times):
+        """Return times (pint.Quantity or magnitudes in time_units)."""
+        if hasattr(times, 'units'):
+            bs_validation.raise_if_not_time(times)
+            times = times.to(self.time_units).magnitude
+        return np.asarray(times, dtype=float)
+
+    def at(self, times, boxes=None, quantities=None):
+        """Return the values at arbitrary times (linear interpolation).
+
+        Args:
+            times (pint.Quantity [T] or numpy 1D array): Times (sorted or
+                not); magnitudes are interpreted in time_units.
+            boxes (list): Boxes (see get_values). Default: All boxes.
+            quantities (list): Quantities (see get_values). Default: All
+                quantities.
+
+        Returns:
+            values (numpy 3D array): Values with shape (number of boxes,
+                number of quantities, number of times). NaN for times
+                outside of time_array.
+
+        """
+        times = np.atleast_1d(self._get_time_magnitude(times))
+        time_array = np.asarray(self.time_array)
+        if len(time_array) > 1:
+            i1 = np.clip(np.searchsorted(time_array, times), 1,
+                    len(time_array)-1)
+            i0 = i1 - 1
+            weights = ((times - time_array[i0]) /
+                    (time_array[i1] - time_array[i0]))
+        else:
+            i0 = i1 = np.zeros(len(times), dtype=int)
+            weights = np.zeros(len(times))
+
+        # Only read the timesteps that are needed for the interpolation
+        timesteps = np.unique(np.concatenate([i0, i1]))
+        values = self.get_values(boxes, quantities, timesteps)
+        values0 = values[:, :, np.searchsorted(timesteps, i0)]
+        values1 = values[:, :, np.searchsorted(timesteps, i1)]
+        result = values0 + (values1 - values0) * weights
+        if len(time_array):
+            result[:, :, (times < time_array[0]) | (times > time_array[-1])
+                    | np.isnan(times)] = np.nan
+        return result
+
+    def window(self, t0=None, t1=None):
+        """Return a Solution with all timesteps within [t0, t1].
+
+        Args:
+            t0, t1 (pint.Quantity [T] or float): Start and end of the
+                window (magnitudes in time_units). Default: Start/end of
+                the Solution.
+
+        """
+        time_array = np.asarray(self.time_array)
+        start = 0 if t0 is None else int(np.searchsorted(time_array,
+            self._get_time_magnitude(t0), side='left'))
+        stop = len(time_array) if t1 is None else int(np.searchsorted(
+            time_array, self._get_time_magnitude(t1), side='right'))
+        stop = max(start, stop)
+        # The window starts at the end of the preceding timestep
+        start_time = (time_array[start-1] * self.time_units if start > 0
+                else self.start_time)
+        return self._from_arrays(self.name, self.box_names, self.quantities,
+                time_array[start:stop].copy(), self.dt, start_time,
+                data=self.get_values(timesteps=slice(start, stop)),
+                system=self.system)
+
+    RESAMPLE_METHODS = ('mean', 'min', 'max', 'first', 'last')
+
+    def resample(self, interval, how='mean'):
+        """Return a Solution with one timestep per interval.
+
+        The intervals start at start_time; the timesteps within
+        (start_time + k*interval, start_time + (k+1)*interval] are
+        reduced to one timestep at the end of the interval. Intervals
+        without timesteps are left out.
+
+        Args:
+            interval (pint.Quantity [T] or float): Length of the intervals.
+            how (str): Reduction: 'mean' (default), 'min', 'max', 'first'
+                or 'last'.
+
+        """
+        if how not in self.RESAMPLE_METHODS:
+            raise ValueError('how must be one of {}, not {}'.format(
+                self.RESAMPLE_METHODS, how))
+        interval_magnitude = float(self._get_time_magnitude(interval))
+        if interval_magnitude <= 0:
+            raise ValueError('The interval must be positive!')
+        start_time = self.start_time.to(self.time_units).magnitude
+        # Index of the interval of every timestep (with a tolerance for
+        # timesteps that end exactly at the end of an interval)
+        bins = np.ceil((np.asarray(self.time_array) - start_time) /
+                interval_magnitude - 1e-9).astype(int) - 1
+        starts = np.flatnonzero(np.diff(bins, prepend=bins[:1]-1))
+        ends = np.append(starts[1:], len(bins))
+
+        data = self.data
+        if not len(starts):
+            values = data[:, :, :0]
+        elif how == 'mean':
+            values = (np.add.reduceat(data, starts, axis=2) /
+                    (ends - starts))
+        elif how == 'min':
+            values = np.minimum.reduceat(data, starts, axis=2)
+        elif how == 'max':
+            values = np.maximum.reduceat(data, starts, axis=2)
+        elif how == 'first':
+            values = data[:, :, starts]
+        else:
+            values = data[:, :, ends-1]
+        time_array = start_time + (bins[starts] + 1) * interval_magnitude
+        return self._from_arrays(self.name, self.box_names, self.quantities,
+                time_array, interval_magnitude * self.time_units,
+                self.start_time, data=values, system=self.system)
+
     # VISUALIZATION
 
+    def _get_plot_series(self, box, quantity, concentration=False,
+            max_points=None, method=None):
+        """Return the (downsampled) time series of a plot: time, values.
+
+        The downsampled time series are cached; the cache is cleared
+        whenever the values change (see save_state and extend).
+
+        Args:
+            box (Box or str): Box (or its name).
+            quantity (str, Fluid or Variable): Quantity (see get_values).
+            concentration (bool): If True, return the concentration of
+                the quantity (mass of the quantity per fluid mass).
+            max_points (int): Point budget (default: default_max_points).
+            method (str): Downsampling method (default:
+                default_downsampling).
+
+        """
+        max_points = max_points or self.default_max_points
+        method = method or self.default_downsampling
+        box_name = self.box_names[self._get_box_id(box)]
+        quantity_name = self.quantities[self._get_quantity_id(quantity)]
+        key = (box_name, quantity_name, concentration, max_points, method)
+        if key not in self._plot_cache:
+            if concentration:
+                values = self.get_values([box_name], ['mass',
+                    quantity_name])[0]
+                masses = np.where(values[0] == 0, np.nan, values[0])
+                series = values[1] / masses
+            else:
+                series = self.get_series(box_name, quantity_name)
+            self._plot_cache[key] = bs_downsampling.downsample(
+                    self.time_array, series, max_points, method)
+        return self._plot_cache[key]
+
     def plot_masses(self, entity, boxes=None, figsize=None,
-            yaxis_log=False, **kwargs):
-        """Plot masses of a variable or fluid as a function of time."""
+            yaxis_log=False, max_points=None, downsampling=None, **kwargs):
+        """Plot masses of a variable or fluid as a function of time.
+
+        Time series longer than max_points (default: default_max_points)
+        are downsampled with the method downsampling (default:
+        default_downsampling); see downsampling.py.
+
+        """
         if not boxes:
-            boxes = self.system.box_list
-        fig, ax = self._gs(title='Mass of {}'.format(entity.name),
+            boxes = self.box_names
+        if not isinstance(entity, (bs_entities.Fluid, bs_entities.Variable,
+                str)):
+            raise bs_errors.must_be_fluid_or_variable_error
+        fig, ax = self._gs(title='Mass of {}'.format(
+                getattr(entity, 'name', entity)),
                 xlabel='xlabel', ylabel='ylabel', **kwargs)
 
         for box in boxes:
-            if isinstance(entity, bs_entities.Fluid):
-                masses = self.df[(box.name, 'mass')].tolist()
-            elif isinstance(entity, bs_entities.Variable):
-                masses = self.df[(box.name, entity.name)].tolist()
-            else:
-                raise bs_errors.must_be_fluid_or_variable_error
-            ax.plot(self.time_array, masses,
-                    label='Box {}'.format(box.name))
+            time, masses = self._get_plot_series(box, entity,
+                    max_points=max_points, method=downsampling)
+            ax.plot(time, masses,
+                    label='Box {}'.format(getattr(box, 'name', box)))
         ax.legend()
         return fig, ax
 
@@ -158,20 +541,24 @@ class Solution:
 
     def plot_variable_concentration(self, variable, boxes=None,
             figsize=None, yaxis_log=False, volumetric=False,
-            units=None, **kwargs):
-        """Plot concentration of a variable as a function of time."""
+            units=None, max_points=None, downsampling=None, **kwargs):
+        """Plot concentration of a variable as a function of time.
+
+        Long time series are downsampled (see plot_masses).
+
+        """
         if not boxes:
-            boxes = self.system.box_list
-        fig, ax = self._gs(title='Concentration of {}'.format(variable.name),
+            boxes = self.box_names
+        fig, ax = self._gs(title='Concentration of {}'.format(
+                getattr(variable, 'name', variable)),
                 xlabel='xlabel', ylabel='ylabel', **kwargs)
 
         for box in boxes:
-            box_masses = self.df[(box.name, 'mass')].replace(0, np.nan)
-            var_masses = self.df[(box.name, variable.name)]
-            concentrations = (var_masses/box_masses).tolist()
-
-            ax.plot(self.time_array, concentrations,
-                    label='Box {}'.format(box.name))
+            time, concentrations = self._get_plot_series(box, variable,
+                    concentration=True, max_points=max_points,
+                    method=downsampling)
+            ax.plot(time, concentrations,
+                    label='Box {}'.format(getattr(box, 'name', box)))
         ax.legend()
         return fig, ax
 
@@ -247,8 +634,97 @@ class Solution:
         ax.legend()
         return fig, ax
 
+    FIGURE_KINDS = ('masses', 'concentration')
+
+    def export_figures(self, spec, directory, workers=None, format='png',
+            **kwargs):
+        """Render many figures to files, in parallel.
+
+        The figures are rendered by a pool of worker processes with the
+        non-interactive Agg backend. The workers do not receive a copy of
+        the Solution: they open its solution file (see save) and read
+        only the time series they plot. A Solution that was not loaded
+        from a solution file is written to a temporary one first.
+
+        Args:
+            spec (list of tuple): Figures to render: (kind, quantity) or
+                (kind, quantity, boxes). kind is 'masses' (see
+                plot_masses) or 'concentration' (see
+                plot_variable_concentration), quantity a Variable, Fluid
+                or quantity name and boxes a list of boxes or box names
+                (default: all boxes). E.g. all variables x boxes:
+                [(kind, variable, [box]) for kind in
+                solution.FIGURE_KINDS for variable in variables for box
+                in boxes].
+            directory (str): Directory of the figures. A figure is saved
+                as {kind}_{quantity}.{format} (all boxes) or
+                {kind}_{quantity}_{box names}.{format}.
+            workers (int): Number of worker processes. Default: Number of
+                CPUs. With workers=1 the figures are rendered in this
+                process.
+            format (str): File format of the figures (default: 'png').
+            **kwargs: Further arguments of matplotlib's savefig (e.g.
+                dpi).
+
+        Returns:
+            file_names (list of str): File names of the figures (in the
+                order of spec).
+
+        """
+        figures = []
+        for figure in spec:
+            kind, quantity, boxes = (tuple(figure) + (None,))[:3]
+            if kind not in self.FIGURE_KINDS:
+                raise ValueError('kind must be one of {}, not {}'.format(
+                    self.FIGURE_KINDS, kind))
+            quantity = self.quantities[self._get_quantity_id(quantity)]
+            name = '{}_{}'.format(kind, quantity)
+            if boxes is not None:
+                boxes = [self.box_names[self._get_box_id(box)]
+                        for box in boxes]
+                name = '{}_{}'.format(name, '-'.join(boxes))
+            file_name = os.path.join(directory, '{}.{}'.format(name,
+                format))
+            figures.append((kind, quantity, boxes, file_name, kwargs))
+        os.makedirs(directory, exist_ok=True)
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(figures) <= 1:
+            return [self._export_figure(*figure) for figure in figures]
+
+        from concurrent.futures import ProcessPoolExecutor
+        settings = {'default_figsize': self.default_figsize,
+                'default_yaxis_log': self.default_yaxis_log,
+                'default_max_points': self.default_max_points,
+                'default_downsampling': self.default_downsampling}
+        with tempfile.TemporaryDirectory() as temp_directory:
+            if self._file is not None:
+                file_name = self._file.file_name
+            else:
+                file_name = os.path.join(temp_directory, 'solution.bss')
+                self.save(file_name, storage='memmap')
+            with ProcessPoolExecutor(workers,
+                    initializer=_init_export_worker,
+                    initargs=(file_name, settings)) as executor:
+                chunksize = max(1, len(figures) // (4 * workers))
+                return list(executor.map(_export_figure, figures,
+                    chunksize=chunksize))
+
+    def _export_figure(self, kind, quantity, boxes, file_name, kwargs):
+        """Render one figure of export_figures to file_name."""
+        import matplotlib.pyplot as plt
+        if kind == 'masses':
+            fig, ax = self.plot_masses(quantity, boxes)
+        else:
+            fig, ax = self.plot_variable_concentration(quantity, boxes)
+        fig.savefig(file_name, **kwargs)
+        plt.close(fig)
+        return file_name
+
     def _gs(self, title, xlabel, ylabel, figsize=None, yaxis_log=False):
         """Get Subplots. Return subplots: fig, ax"""
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mtick
         if not figsize:
             figsize = self.default_figsize
         fig, ax = plt.subplots(figsize=figsize)
@@ -265,14 +741,73 @@ class Solution:
         return fig, ax
 
     # PICKLING
-    def save(self, file_name):
-        """Pickle instance and save to file_name."""
+    def save(self, file_name, storage='pickle', dtypes=None,
+            compression=None, chunk_size=bs_storage.CHUNK_SIZE):
+        """Save instance to file_name.
+
+        Args:
+            file_name (str): Name of the file.
+            storage (str): 'pickle' (default): Pickle the whole instance
+                (including the system). 'memmap': Write the time series
+                to a solution file that is read lazily by load (see
+                storage.py); the system, timings, profiles and limiter
+                log are not saved.
+            dtypes (str or dict): Storage precision of the time series
+                ('float64' or 'float32'); either one dtype for all
+                quantities or a dict quantity -> dtype (e.g.
+                {'volume': 'float32'}; quantities that are not given are
+                stored as float64). Only for storage='memmap'.
+            compression (str): Lossless compression of the time series:
+                None (default), 'zlib' or 'lzma'. Only for
+                storage='memmap'.
+            chunk_size (int): Number of timesteps per compressed chunk.
+
+        """
+        if storage != 'memmap' and (dtypes or compression):
+            raise ValueError('dtypes and compression require '
+                    'storage=\'memmap\'.')
+        if storage == 'memmap':
+            header = {
+                'name': self.name,
+                'box_names': self.box_names,
+                'quantities': self.quantities,
+                'dt': self.dt.magnitude if self.dt is not None else None,
+                'start_time': self.start_time.magnitude,
+                'time_units': str(self.time_units),
+                'mass_units': str(ur.kg),
+                'volume_units': str(ur.meter**3),
+            }
+            arrays = {quantity: self.get_values(quantities=[quantity])[:, 0]
+                    for quantity in self.quantities}
+            if dtypes is not None and not isinstance(dtypes, dict):
+                dtypes = {quantity: dtypes for quantity in self.quantities}
+            bs_storage.write_solution_file(file_name, header,
+                    self.time_array, arrays, dtypes, compression, chunk_size)
+            return
+        if storage != 'pickle':
+            raise ValueError('Unknown storage: {}'.format(storage))
+        import dill as pickle
         with open(file_name, 'wb') as f:
             pickle.dump(self, f)
 
+    @classmethod
+    def _from_solution_file(cls, file_name):
+        """Return a Solution that lazily reads a solution file."""
+        solution_file = bs_storage.SolutionFile(file_name)
+        header = solution_file.header
+        time_units = ur.Unit(header['time_units'])
+        dt = header['dt'] * time_units if header['dt'] is not None else None
+        return cls._from_arrays(header['name'], solution_file.box_names,
+                solution_file.quantities, solution_file.time_array, dt,
+                header.get('start_time', 0) * time_units,
+                solution_file=solution_file)
+
     @classmethod
     def load(self, file_name):
-        """Load pickled instance from file_name."""
+        """Load instance from file_name (solution file or pickle)."""
+        if bs_storage.is_solution_file(file_name):
+            return self._from_solution_file(file_name)
+        import dill as pickle
         with open(file_name, 'rb') as f:
             solution = pickle.load(f)
             if not isinstance(solution, Solution):
@@ -281,4 +816,19 @@ class Solution:
         return solution
 
 
+# Solution of a worker process of Solution.export_figures
+_export_solution = None
+
+
+def _init_export_worker(file_name, settings):
+    """Open the solution file of export_figures in a worker process."""
+    global _export_solution
+    import matplotlib
+    matplotlib.use('Agg')
+    _export_solution = Solution.load(file_name)
+    for name, value in settings.items():
+        setattr(_export_solution, name, value)
+
 
+def _export_figure(figure):
+    return _export_solution._export_figure(*figure)
@@ -9,22 +9,33 @@ Created on Thu Jun 23 2016 at 10:37UTC
 import os
 import pdb
 import copy
+import threading
+import concurrent.futures
 import time as time_module
 import datetime
 import numpy as np
-import dill as pickle
-import matplotlib.pyplot as plt
 from attrdict import AttrDict
 import math
 
+from . import cache as bs_cache
+from . import diagnostics as bs_diagnostics
 from . import solution as bs_solution
+from . import timing as bs_timing
 from . import utils as bs_utils
+from . import validation as bs_validation
 from . import ur
 
 
+# Phases of a timestep that are timed (see Solution.timings)
+SOLVER_PHASES = ('setup', 'mass_flows', 'fluid_limiter', 'flows', 'fluxes',
+        'processes', 'reactions', 'variable_limiter', 'state_update',
+        'output')
+
+
 def save_simulation_state(system):
     filename = '{:%Y%m%d}_{}_TS{}.pickle'.format(
             datetime.date.today(), system.name, timestep)
+    import dill as pickle
     with open(filename, 'wb') as f:
         pickle.dump(system, f)
 
@@ -33,7 +44,8 @@ def load_simulation_state(system):
     pass
 
 
-def solve(system, total_integration_time, dt, save_frequency=100, debug=False):
+def solve(system, total_integration_time, dt, save_frequency=100, debug=False,
+        step_timings=False, verbose=True, monitor=None, cache=None):
     """Simulate the time evolution of all variables within the system.
 
     Collect all information about the system, create differential 
@@ -60,6 +72,27 @@ def solve(system, total_integration_time, dt, save_frequency=100, debug=False):
             saved state.
         debug (bool): Activates debugging mode (pdb.set_trace()).
             Defaults to False.
+        step_timings (bool): If True, the time spent in every phase is
+            also recorded for every timestep (see Solution.timings).
+            Defaults to False.
+        verbose (bool or int): If False (or 0), nothing is printed. If
+            True (or 1), the progress and the run time are printed. If 2,
+            the time spent in every phase (Solution.timings), the
+            activity of the limiter (Solution.limiter_log) and the
+            profile of the user-defined functions (if profiling is
+            enabled) are printed at the end as well; the phase times
+            are also printed if verbose is True and step_timings is
+            True. Defaults to True.
+        monitor (object): Observer of the simulation (e.g. SolveFuture)
+            with two methods: start(solution) is called with the Solution
+            before the first timestep, update(timestep) after every
+            timestep. If update returns False, the simulation is stopped;
+            the values of the remaining timesteps of the Solution are
+            NaN. Defaults to None.
+        cache (CompilationCache or bool): Cache of the assembled static
+            rates (see cache.py). If True, the cache in the boxsimu cache
+            directory is used (cache.get_default_cache). Defaults to None
+            (no caching).
 
     """
     # Start time of function
@@ -76,25 +109,37 @@ def solve(system, total_integration_time, dt, save_frequency=100, debug=False):
     N_timesteps = math.ceil(total_integration_time / dt)
     # Recalculate total integration time based on the number of timesteps
     total_integration_time = N_timesteps * dt
-    print('DDATTEE')
-    print('Start solving the BoxModelSystem...')
-    print('- total integration time: {}'.format(total_integration_time))
-    print('- dt (time step): {}'.format(dt))
-    print('- number of time steps: {}'.format(N_timesteps))
+    if verbose:
+        print('Start solving the BoxModelSystem...')
+        print('- total integration time: {}'.format(total_integration_time))
+        print('- dt (time step): {}'.format(dt))
+        print('- number of time steps: {}'.format(N_timesteps))
+
+    timer = bs_timing.PhaseTimer(SOLVER_PHASES,
+            N_timesteps if step_timings else None)
 
     time = total_integration_time * 0
     sol = bs_solution.Solution(system, N_timesteps, dt)
+    sol.timings = timer
+    sol.limiter_log = bs_diagnostics.LimiterLog(system, N_timesteps)
+    profiler = getattr(system, 'profiler', None)
+    if profiler:
+        profiler.reset()
+
+    # Rates of static flows, fluxes, processes and reactions are constant
+    # (optionally loaded from the compilation cache, see cache.py)
+    if cache is True:
+        cache = bs_cache.get_default_cache()
+    static = StaticContributions(system, cache or None)
 
     # Save initial state to solution
-    for box in system.box_list:
-        # sol.df.loc[0] = np.nan
-        sol.df.loc[0, (box.name,'mass')] = box.fluid.mass.magnitude
-        sol.df.loc[0, (box.name,'volume')] = \
-                system.get_box_volume(box).magnitude
-        for variable in system.variable_list:
-            var_name = variable.name
-            sol.df.loc[0, (box.name,var_name)] = \
-                    box.variables[var_name].mass.magnitude
+    sol.save_state(0, system.state, _get_box_volumes(system))
+
+    # Changes of the fluid (column 0) and variable masses of all boxes
+    d_state = np.zeros_like(system.state)
+    timer.lap('setup')
+    if monitor:
+        monitor.start(sol)
 
     timetesteps_since_last_save = 0
     progress = 0
@@ -102,7 +147,7 @@ def solve(system, total_integration_time, dt, save_frequency=100, debug=False):
         # Calculate progress in percentage of processed timesteps
         progress_old = progress
         progress = int(float(timestep) / float(N_timesteps)*10) * 10.0
-        if progress != progress_old:
+        if verbose and progress != progress_old:
             print("{}%".format(progress))
         
         #print(timetesteps_since_last_save)
@@ -113,63 +158,266 @@ def solve(system, total_integration_time, dt, save_frequency=100, debug=False):
             timetesteps_since_last_save += 1
 
         time += dt
+        timer.start(timestep)
 
         ##################################################
         # Calculate Mass fluxes
         ##################################################
 
-        dm, f_flow = _calculate_mass_flows(system, time, dt)
+        dm, f_flow, fluid_iterations = _calculate_mass_flows(
+                system, time, dt, static, timer)
 
         ##################################################
         # Calculate Variable changes due to PROCESSES,
         # REACTIONS, FUXES and FLOWS
         ##################################################
 
-        dvar = _calculate_changes_of_all_variables(
-                system, time, dt, f_flow)
+        dvar, f_var, variable_iterations = \
+                _calculate_changes_of_all_variables(
+                        system, time, dt, f_flow, static, timer)
+        sol.limiter_log.record(timestep, fluid_iterations, f_flow,
+                variable_iterations, f_var)
 
         ##################################################
-        # Apply changes to Boxes and save values to
-        # Solution instance
+        # Apply changes to the state of the system and
+        # save values to Solution instance
         ##################################################
 
-        for box in system.box_list:
-            # Write changes to box objects
-            box.fluid.mass += dm[box.id]
+        d_state[:, 0] = bs_validation.get_base_magnitude(dm)
+        d_state[:, 1:] = bs_validation.get_base_magnitude(dvar)
+        system.state += d_state
+        timer.lap('state_update')
 
-            # Save mass to Solution instance
-            sol.df.loc[timestep, (box.name, 'mass')] = \
-                    box.fluid.mass.magnitude
-            sol.df.loc[timestep, (box.name, 'volume')] = \
-                    system.get_box_volume(box).magnitude
+        sol.save_state(timestep, system.state, _get_box_volumes(system))
+        timer.lap('output')
 
-            for variable in system.variable_list:
-                var_name = variable.name
-                system.boxes[box.name].variables[var_name].mass += \
-                        dvar[box.id, variable.id]
-                sol.df.loc[timestep, (box.name,variable.name)] = \
-                        box.variables[variable.name].mass.magnitude
+        if monitor and monitor.update(timestep) is False:
+            break
 
     # End Time of Function
     func_end_time = time_module.time()
-    print(
-        'Function "solve(...)" used {:3.3f}s'.format(
-            func_end_time - func_start_time))
+    if profiler:
+        sol.user_function_profile = profiler.get_dataframe()
+    if verbose:
+        print(
+            'Function "solve(...)" used {:3.3f}s'.format(
+                func_end_time - func_start_time))
+    if verbose >= 2 or (verbose and step_timings):
+        print(timer)
+    if verbose >= 2:
+        print(sol.limiter_log)
+        if profiler:
+            print(profiler)
     return sol
 
 
-def _calculate_mass_flows(system, time, dt):
+class StaticContributions:
+    """Sources and sinks due to static rates of a system.
+
+    Rates that are given as constants (UserFunction.is_static) do not
+    change during a simulation. Their contributions to the fluid and
+    variable source/sink vectors and exchange matrices are therefore
+    assembled once at the start of a simulation. During the simulation
+    only the contributions of the dynamic rates have to be added.
+
+    Note: Passive transport of variables with fluid flows depends on the
+    (dynamic) variable concentrations of the source boxes. For static
+    flows only the fluid mass flow rates are assembled in advance.
+
+    The assembled arrays only depend on the structure and the static
+    rates of the system. If a CompilationCache is given, they are loaded
+    from the cache instead of being assembled again (see cache.py).
+
+    Args:
+        system (BoxModelSystem): System that is simulated.
+        cache (CompilationCache): Cache of the assembled arrays. Default:
+            None (no caching).
+
+    Attributes:
+        dynamic_flows (list of Flow): Flows with dynamic rates.
+        dynamic_fluxes (list of Flux): Fluxes with dynamic rates.
+        dynamic_processes (list of Process): Processes with dynamic rates.
+
+    """
+
+    def __init__(self, system, cache=None):
+        self.system = system
+
+        self.dynamic_flows = [f for f in system.flows if f.rate.is_dynamic]
+        self.dynamic_fluxes = [f for f in system.fluxes if f.rate.is_dynamic]
+        self.dynamic_processes = [p for p in system.processes
+                if p.rate.is_dynamic]
+        self.dynamic_tracer_flows = [f for f in self.dynamic_flows
+                if f.tracer_transport]
+        # Flows from outside the system that carry a variable
+        self.static_source_flows = {}
+        self.dynamic_source_flows = {}
+        for variable in system.variable_list:
+            static_source_flows = []
+            dynamic_source_flows = []
+            variable_flow_ids = system.topology.variable_source_flow_ids[
+                    variable.id]
+            for flow in [system.flows[i] for i in variable_flow_ids]:
+                if (flow.rate.is_static and
+                        flow.concentrations[variable].is_static):
+                    static_source_flows.append(flow)
+                else:
+                    dynamic_source_flows.append(flow)
+            self.static_source_flows[variable.id] = static_source_flows
+            self.dynamic_source_flows[variable.id] = dynamic_source_flows
+
+        arrays = None
+        if cache is not None:
+            key = bs_cache.get_model_hash(system)
+            arrays = cache.get(key)
+        if arrays is not None:
+            self._set_arrays(arrays)
+        else:
+            self._compile()
+            if cache is not None:
+                cache.put(key, self._get_arrays())
+
+    def _compile(self):
+        """Evaluate the static rates and assemble their contributions."""
+        system = self.system
+        time = 0 * system.pint_ur.second
+
+        static_flows = [f for f in system.flows if f.rate.is_static]
+        static_fluxes = [f for f in system.fluxes if f.rate.is_static]
+        static_processes = [p for p in system.processes if p.rate.is_static]
+
+        # FLUID mass flows
+        self.A_fluid = system.get_fluid_mass_internal_flow_2Darray(time,
+                static_flows)
+        self.s_fluid = system.get_fluid_mass_flow_sink_1Darray(time,
+                static_flows)
+        self.q_fluid = system.get_fluid_mass_flow_source_1Darray(time,
+                static_flows)
+
+        # Fluid mass flows that passively transport variables
+        static_tracer_flows = [f for f in static_flows if f.tracer_transport]
+        self.A_tracer = system.get_fluid_mass_internal_flow_2Darray(time,
+                static_tracer_flows)
+        self.s_tracer = system.get_fluid_mass_flow_sink_1Darray(time,
+                static_tracer_flows)
+
+        # Variable sources of flows from outside the system
+        self.q_flow = {}
+        for variable in system.variable_list:
+            self.q_flow[variable.id] = \
+                    system.get_variable_flow_source_1Darray(variable, time,
+                            self.static_source_flows[variable.id])
+
+        # FLUXES, PROCESSES
+        self.A_flux = {}
+        self.s_flux = {}
+        self.q_flux = {}
+        self.s_process = {}
+        self.q_process = {}
+        for variable in system.variable_list:
+            self.A_flux[variable.id] = \
+                    system.get_variable_internal_flux_2Darray(variable, time,
+                            static_fluxes)
+            self.s_flux[variable.id] = system.get_variable_flux_sink_1Darray(
+                    variable, time, static_fluxes)
+            self.q_flux[variable.id] = \
+                    system.get_variable_flux_source_1Darray(variable, time,
+                            static_fluxes)
+            self.s_process[variable.id] = \
+                    system.get_variable_process_sink_1Darray(variable, time,
+                            static_processes)
+            self.q_process[variable.id] = \
+                    system.get_variable_process_source_1Darray(variable, time,
+                            static_processes)
+
+        # REACTIONS (None for reactions with dynamic rates)
+        self.reaction_rates = []
+        for reaction in system.reactions:
+            if reaction.rate.is_static:
+                self.reaction_rates.append(
+                        system.get_reaction_rate_2Darray(time, reaction))
+            else:
+                self.reaction_rates.append(None)
+
+    # CACHING (see cache.py)
+
+    _ARRAYS = ('A_fluid', 's_fluid', 'q_fluid', 'A_tracer', 's_tracer')
+    _VARIABLE_ARRAYS = ('q_flow', 'A_flux', 's_flux', 'q_flux', 's_process',
+            'q_process')
+
+    def _get_arrays(self):
+        """Return the compiled arrays as magnitudes in base units."""
+        get_magnitude = bs_validation.get_base_magnitude
+        arrays = {name: get_magnitude(getattr(self, name))
+                for name in self._ARRAYS}
+        for name in self._VARIABLE_ARRAYS:
+            for variable_id, array in getattr(self, name).items():
+                arrays['{}.{}'.format(name, variable_id)] = \
+                        get_magnitude(array)
+        for i, array in enumerate(self.reaction_rates):
+            if array is not None:
+                arrays['reaction_rates.{}'.format(i)] = get_magnitude(array)
+        return arrays
+
+    def _set_arrays(self, arrays):
+        """Set the compiled arrays from magnitudes in base units."""
+        system = self.system
+        units = system.topology.mass_rate_units
+        # Quantity(array, units) is much faster than array * units
+        quantity = lambda name: units._REGISTRY.Quantity(arrays[name], units)
+        for name in self._ARRAYS:
+            setattr(self, name, quantity(name))
+        for name in self._VARIABLE_ARRAYS:
+            setattr(self, name, {variable.id: quantity('{}.{}'.format(name,
+                variable.id)) for variable in system.variable_list})
+        self.reaction_rates = [None if reaction.rate.is_dynamic else
+                quantity('reaction_rates.{}'.format(i))
+                for i, reaction in enumerate(system.reactions)]
+
+    def get_reaction_rate_3Darray(self, time):
+        """Return reaction rates like BoxModelSystem.get_reaction_rate_3Darray.
+
+        Only the rates of dynamic reactions are evaluated.
+
+        """
+        system = self.system
+        if len(system.reactions) == 0:
+            return (np.zeros([system.N_boxes, system.N_variables, 1]) *
+                    system.topology.mass_rate_units)
+
+        C = np.zeros([len(system.reactions), system.N_boxes,
+                system.N_variables])
+        for i, reaction in enumerate(system.reactions):
+            reaction_2Darray = self.reaction_rates[i]
+            if reaction_2Darray is None:
+                reaction_2Darray = system.get_reaction_rate_2Darray(time,
+                        reaction)
+            C[i,:,:] = bs_validation.get_base_magnitude(reaction_2Darray)
+        return np.moveaxis(C, 0, -1) * system.topology.mass_rate_units
+
+
+def _get_box_volumes(system):
+    """Return the volumes [m^3] of all boxes (ordered by id)."""
+    return np.array([bs_validation.get_base_magnitude(
+        system.get_box_volume(box)) for box in system.box_list])
+
+
+def _calculate_mass_flows(system, time, dt, static, timer):
     """Calculate mass changes of every box.
 
     Args:
         time (pint.Quantity [T]): Current time (age) of the system.
         dt (pint.Quantity [T]): Timestep used.
+        static (StaticContributions): Precomputed static rates.
+        timer (PhaseTimer): Timer of the solver phases.
 
     Returns:
         dm (numpy 1D array of pint.Quantities): Mass changes of every box.
         f_flow (numpy 1D array): Reduction coefficient of the mass 
             flows (due to becoming-empty boxes -> box mass cannot 
             decrase below 0kg).
+        iterations (int): Number of iterations of the limiter (0 if no
+            box had to be limited).
 
     """
     # f_flow is the reduction coefficent of the "sink-flows" of each box
@@ -181,28 +429,35 @@ def _calculate_mass_flows(system, time, dt):
 
     # get internal flow matrix and calculate the internal souce and sink 
     # vectors. Also get the external sink and source vector
-    A = system.get_fluid_mass_internal_flow_2Darray(time)
+    flows = static.dynamic_flows
+    A = static.A_fluid + system.get_fluid_mass_internal_flow_2Darray(time,
+            flows)
     # internal 
     s_i = bs_utils.dot(A, v1)
     q_i = bs_utils.dot(A.T, v1)
-    s_e = system.get_fluid_mass_flow_sink_1Darray(time)
-    q_e = system.get_fluid_mass_flow_source_1Darray(time)
+    s_e = static.s_fluid + system.get_fluid_mass_flow_sink_1Darray(time,
+            flows)
+    q_e = static.q_fluid + system.get_fluid_mass_flow_source_1Darray(time,
+            flows)
 
     # calculate first estimate of mass change vector
     dm = (q_e + q_i - s_e - s_i) * dt
     # calculate first estimate of mass after timestep
     m = m_ini + dm
+    timer.lap('mass_flows')
 
+    iterations = 0
     while np.any(m.magnitude < 0):
+        iterations += 1
         argmin = np.argmin(m)
         # Calculate net sink and source and mass of the 'empty' box.
         net_source = (q_e[argmin] + q_i[argmin])*dt
         net_sink = (s_e[argmin] + s_i[argmin])*dt
         available_mass = m_ini[argmin]
-        total_mass = (net_source + available_mass).to_base_units()
+        total_mass = bs_validation.to_base_units(net_source + available_mass)
 
         if total_mass.magnitude > 0: 
-            f_new = (total_mass / net_sink).to_base_units().magnitude 
+            f_new = bs_validation.get_base_magnitude(total_mass / net_sink)
             f_flow[argmin] = min(f_new, f_flow[argmin] * 0.98)
         else:
             f_flow[argmin] = 0
@@ -214,10 +469,12 @@ def _calculate_mass_flows(system, time, dt):
         s_e = f_flow * s_e
         dm = (q_e + q_i - s_e - s_i) * dt
         m = m_ini + dm
-    return dm, f_flow
+    timer.lap('fluid_limiter')
+    return dm, f_flow, iterations
 
 
-def _calculate_changes_of_all_variables(system, time, dt, f_flow):
+def _calculate_changes_of_all_variables(system, time, dt, f_flow, static,
+        timer):
     """ Calculates the changes of all variable in every box.
 
     Args:
@@ -225,29 +482,35 @@ def _calculate_changes_of_all_variables(system, time, dt, f_flow):
         dt (pint.Quantity [T]): Timestep used.
         f_flow (numpy 1D array): Reduction coefficient of the mass flows 
             due to empty boxes.
+        static (StaticContributions): Precomputed static rates.
+        timer (PhaseTimer): Timer of the solver phases.
 
     Returns:
         dvar (numpy 2D array of pint.Quantities): Variables changes of 
             every box. First dimension are the boxes, second dimension
             are the variables.
+        f_var (numpy 2D array): Reduction coefficients of the variable
+            sinks (same dimensions as dvar).
+        iterations (int): Number of iterations of the limiter (0 if no
+            variable had to be limited).
 
     """
     # reduction coefficent of the "variable-sinks" of each box for the
     # treated variable
     # scaling factor for sinks of each box
     f_var = np.ones([system.N_boxes, system.N_variables])
-    var_ini = bs_utils.stack([system.get_variable_mass_1Darray(
-        variable) for variable in system.variable_list], axis=-1)
+    var_ini = system.get_variable_mass_2Darray()
 
+    iterations = 0
     while True:
         dvar_list, net_sink_list, net_source_list = zip(*[_get_dvar(
-            system, variable, time, dt, f_var, f_flow) 
+            system, variable, time, dt, f_var, f_flow, static, timer)
             for variable in system.variable_list])
         dvar = bs_utils.stack(dvar_list, axis=-1)
         net_sink = bs_utils.stack(net_sink_list, axis=-1)
         net_source = bs_utils.stack(net_source_list, axis=-1)
 
-        var = (var_ini + dvar).to_base_units()
+        var = bs_validation.to_base_units(var_ini + dvar)
         
         net_sink[net_sink.magnitude == 0] = np.nan  # to evade division by zero
 
@@ -267,68 +530,73 @@ def _calculate_changes_of_all_variables(system, time, dt, f_flow):
             # (f_var_tmp) is further decreased by a very small number.
             f_var_tmp[f_var_tmp < 1] -= 1e-15 # np.nextafter(0, 1)
             f_var *= f_var_tmp
+            iterations += 1
+            timer.lap('variable_limiter')
         else:
+            timer.lap('variable_limiter')
             break
-    return dvar
+    return dvar, f_var, iterations
 
 
-def _get_sink_source_flow(system, variable, time, dt, f_var, f_flow):
+def _get_sink_source_flow(system, variable, time, dt, f_var, f_flow, static):
     v1 = np.ones(system.N_boxes)
-    flows = system.flows
-    A_flow = system.get_variable_internal_flow_2Darray(variable, 
-            time, f_flow, flows)
+    flows = static.dynamic_tracer_flows
+    flow_concentration = system.get_variable_flow_concentration_1Darray(
+            variable, time)
+    A_flow = (system.get_variable_internal_flow_2Darray(variable,
+            time, f_flow, flows) +
+            (static.A_tracer.T * flow_concentration).T)
     A_flow = (A_flow.T * f_var[:, variable.id]).T
     s_flow_i = bs_utils.dot(A_flow, v1)
     q_flow_i = bs_utils.dot(A_flow.T, v1)
-    s_flow_e = system.get_variable_flow_sink_1Darray(variable, 
-            time, f_flow, flows)
-    s_flow_e = system.get_variable_flow_sink_1Darray(variable, 
-            time, f_flow, flows) * f_var[:, variable.id]
-
-    q_flow_e = system.get_variable_flow_source_1Darray(variable,
-            time, flows)
-    sink_flow = ((s_flow_i + s_flow_e) * dt).to_base_units()
-    source_flow = ((q_flow_i + q_flow_e) * dt).to_base_units()
+    s_flow_e = (system.get_variable_flow_sink_1Darray(variable,
+            time, f_flow, flows) +
+            static.s_tracer * f_flow * flow_concentration)
+    s_flow_e = s_flow_e * f_var[:, variable.id]
+
+    q_flow_e = static.q_flow[variable.id] + \
+            system.get_variable_flow_source_1Darray(variable, time,
+                    static.dynamic_source_flows[variable.id])
+    sink_flow = bs_validation.to_base_units((s_flow_i + s_flow_e) * dt)
+    source_flow = bs_validation.to_base_units((q_flow_i + q_flow_e) * dt)
     return sink_flow, source_flow
 
 
-def _get_sink_source_flux(system, variable, time, dt, f_var):
+def _get_sink_source_flux(system, variable, time, dt, f_var, static):
     v1 = np.ones(system.N_boxes)
-    fluxes = system.fluxes
-    A_flux = system.get_variable_internal_flux_2Darray(variable,
-            time, fluxes)
+    fluxes = static.dynamic_fluxes
+    A_flux = static.A_flux[variable.id] + \
+            system.get_variable_internal_flux_2Darray(variable, time, fluxes)
     A_flux = (A_flux.T * f_var[:, variable.id]).T
     s_flux_i = bs_utils.dot(A_flux, v1)
     q_flux_i = bs_utils.dot(A_flux.T, v1)
-    s_flux_e = system.get_variable_flux_sink_1Darray(variable, 
-            time, fluxes)
-    s_flux_e = system.get_variable_flux_sink_1Darray(variable, 
-            time, fluxes) * f_var[:, variable.id]
-
-    q_flux_e = system.get_variable_flux_source_1Darray(variable,
-            time, fluxes)
-    sink_flux = ((s_flux_i + s_flux_e) * dt).to_base_units()
-    source_flux = ((q_flux_i + q_flux_e) * dt).to_base_units()
-    dvar_flux = source_flux - sink_flux
+    s_flux_e = (static.s_flux[variable.id] +
+            system.get_variable_flux_sink_1Darray(variable, time, fluxes))
+    s_flux_e = s_flux_e * f_var[:, variable.id]
+
+    q_flux_e = static.q_flux[variable.id] + \
+            system.get_variable_flux_source_1Darray(variable, time, fluxes)
+    sink_flux = bs_validation.to_base_units((s_flux_i + s_flux_e) * dt)
+    source_flux = bs_validation.to_base_units((q_flux_i + q_flux_e) * dt)
     return sink_flux, source_flux
 
 
-def _get_sink_source_process(system, variable, time, dt, f_var):
-    processes = system.processes
-    s_process = system.get_variable_process_sink_1Darray(variable, 
-            time, processes)
-    s_process = system.get_variable_process_sink_1Darray(variable, 
-            time, processes) * f_var[:, variable.id]
-    q_process = system.get_variable_process_source_1Darray(variable,
-            time, processes)
-    sink_process = (s_process * dt).to_base_units()
-    source_process = (q_process * dt).to_base_units()
+def _get_sink_source_process(system, variable, time, dt, f_var, static):
+    processes = static.dynamic_processes
+    s_process = (static.s_process[variable.id] +
+            system.get_variable_process_sink_1Darray(variable, time,
+                    processes))
+    s_process = s_process * f_var[:, variable.id]
+    q_process = (static.q_process[variable.id] +
+            system.get_variable_process_source_1Darray(variable, time,
+                    processes))
+    sink_process = bs_validation.to_base_units(s_process * dt)
+    source_process = bs_validation.to_base_units(q_process * dt)
     return sink_process, source_process
 
 
-def _get_sink_source_reaction(system, variable, time, dt, f_var):
-    reactions = system.reactions
-    rr_cube = system.get_reaction_rate_3Darray(time, reactions)
+def _get_sink_source_reaction(system, variable, time, dt, f_var, static):
+    rr_cube = static.get_reaction_rate_3Darray(time)
 
     ## APPLY CORRECTIONS HERE!
     if np.any(f_var < 1):
@@ -353,86 +621,161 @@ def _get_sink_source_reaction(system, variable, time, dt, f_var):
     s_reaction = sink_rr_cube.sum(axis=2)[:, variable.id]
     q_reaction = source_rr_cube.sum(axis=2)[:, variable.id]
     
-    sink_reaction = (s_reaction * dt).to_base_units()
-    source_reaction = (q_reaction * dt).to_base_units()
+    sink_reaction = bs_validation.to_base_units(s_reaction * dt)
+    source_reaction = bs_validation.to_base_units(q_reaction * dt)
     return sink_reaction, source_reaction
 
 
-def _get_dvar(system, variable, time, dt, f_var, f_flow):
+def _get_dvar(system, variable, time, dt, f_var, f_flow, static, timer):
     # Get variables sources (q) and sinks (s)
     # i=internal, e=external
 
     sink_flow, source_flow = _get_sink_source_flow(
-            system, variable, time, dt, f_var, f_flow)
+            system, variable, time, dt, f_var, f_flow, static)
+    timer.lap('flows')
     sink_flux, source_flux = _get_sink_source_flux(
-            system, variable, time, dt, f_var)
+            system, variable, time, dt, f_var, static)
+    timer.lap('fluxes')
     sink_process, source_process = _get_sink_source_process(
-            system, variable, time, dt, f_var)
+            system, variable, time, dt, f_var, static)
+    timer.lap('processes')
     sink_reaction, source_reaction = _get_sink_source_reaction(
-            system, variable, time, dt, f_var)
+            system, variable, time, dt, f_var, static)
+    timer.lap('reactions')
 
     net_sink = sink_flow + sink_flux + sink_process + sink_reaction
     net_source = (source_flow + source_flux + source_process + 
             source_reaction)
     
-    net_sink = net_sink.to_base_units()
-    net_source = net_source.to_base_units()
-    dvar = (net_source - net_sink).to_base_units()
+    net_sink = bs_validation.to_base_units(net_sink)
+    net_source = bs_validation.to_base_units(net_source)
+    dvar = bs_validation.to_base_units(net_source - net_sink)
     return dvar, net_sink, net_source
 
 
+class SolveFuture(concurrent.futures.Future):
+    """Handle of a simulation that runs in the background.
 
+    Returned by Solver.solve_async. Besides the interface of
+    concurrent.futures.Future (result, exception, done,
+    add_done_callback, ...) the handle reports the progress of the
+    simulation and gives access to the values computed so far. It can
+    also be awaited in asyncio coroutines:
 
+        solution = await solver.solve_async(100*ur.year, 1*ur.year)
 
+    cancel() also stops a running simulation: the simulation ends after
+    the current timestep, and only then the future is cancelled.
+    result() raises CancelledError; the values computed until then are
+    still available from partial_solution().
 
+    Attributes:
+        solution (Solution): Solution that is filled by the simulation
+            (None before the first timestep). Values of timesteps that
+            are not yet computed are NaN.
+        timesteps_done (int): Number of computed timesteps. It is
+            increased after the values of a timestep are written to
+            solution.
+        N_timesteps (int): Total number of timesteps (None before the
+            first timestep).
 
+    """
 
+    def __init__(self):
+        super().__init__()
+        self.solution = None
+        self.timesteps_done = 0
+        self.N_timesteps = None
+        # Set by cancel() to stop a running simulation
+        self._stop = threading.Event()
+        # Guards solution and timesteps_done
+        self._progress_lock = threading.Lock()
+
+    @property
+    def progress(self):
+        """Fraction of the computed timesteps (between 0 and 1)."""
+        with self._progress_lock:
+            N_timesteps = self.N_timesteps
+            timesteps_done = self.timesteps_done
+        if not N_timesteps:
+            return 1.0 if self.done() and not self.cancelled() else 0.0
+        return timesteps_done / N_timesteps
+
+    def cancel(self):
+        """Cancel the simulation.
+
+        A pending simulation is cancelled at once. A running simulation
+        is stopped after the current timestep; the future is cancelled as
+        soon as the simulation has stopped (see done and cancelled).
 
+        Returns:
+            False if the simulation has already finished, True otherwise.
 
+        """
+        if super().cancel():
+            return True
+        with self._condition:
+            if not self.running():
+                return False
+            self._stop.set()
+        return True
+
+    def partial_solution(self):
+        """Return a Solution of the timesteps computed so far (or None)."""
+        with self._progress_lock:
+            solution = self.solution
+            done = self.timesteps_done
+            if solution is None:
+                return None
+            # The values of computed timesteps are not changed anymore
+            return solution.window(t1=solution.time_array[done-1] if done
+                    else solution.start_time.magnitude)
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self).__await__()
+
+    # Monitor of the simulation (see solve)
+
+    def start(self, solution):
+        with self._progress_lock:
+            self.solution = solution
+            self.N_timesteps = solution.N_timesteps
+
+    def update(self, timestep):
+        with self._progress_lock:
+            self.timesteps_done = timestep + 1
+        return not self._stop.is_set()
+
+    def _run(self, function, *args, **kwargs):
+        """Run the simulation function and set its result."""
+        if not self.set_running_or_notify_cancel():
+            return
+        try:
+            result = function(*args, monitor=self, **kwargs)
+        except BaseException as e:
+            self.set_exception(e)
+            return
+        with self._condition:
+            if not self._stop.is_set():
+                self.set_result(result)
+                return
+            self._set_cancelled()
+        self._invoke_callbacks()
+
+    def _set_cancelled(self):
+        """Cancel the running future once the simulation has stopped.
+
+        concurrent.futures.Future only cancels pending futures; this
+        does the same for a running one (see Future.cancel and
+        Future.set_running_or_notify_cancel). Must be called with
+        self._condition acquired.
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        """
+        self._state = concurrent.futures._base.CANCELLED_AND_NOTIFIED
+        for waiter in self._waiters:
+            waiter.add_cancelled(self)
+        self._condition.notify_all()
 
 
 class Solver:
@@ -445,15 +788,48 @@ class Solver:
             Solution instance which contains the time series of all system 
             quantities and can also plot them.
 
+    Args:
+        system (System): System that is simulated.
+        cache (CompilationCache or bool): Cache of the assembled static
+            rates used by all simulations (see solve). Defaults to None
+            (no caching).
+
     Attributes:
-        system (System): System which is simulated.
+        system_initial (System): System given by the user. Its masses are
+            the initial state of every simulation.
+        system (System): Clone of system_initial which is simulated. The
+            clone is replaced by a new one if the structure of
+            system_initial changed since it was cloned (see solve).
+        cache (CompilationCache or bool): See Args.
 
     """
 
-    def __init__(self, system):
+    def __init__(self, system, cache=None):
         self.system_initial = system
+        self.cache = cache
+        self._clone_system()
 
-    def solve(self, total_integration_time, dt, debug=False):
+    def _get_structure(self):
+        """Return all properties of system_initial that a clone copies.
+
+        Apart from the masses, these are the topology, conditions and
+        static rates (see cache.get_model_hash), the UserFunctions, and
+        the settings of the incremental evaluation and profiling.
+
+        """
+        system = self.system_initial
+        evaluator = system.incremental_evaluator
+        return (bs_cache.get_model_hash(system),
+                system._get_user_functions(),
+                evaluator and (evaluator.rtol, evaluator.atol),
+                system.profiler is not None)
+
+    def _clone_system(self):
+        self.system = self.system_initial.clone()
+        self._structure = self._get_structure()
+
+    def solve(self, total_integration_time, dt, debug=False,
+            step_timings=False, verbose=True):
         """Simulate the time evolution of all variables within the system.
 
         Collect all information about the system, create differential 
@@ -475,116 +851,68 @@ class Solver:
                 there can arise numerical instabilites!
             debug (bool): Activates debugging mode (pdb.set_trace()).
                 Defaults to False.
+            step_timings (bool): If True, the time spent in every phase
+                is also recorded for every timestep. Defaults to False.
+            verbose (bool or int): Amount of printed information (see
+                function solve). Defaults to True.
+
+        Every simulation starts from the current state of system_initial:
+        its masses are copied to system, and if anything else changed
+        (e.g. rates, conditions, flows, or processes) system is cloned
+        again.
 
         """
-        # Start time of function
-        func_start_time = time_module.time()
+        if self._get_structure() != self._structure:
+            self._clone_system()
+        self.system.restore(self.system_initial.snapshot())
+        return solve(self.system, total_integration_time, dt, debug=debug,
+                step_timings=step_timings, verbose=verbose, cache=self.cache)
 
-        # Saves the time since the start of the simulate at which the last 
-        # save (pickling) was conducted
-        last_save_timedelta = 0  
+    def solve_async(self, total_integration_time, dt, step_timings=False,
+            executor=None):
+        """Start a simulation in the background and return a SolveFuture.
 
-        if debug:
-            pdb.set_trace()
-                
-        # Get number of time steps - round up if there is a remainder
-        N_timesteps = math.ceil(total_integration_time / dt)
-        # Recalculate total integration time based on the number of timesteps
-        total_integration_time = N_timesteps * dt
+        Every call simulates its own clone of system_initial, so several
+        simulations of the same Solver can run at the same time. Nothing
+        is printed during the simulation; use SolveFuture.progress and
+        SolveFuture.partial_solution to monitor it.
 
-        print('Start solving the BoxModelSystem...')
-        print('- total integration time: {}'.format(total_integration_time))
-        print('- dt (time step): {}'.format(dt))
-        print('- number of time steps: {}'.format(N_timesteps))
+        Args:
+            total_integration_time (pint.Quantity [T]): See solve.
+            dt (pint.Quantity [T]): See solve.
+            step_timings (bool): See solve. Defaults to False.
+            executor (concurrent.futures.ThreadPoolExecutor): Executor
+                that runs the simulation, e.g. to limit the number of
+                simultaneous simulations. Default: None (the simulation
+                runs in a new daemon thread).
 
-        time = total_integration_time * 0
-        self.system = copy.deepcopy(self.system_initial)
-        sol = bs_solution.Solution(self.system, N_timesteps, dt)
-
-        # Save initial state to solution
-        for box in self.system.box_list:
-            # sol.df.loc[0] = np.nan
-            sol.df.loc[0, (box.name,'mass')] = box.fluid.mass.magnitude
-            sol.df.loc[0, (box.name,'volume')] = \
-                    self.system.get_box_volume(box).magnitude
-            for variable in self.system.variable_list:
-                var_name = variable.name
-                sol.df.loc[0, (box.name,var_name)] = \
-                        box.variables[var_name].mass.magnitude
-
-        progress = 0
-        for timestep in range(N_timesteps):
-            # Calculate progress in percentage of processed timesteps
-            progress_old = progress
-            progress = int(float(timestep) / float(N_timesteps)*10) * 10.0
-            if progress != progress_old:
-                print("{}%".format(progress))
-                
-                # Check if simulation is running since more than a minute
-                # since the last save was conducted.
-                time_since_last_save = (time_module.time() - func_start_time 
-                        - last_save_timedelta)
-                if time_since_last_save > 6:
-                    last_save_timedelta = time_module.time() - func_start_time 
-                    self.save('{}_TS{}.pickle'.format(self.system.name, 
-                        timestep))
-
-            time += dt
-
-            ##################################################
-            # Calculate Mass fluxes
-            ##################################################
-
-            dm, f_flow = self._calculate_mass_flows(time, dt)
-
-            ##################################################
-            # Calculate Variable changes due to PROCESSES,
-            # REACTIONS, FUXES and FLOWS
-            ##################################################
-
-            dvar = self._calculate_changes_of_all_variables(
-                    time, dt, f_flow)
-
-            ##################################################
-            # Apply changes to Boxes and save values to
-            # Solution instance
-            ##################################################
-
-            for box in self.system.box_list:
-                # Write changes to box objects
-                box.fluid.mass += dm[box.id]
-
-                # Save mass to Solution instance
-                sol.df.loc[timestep, (box.name, 'mass')] = \
-                        box.fluid.mass.magnitude
-                sol.df.loc[timestep, (box.name, 'volume')] = \
-                        self.system.get_box_volume(box).magnitude
-
-                for variable in self.system.variable_list:
-                    var_name = variable.name
-                    self.system.boxes[box.name].variables[var_name].mass += \
-                            dvar[box.id, variable.id]
-                    sol.df.loc[timestep, (box.name,variable.name)] = \
-                            box.variables[variable.name].mass.magnitude
-
-        # End Time of Function
-        func_end_time = time_module.time()
-        print(
-            'Function "solve(...)" used {:3.3f}s'.format(
-                func_end_time - func_start_time))
-        return sol
+        """
+        future = SolveFuture()
+        args = (solve, self.system_initial.clone(), total_integration_time,
+                dt)
+        kwargs = dict(step_timings=step_timings, verbose=False,
+                cache=self.cache)
+        if executor is not None:
+            executor.submit(future._run, *args, **kwargs)
+        else:
+            thread = threading.Thread(target=future._run, args=args,
+                    kwargs=kwargs, daemon=True)
+            thread.start()
+        return future
 
 
     # PICKLING
 
     def save(self, file_name):
         """Pickle instance and save to file_name."""
+        import dill as pickle
         with open(file_name, 'wb') as f:
             pickle.dump(self, f)
 
     @classmethod
     def load(self, file_name):
         """Load pickled instance from file_name."""
+        import dill as pickle
         with open(file_name, 'rb') as f:
             solution = pickle.load(f)
             if not isinstance(solution, Solution):
@@ -592,223 +920,3 @@ class Solver:
                         'Loaded pickle object is not a Solution instance!')
         return solution
 
-
-    # HELPER functions
-
-    def _calculate_mass_flows(self, time, dt):
-        """Calculate mass changes of every box.
-
-        Args:
-            time (pint.Quantity [T]): Current time (age) of the system.
-            dt (pint.Quantity [T]): Timestep used.
-
-        Returns:
-            dm (numpy 1D array of pint.Quantities): Mass changes of every box.
-            f_flow (numpy 1D array): Reduction coefficient of the mass 
-                flows (due to becoming-empty boxes -> box mass cannot 
-                decrase below 0kg).
-
-        """
-        # f_flow is the reduction coefficent of the "sink-flows" of each box
-        # scaling factor for sinks of each box
-        f_flow = np.ones(self.system.N_boxes)
-        v1 = np.ones(self.system.N_boxes)
-
-        m_ini = self.system.get_fluid_mass_1Darray()
-
-        # get internal flow matrix and calculate the internal souce and sink 
-        # vectors. Also get the external sink and source vector
-        A = self.system.get_fluid_mass_internal_flow_2Darray(time)
-        # internal 
-        s_i = bs_utils.dot(A, v1)
-        q_i = bs_utils.dot(A.T, v1)
-        s_e = self.system.get_fluid_mass_flow_sink_1Darray(time)
-        q_e = self.system.get_fluid_mass_flow_source_1Darray(time)
-
-        # calculate first estimate of mass change vector
-        dm = (q_e + q_i - s_e - s_i) * dt
-        # calculate first estimate of mass after timestep
-        m = m_ini + dm
-
-        while np.any(m.magnitude < 0):
-            argmin = np.argmin(m)
-            # Calculate net sink and source and mass of the 'empty' box.
-            net_source = (q_e[argmin] + q_i[argmin])*dt
-            net_sink = (s_e[argmin] + s_i[argmin])*dt
-            available_mass = m_ini[argmin]
-            total_mass = (net_source + available_mass).to_base_units()
-
-            if total_mass.magnitude > 0: 
-                f_new = (total_mass / net_sink).to_base_units().magnitude 
-                f_flow[argmin] = min(f_new, f_flow[argmin] * 0.98)
-            else:
-                f_flow[argmin] = 0
-
-            # Apply reduction of sinks of the box
-            A = (A.T * f_flow).T
-            s_i = bs_utils.dot(A, v1)
-            q_i = bs_utils.dot(A.T, v1)
-            s_e = f_flow * s_e
-            dm = (q_e + q_i - s_e - s_i) * dt
-            m = m_ini + dm
-        return dm, f_flow
-
-    def _calculate_changes_of_all_variables(self, time, dt, f_flow):
-        """ Calculates the changes of all variable in every box.
-
-        Args:
-            time (pint.Quantity [T]): Current time (age) of the system.
-            dt (pint.Quantity [T]): Timestep used.
-            f_flow (numpy 1D array): Reduction coefficient of the mass flows 
-                due to empty boxes.
-
-        Returns:
-            dvar (numpy 2D array of pint.Quantities): Variables changes of 
-                every box. First dimension are the boxes, second dimension
-                are the variables.
-
-        """
-        # reduction coefficent of the "variable-sinks" of each box for the
-        # treated variable
-        # scaling factor for sinks of each box
-        f_var = np.ones([self.system.N_boxes, self.system.N_variables])
-        var_ini = bs_utils.stack([self.system.get_variable_mass_1Darray(
-            variable) for variable in self.system.variable_list], axis=-1)
-
-        while True:
-            dvar_list, net_sink_list, net_source_list = zip(*[self._get_dvar(
-                variable, time, dt, f_var, f_flow) 
-                for variable in self.system.variable_list])
-            dvar = bs_utils.stack(dvar_list, axis=-1)
-            net_sink = bs_utils.stack(net_sink_list, axis=-1)
-            net_source = bs_utils.stack(net_source_list, axis=-1)
-
-            var = (var_ini + dvar).to_base_units()
-            
-            net_sink[net_sink.magnitude == 0] = np.nan  # to evade division by zero
-
-            f_var_tmp = ((var_ini + net_source) / net_sink).magnitude 
-            f_var_tmp[np.isnan(f_var_tmp)] = 1
-            f_var_tmp[f_var_tmp > 1] = 1
-
-            # If any element of f_var_tmp is smaller than one this means that
-            # for at least one variable in one box the sinks are bigger than
-            # the sum of the source and the already present variable mass.
-            # Thus: The mass of this variable would fall below zero!
-            # Reduce the sinks proportional to the ratio of the sources and 
-            # the already present variable mass to the sinks.
-            if np.any(f_var_tmp < 1):
-                # To be sure that the sinks are reduced enough and to 
-                # evade any rouding errors the reduction ratio of the sinks
-                # (f_var_tmp) is further decreased by a very small number.
-                f_var_tmp[f_var_tmp < 1] -= 1e-15 # np.nextafter(0, 1)
-                f_var *= f_var_tmp
-            else:
-                break
-        return dvar
-
-    def _get_sink_source_flow(self, variable, time, dt, f_var, f_flow):
-        v1 = np.ones(self.system.N_boxes)
-        flows = self.system.flows
-        A_flow = self.system.get_variable_internal_flow_2Darray(variable, 
-                time, f_flow, flows)
-        A_flow = (A_flow.T * f_var[:, variable.id]).T
-        s_flow_i = bs_utils.dot(A_flow, v1)
-        q_flow_i = bs_utils.dot(A_flow.T, v1)
-        s_flow_e = self.system.get_variable_flow_sink_1Darray(variable, 
-                time, f_flow, flows)
-        s_flow_e = self.system.get_variable_flow_sink_1Darray(variable, 
-                time, f_flow, flows) * f_var[:, variable.id]
-
-        q_flow_e = self.system.get_variable_flow_source_1Darray(variable,
-                time, flows)
-        sink_flow = ((s_flow_i + s_flow_e) * dt).to_base_units()
-        source_flow = ((q_flow_i + q_flow_e) * dt).to_base_units()
-        return sink_flow, source_flow
-
-    def _get_sink_source_flux(self, variable, time, dt, f_var):
-        v1 = np.ones(self.system.N_boxes)
-        fluxes = self.system.fluxes
-        A_flux = self.system.get_variable_internal_flux_2Darray(variable,
-                time, fluxes)
-        A_flux = (A_flux.T * f_var[:, variable.id]).T
-        s_flux_i = bs_utils.dot(A_flux, v1)
-        q_flux_i = bs_utils.dot(A_flux.T, v1)
-        s_flux_e = self.system.get_variable_flux_sink_1Darray(variable, 
-                time, fluxes)
-        s_flux_e = self.system.get_variable_flux_sink_1Darray(variable, 
-                time, fluxes) * f_var[:, variable.id]
-
-        q_flux_e = self.system.get_variable_flux_source_1Darray(variable,
-                time, fluxes)
-        sink_flux = ((s_flux_i + s_flux_e) * dt).to_base_units()
-        source_flux = ((q_flux_i + q_flux_e) * dt).to_base_units()
-        dvar_flux = source_flux - sink_flux
-        return sink_flux, source_flux
-
-    def _get_sink_source_process(self, variable, time, dt, f_var):
-        processes = self.system.processes
-        s_process = self.system.get_variable_process_sink_1Darray(variable, 
-                time, processes)
-        s_process = self.system.get_variable_process_sink_1Darray(variable, 
-                time, processes) * f_var[:, variable.id]
-        q_process = self.system.get_variable_process_source_1Darray(variable,
-                time, processes)
-        sink_process = (s_process * dt).to_base_units()
-        source_process = (q_process * dt).to_base_units()
-        return sink_process, source_process
-
-    def _get_sink_source_reaction(self, variable, time, dt, f_var):
-        reactions = self.system.reactions
-        rr_cube = self.system.get_reaction_rate_3Darray(time, reactions)
-
-        ## APPLY CORRECTIONS HERE!
-        if np.any(f_var < 1):
-            f_rr_cube = np.ones_like(rr_cube)
-            for index in np.argwhere(f_var < 1):
-                reduction_factor = f_var[tuple(index)]
-                box = self.system.box_list[index[0]]
-                box_name = box.name
-                variable_name = self.system.variable_list[index[1]].name
-                sink_reaction_indecies = np.argwhere(rr_cube[index[0], index[1], :].magnitude < 0)
-                sink_reaction_indecies = list(sink_reaction_indecies.flatten())
-
-                for sink_reaction_index in sink_reaction_indecies:
-                    if f_rr_cube[index[0], index[1], sink_reaction_index] > reduction_factor:
-                        f_rr_cube[index[0], :, sink_reaction_index] = reduction_factor
-            rr_cube *= f_rr_cube
-
-
-        # Set all positive values to 0
-        sink_rr_cube = np.absolute(rr_cube.magnitude.clip(max=0)) * rr_cube.units
-        # Set all negative values to 0
-        source_rr_cube = rr_cube.magnitude.clip(min=0) * rr_cube.units
-        s_reaction = sink_rr_cube.sum(axis=2)[:, variable.id]
-        q_reaction = source_rr_cube.sum(axis=2)[:, variable.id]
-        
-        sink_reaction = (s_reaction * dt).to_base_units()
-        source_reaction = (q_reaction * dt).to_base_units()
-        return sink_reaction, source_reaction
-
-    def _get_dvar(self, variable, time, dt, f_var, f_flow):
-        # Get variables sources (q) and sinks (s)
-        # i=internal, e=external
-
-        sink_flow, source_flow = self._get_sink_source_flow(variable, 
-                time, dt, f_var, f_flow)
-        sink_flux, source_flux = self._get_sink_source_flux(variable, 
-                time, dt, f_var)
-        sink_process, source_process = self._get_sink_source_process(
-                variable, time, dt, f_var)
-        sink_reaction, source_reaction = self._get_sink_source_reaction(
-                variable, time, dt, f_var)
-
-        net_sink = sink_flow + sink_flux + sink_process + sink_reaction
-        net_source = (source_flow + source_flux + source_process + 
-                source_reaction)
-        
-        net_sink = net_sink.to_base_units()
-        net_source = net_source.to_base_units()
-        dvar = (net_source - net_sink).to_base_units()
-        return dvar, net_sink, net_source
-
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk storage of the time series of a Solution.
+
+A solution file consists of a fixed-size preamble, a JSON header with the
+axes of the solution (boxes, quantities, time) and the raw binary arrays:
+
+    MAGIC (16 bytes) | header length (8 bytes, little-endian uint64) |
+    JSON header | padding | arrays
+
+The first array is the time axis (N_timesteps). For every quantity (fluid
+mass, volume and the mass of every variable) there is one 2D array
+(N_boxes, N_timesteps), thus the time series of one box and quantity is
+stored contiguously. The arrays are mapped into memory with numpy.memmap
+when the file is opened; only the parts of the arrays that are actually
+accessed are read from disk.
+
+The arrays of the quantities can be stored with reduced precision
+(float32 instead of float64, selectable per quantity) and/or compressed
+losslessly (zlib or lzma). A compressed array is split into chunks of
+chunk_size timesteps of one box. Every chunk is delta-encoded (the
+differences of the consecutive bit patterns, viewed as unsigned integers,
+which is exactly invertible), byte-shuffled (all first bytes, then all
+second bytes...) and compressed. Smooth time series have small deltas and
+thus compress well. The offsets of the chunks are stored in an index
+array; reading a part of a compressed array only decompresses the chunks
+that contain the requested timesteps.
+
+"""
+
+import json
+import lzma
+import zlib
+import struct
+
+import numpy as np
+
+
+MAGIC = b'\x93BOXSIMU-SOL\x00\x00\x00\x00'
+VERSION = 2
+
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+# Default number of timesteps per compressed chunk
+CHUNK_SIZE = 4096
+
+# All arrays start at a multiple of ALIGNMENT bytes
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<16sQ')
+
+
+def is_solution_file(file_name):
+    """Return True if file_name is a solution file (see module doc)."""
+    with open(file_name, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _get_uint_dtype(dtype):
+    return np.dtype('<u{}'.format(dtype.itemsize))
+
+
+def _encode_chunk(values, compression):
+    """Delta-encode, byte-shuffle and compress a 1D array."""
+    bits = values.view(_get_uint_dtype(values.dtype))
+    deltas = np.diff(bits, prepend=bits.dtype.type(0))
+    shuffled = deltas.view(np.uint8).reshape(-1, values.itemsize).T
+    return COMPRESSORS[compression][0](shuffled.tobytes())
+
+
+def _decode_chunk(data, dtype, compression):
+    """Inverse of _encode_chunk."""
+    shuffled = np.frombuffer(COMPRESSORS[compression][1](data),
+            dtype=np.uint8)
+    deltas = shuffled.reshape(dtype.itemsize, -1).T.copy().view(
+            _get_uint_dtype(dtype)).ravel()
+    return np.cumsum(deltas, dtype=deltas.dtype).view(dtype)
+
+
+def _compress_array(values, compression, chunk_size):
+    """Return the compressed chunks of a 2D array (row by row)."""
+    N_chunks = -(-values.shape[1] // chunk_size)
+    return [_encode_chunk(row[i*chunk_size:(i+1)*chunk_size], compression)
+            for row in values for i in range(N_chunks)]
+
+
+def write_solution_file(file_name, header, time_array, arrays, dtypes=None,
+        compression=None, chunk_size=CHUNK_SIZE):
+    """Write the axes and time series of a solution to file_name.
+
+    Args:
+        file_name (str): Name of the file.
+        header (dict): JSON-serializable meta-information (box_names,
+            quantities, units...).
+        time_array (numpy 1D array): Time axis (always stored as float64).
+        arrays (dict of numpy 2D array): Quantity -> values of all boxes
+            (rows) and timesteps (columns).
+        dtypes (dict): Quantity -> storage dtype ('float64' or
+            'float32'). Default: float64 for all quantities.
+        compression (str): None (default), 'zlib' or 'lzma'.
+        chunk_size (int): Number of timesteps per compressed chunk.
+
+    """
+    dtypes = dtypes or {}
+    if compression is not None and compression not in COMPRESSORS:
+        raise ValueError('Unknown compression: {}'.format(compression))
+
+    blocks = [('time', np.ascontiguousarray(time_array, dtype='<f8'), None)]
+    for quantity, values in arrays.items():
+        dtype = np.dtype(dtypes.get(quantity, 'float64')).newbyteorder('<')
+        if dtype.kind != 'f':
+            raise ValueError('Storage dtype of {} must be a float type, '
+                    'not {}.'.format(quantity, dtype))
+        blocks.append((quantity, np.ascontiguousarray(values, dtype=dtype),
+            compression))
+
+    # Offsets are relative to the start of the array section
+    offset = 0
+    array_headers = {}
+    contents = []
+    for name, values, block_compression in blocks:
+        array_header = {'offset': offset, 'dtype': values.dtype.str,
+                'shape': list(values.shape)}
+        if block_compression is None:
+            content = values.tobytes()
+        else:
+            chunks = _compress_array(values, block_compression, chunk_size)
+            index = np.cumsum([0] + [len(chunk) for chunk in chunks],
+                    dtype='<u8')
+            array_header.update({'compression': block_compression,
+                'chunk_size': chunk_size, 'index_offset': offset})
+            content = index.tobytes() + b''.join(chunks)
+            array_header['offset'] = offset + index.nbytes
+        array_headers[name] = array_header
+        contents.append((offset, content))
+        offset = _align(offset + len(content))
+    header = dict(header, format='boxsimu-solution', version=VERSION,
+            arrays=array_headers)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    start = _align(_PREAMBLE.size + len(header_bytes))
+    with open(file_name, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        for content_offset, content in contents:
+            f.seek(start + content_offset)
+            f.write(content)
+        f.truncate(start + offset)
+
+
+class SolutionFile:
+    """Solution file opened for lazy reading.
+
+    Args:
+        file_name (str): Name of the solution file.
+
+    Attributes:
+        header (dict): JSON header of the file.
+        box_names (list of str): Names of the boxes (rows of the arrays).
+        quantities (list of str): Names of the quantities.
+        time_array (numpy.memmap): Time axis.
+
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            magic, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a solution file!'.format(
+                    file_name))
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+        if self.header['version'] > VERSION:
+            raise ValueError('Solution file version {} is not supported '
+                    '(newest supported version: {}).'.format(
+                        self.header['version'], VERSION))
+        self._start = _align(_PREAMBLE.size + header_length)
+        self._arrays = {}
+
+        self.box_names = self.header['box_names']
+        self.quantities = self.header['quantities']
+        self.time_array = self.get_array('time')
+
+    def get_array(self, name):
+        """Return the memory-mapped array name (e.g. a quantity).
+
+        Compressed arrays cannot be memory-mapped; they are decompressed
+        completely (use read to decompress only some chunks).
+
+        """
+        if name not in self._arrays:
+            array_header = self.header['arrays'][name]
+            if 'compression' in array_header:
+                N_boxes, N_timesteps = array_header['shape']
+                return self._read_compressed(name, range(N_boxes),
+                        slice(None))
+            self._arrays[name] = np.memmap(self.file_name,
+                    dtype=np.dtype(array_header['dtype']), mode='r',
+                    offset=self._start + array_header['offset'],
+                    shape=tuple(array_header['shape']))
+        return self._arrays[name]
+
+    def _get_index(self, name):
+        """Return the offsets of the compressed chunks of array name."""
+        key = name + '/index'
+        if key not in self._arrays:
+            array_header = self.header['arrays'][name]
+            N_boxes, N_timesteps = array_header['shape']
+            N_chunks = -(-N_timesteps // array_header['chunk_size'])
+            self._arrays[key] = np.memmap(self.file_name, dtype='<u8',
+                    mode='r', offset=self._start +
+                    array_header['index_offset'],
+                    shape=(N_boxes * N_chunks + 1,))
+        return self._arrays[key]
+
+    def _read_compressed(self, name, box_ids, timesteps):
+        """Decompress the chunks of array name that contain timesteps."""
+        array_header = self.header['arrays'][name]
+        N_boxes, N_timesteps = array_header['shape']
+        chunk_size = array_header['chunk_size']
+        N_chunks = -(-N_timesteps // chunk_size)
+        dtype = np.dtype(array_header['dtype'])
+        timesteps = np.arange(N_timesteps)[timesteps]
+        if len(timesteps):
+            first = timesteps.min() // chunk_size
+            last = timesteps.max() // chunk_size
+        else:
+            first, last = 0, -1
+        index = self._get_index(name)
+
+        values = np.empty((len(box_ids), len(timesteps)), dtype=dtype)
+        with open(self.file_name, 'rb') as f:
+            for i, box_id in enumerate(box_ids):
+                chunks = []
+                for chunk_id in range(box_id * N_chunks + first,
+                        box_id * N_chunks + last + 1):
+                    f.seek(self._start + array_header['offset'] +
+                            int(index[chunk_id]))
+                    chunks.append(_decode_chunk(f.read(int(
+                        index[chunk_id+1] - index[chunk_id])), dtype,
+                        array_header['compression']))
+                if chunks:
+                    values[i] = np.concatenate(chunks)[
+                            timesteps - first * chunk_size]
+        return values
+
+    def read(self, box_ids, quantity_ids, timesteps):
+        """Read the values of some boxes, quantities and timesteps.
+
+        Args:
+            box_ids (list of int): Rows to read.
+            quantity_ids (list of int): Indices of the quantities to read.
+            timesteps (slice or numpy 1D array of int): Timesteps to read.
+
+        Returns:
+            values (numpy 3D array): Values with shape (len(box_ids),
+                len(quantity_ids), number of timesteps).
+
+        """
+        values = []
+        for quantity_id in quantity_ids:
+            name = self.quantities[quantity_id]
+            if 'compression' in self.header['arrays'][name]:
+                values.append(self._read_compressed(name, box_ids,
+                    timesteps))
+                continue
+            array = self.get_array(name)
+            if isinstance(timesteps, slice):
+                # Slicing first does not read anything (memmap view)
+                values.append(array[:, timesteps][box_ids])
+            else:
+                values.append(array[box_ids][:, timesteps])
+        return np.stack(values, axis=1).astype(float)
@@ -6,23 +6,28 @@ Created on Thu Jun 23 2016 10:37UTC
 
 """
 
-import pdb
 import re
 import random
 import copy
 import time as time_module
 import numpy as np
-import matplotlib.pyplot as plt
 from attrdict import AttrDict
 
 # import all submodules with prefix 'bs' (short for BoxSimu)
 from . import box as bs_box
 from . import condition as bs_condition
+from . import context as bs_context
 from . import descriptors as bs_descriptors
+from . import function as bs_function
+from . import incremental as bs_incremental
+from . import model as bs_model
+from . import profiling as bs_profiling
 from . import validation as bs_validation
 from . import process as bs_process
 from . import solution as bs_solution
 from . import solver as bs_solver
+from . import topology as bs_topology
+from . import tracing as bs_tracing
 from . import transport as bs_transport
 from . import utils as bs_utils
 from . import visualize as bs_visualize
@@ -57,6 +62,11 @@ class BoxModelSystem:
         fluxes (list of Flux): Variable exchange of the Boxes.
         global_condition (Condition): Default conditions for all boxes
             of the system.
+        state (numpy 2D array): Fluid and variable masses [kg] of all
+            boxes. Rows are the boxes (ordered by id), column 0 is the
+            fluid and column 1+variable.id the variables. The mass
+            attributes of the fluids and variables of the boxes are views
+            of this array; it must only be modified in-place.
 
     """
     name = bs_descriptors.ImmutableIdentifierDescriptor('name')
@@ -88,11 +98,11 @@ class BoxModelSystem:
                 self.fluxes)
         flow_flux_boxes = flow_boxes + flux_boxes
         for b in flow_flux_boxes:
-            if b not in self.box_list:
+            # Boxes are equal if their names are equal
+            if b.name not in self.boxes:
                 raise ValueError('All boxes that are sources or targets '
                         'of flows or fluxes must be added to the system.')
-        if not description:
-            self.description = name
+        self.description = description or name
 
     def init_system(self):
         """Define all variables in all boxes and set variable and box ids.
@@ -111,6 +121,9 @@ class BoxModelSystem:
         if len(self.boxes.keys()) != len(set(self.boxes.keys())):
             raise ValueError('Box names have to be unique!')
 
+        # The topology index is rebuilt after the ids are set
+        self.topology = None
+
         self.box_names = list(self.boxes.keys())
         self.box_names.sort()
         self.processes = list(set([process
@@ -131,9 +144,27 @@ class BoxModelSystem:
 
         # Set variable and box ID's for every variable in every box
         self._set_box_and_variable_ids()
+        self.topology = bs_topology.TopologyIndex(self)
+        self._init_state()
+
+        # Context views merge the box/transport and the global conditions
+        for box_name, box in self.boxes.items():
+            box.init_context(self)
+        for transport in self.flows + self.fluxes:
+            transport.init_context(self)
+
+        # Dependencies of the rates are traced on demand
+        self._dependency_graph = None
+        self.incremental_evaluator = None
+        if getattr(self, 'profiler', None):
+            self.disable_profiling()
+        self.profiler = None
+
+        # SVG renderers per layout, which keep the cached box positions
+        self._svg_renderers = {}
 
     def _get_variable_attr_dict(self):
-        """Return a deepcopy of every type of variable found in the system."""
+        """Return an empty copy of every type of variable in the system."""
         tmp_variable_list = []
         for box_name, box in self.boxes.items():
             tmp_variable_list += [var for var_name,
@@ -150,9 +181,7 @@ class BoxModelSystem:
         var_attr_dict = AttrDict()
         for var in tmp_variable_list:
             if var.name not in var_attr_dict.keys():
-                var_copy = copy.deepcopy(var)
-                var_copy.mass = 0 * self.pint_ur.kg
-                var_attr_dict[var_copy.name] = var_copy
+                var_attr_dict[var.name] = var.q(0 * self.pint_ur.kg)
         return var_attr_dict
 
     def _set_box_and_variable_ids(self):
@@ -179,44 +208,138 @@ class BoxModelSystem:
         for var_name in var_names:
             for box_name, box in self.boxes.items():
                 if var_name not in box.variables.keys():
-                    box.variables[var_name] = copy.deepcopy(
-                        self.variables[var_name])
+                    box.variables[var_name] = self.variables[var_name].q(
+                            0 * self.pint_ur.kg)
                 box.variables[var_name].id = var_id
             self.variables[var_name].id = var_id
             var_id += 1
 
+    def _init_state(self):
+        """Create the state array and bind all fluid/variable masses to it."""
+        state = np.zeros((self.N_boxes, 1 + self.N_variables))
+        bound = set()
+        for box in self.box_list:
+            if box.fluid is not None:
+                if id(box.fluid) in bound:
+                    # Every box needs its own fluid instance
+                    box.fluid = copy.deepcopy(box.fluid)
+                box.fluid.unbind_state()
+                box.fluid.bind_state(state, (box.id, 0))
+                bound.add(id(box.fluid))
+            for variable in self.variable_list:
+                box_variable = box.variables[variable.name]
+                box_variable.unbind_state()
+                box_variable.bind_state(state, (box.id, 1 + variable.id))
+                bound.add(id(box_variable))
+        self.state = state
+
+    def set_state(self, state):
+        """Overwrite the fluid and variable masses of all boxes.
+
+        Args:
+            state (numpy 2D array): New masses [kg]; same shape as the
+                state attribute.
+
+        """
+        state = np.asarray(state, dtype=float)
+        if state.shape != self.state.shape:
+            raise ValueError('State must have shape {}.'.format(
+                self.state.shape))
+        self.state[...] = state
+
+    def snapshot(self):
+        """Return a copy of the state array (see restore).
+
+        The snapshot contains all fluid and variable masses, thus all the
+        mutable state of the system that changes during a simulation.
+
+        """
+        return self.state.copy()
+
+    def restore(self, snapshot):
+        """Reset all fluid and variable masses to a snapshot.
+
+        Args:
+            snapshot (numpy 2D array): State array returned by snapshot.
+
+        """
+        self.set_state(snapshot)
+
+    def clone(self):
+        """Return an independent copy of the system.
+
+        Boxes, entities and transports are copied and bound to a copy of
+        the state array. User-defined functions and the read-only arrays
+        of the topology are shared with this system. If incremental
+        evaluation is enabled, the clone gets its own evaluator. If
+        profiling is enabled, the user-defined functions are copied
+        (their calls are recorded by the profiler of one system).
+
+        """
+        memo = {}
+        for value in vars(self.topology).values():
+            if isinstance(value, np.ndarray):
+                memo[id(value)] = value
+        evaluator = self.incremental_evaluator
+        if evaluator:
+            # The cache entries of the evaluator belong to this system
+            memo[id(evaluator)] = None
+        if not self.profiler:
+            for user_function in self._get_user_functions():
+                memo[id(user_function)] = user_function
+        system = copy.deepcopy(self, memo)
+        if evaluator:
+            system.enable_incremental_evaluation(evaluator.rtol,
+                    evaluator.atol)
+        if self.profiler:
+            system.enable_profiling()
+        return system
+
+    def _get_user_functions(self):
+        """Return all UserFunctions of fluids, processes and transports."""
+        owners = [box.fluid for box in self.box_list if box.fluid]
+        owners += self.processes + self.reactions + self.flows + self.fluxes
+        user_functions = []
+        for owner in owners:
+            for value in vars(owner).values():
+                values = value.values() if isinstance(value, dict) else [value]
+                user_functions += [v for v in values
+                        if isinstance(v, bs_function.UserFunction)]
+        return user_functions
+
     @property
     def box_list(self):
-        return [self.boxes[box_name] for box_name in self.box_names]
+        return self.topology.box_list
 
     @property
     def variable_list(self):
-        return [self.variables[variable_name]
-                for variable_name in self.variable_names]
+        return self.topology.variable_list
 
     @property
     def N_boxes(self):
-        return len(self.boxes)
+        return self.topology.N_boxes
 
     @property
     def N_variables(self):
-        return len(self.variables)
+        return self.topology.N_variables
 
     @property
     def pint_ur(self):
-        pint_ur = None
+        if self.topology is not None:
+            return self.topology.pint_ur
+        return self._find_pint_ur()
 
+    def _find_pint_ur(self):
+        """Return the pint registry used by the boxes of the system."""
         # Get pint registry from fluid masses (because at least one box
         # must exist and must have a fluid associated with a valid mass)
-        for box in self.box_list:
-            if not pint_ur:
-                pint_ur = box.fluid.mass._REGISTRY
-        return pint_ur
+        for box_name, box in self.boxes.items():
+            return box.fluid.mass._REGISTRY
 
     def get_variable_mobility_bool_1Darray(self, variable, time):
         """Return mobility (True, False) of the variable in every box."""
         mobility = np.zeros(self.N_boxes)
-        for box_name, box in self.boxes.items():
+        for box in self.box_list:
             mobility[box.id] = variable.is_mobile(time, box.context, self)
         return mobility
 
@@ -237,6 +360,90 @@ class BoxModelSystem:
         """Return current box_volume of Box."""
         return box.get_volume(None, self)
 
+    def get_box_context(self, box=None, magnitudes=False):
+        """Return the context of box (or of the system if box is None).
+
+        Args:
+            box (Box): Box whose context is returned. Default: None.
+            magnitudes (bool): If True, the context returns all values as
+                floats (magnitudes in base units) instead of pint
+                Quantities. Default: False.
+
+        """
+        if box is not None and not magnitudes:
+            return self.boxes[box.name].context
+        if box is not None:
+            box = self.boxes[box.name]
+        return bs_context.BoxContext(box, self, magnitudes)
+
+
+    #####################################################
+    # Transport lookups
+    #####################################################
+
+    def get_flows_from(self, box):
+        """Return all flows that leave box (or come from outside if None)."""
+        topology = self.topology
+        if box is None:
+            flow_ids = topology.source_flow_ids
+        else:
+            flow_ids = topology.outgoing_flow_ids[topology.box_ids[box.name]]
+        return [self.flows[i] for i in flow_ids]
+
+    def get_flows_to(self, box):
+        """Return all flows that enter box (or leave the system if None)."""
+        topology = self.topology
+        if box is None:
+            flow_ids = topology.sink_flow_ids
+        else:
+            flow_ids = topology.incoming_flow_ids[topology.box_ids[box.name]]
+        return [self.flows[i] for i in flow_ids]
+
+    def get_fluxes_from(self, box):
+        """Return all fluxes that leave box (or come from outside if None)."""
+        topology = self.topology
+        if box is None:
+            flux_ids = topology.source_flux_ids
+        else:
+            flux_ids = topology.outgoing_flux_ids[topology.box_ids[box.name]]
+        return [self.fluxes[i] for i in flux_ids]
+
+    def get_fluxes_to(self, box):
+        """Return all fluxes that enter box (or leave the system if None)."""
+        topology = self.topology
+        if box is None:
+            flux_ids = topology.sink_flux_ids
+        else:
+            flux_ids = topology.incoming_flux_ids[topology.box_ids[box.name]]
+        return [self.fluxes[i] for i in flux_ids]
+
+    def get_variable_flux_ids(self, variable):
+        """Return the ids (index in fluxes) of all fluxes of variable."""
+        topology = self.topology
+        return topology.variable_flux_ids[topology.variable_ids[variable.name]]
+
+    def get_variable_fluxes(self, variable):
+        """Return all fluxes of variable."""
+        return [self.fluxes[i] for i in self.get_variable_flux_ids(variable)]
+
+    def _select_transports(self, transport_ids, all_transports,
+            transports=None):
+        """Return the transports with transport_ids that are in transports.
+
+        Args:
+            transport_ids (tuple of int): Indices in all_transports (from
+                the topology index).
+            all_transports (list): self.flows or self.fluxes.
+            transports (list): Transports that should be considered. If
+                None, all transports are considered.
+
+        """
+        selected = [all_transports[i] for i in transport_ids]
+        if transports is None or transports is all_transports:
+            return selected
+        considered = set(id(t) for t in transports)
+        return [t for t in selected if id(t) in considered]
+
 
     #####################################################
     # Fluid and Variable Mass/Concentration Vectors/Matrices
@@ -244,18 +451,7 @@ class BoxModelSystem:
 
     def get_fluid_mass_1Darray(self):
         """Return fluid masses of all boxes."""
-        m = np.zeros(self.N_boxes)
-
-        units = []
-        for box_name, box in self.boxes.items():
-            fluid_mass = box.fluid.mass.to_base_units()
-            bs_validation.raise_if_not_mass(fluid_mass)
-            units.append(fluid_mass.units)
-            m[box.id] = fluid_mass.magnitude
-
-        default_units = self.pint_ur.kg
-        m_units = bs_validation.get_single_shared_unit(units, default_units)
-        return m * m_units
+        return self.state[:, 0] * self.topology.mass_units
 
     def get_variable_mass_1Darray(self, variable):
         """Return masses of variable of all boxes.
@@ -265,18 +461,16 @@ class BoxModelSystem:
                 be returned.
 
         """
-        m = np.zeros(self.N_boxes)
+        column = 1 + self.topology.variable_ids[variable.name]
+        return self.state[:, column] * self.topology.mass_units
 
-        units = []
-        for box_name, box in self.boxes.items():
-            variable_mass = box.variables[variable.name].mass.to_base_units()
-            bs_validation.raise_if_not_mass(variable_mass)
-            units.append(variable_mass.units)
-            m[box.id] = variable_mass.magnitude
+    def get_variable_mass_2Darray(self):
+        """Return masses of all variables of all boxes.
+
+        First dimension are the boxes, second dimension the variables.
 
-        default_units = self.pint_ur.kg
-        m_units = bs_validation.get_single_shared_unit(units, default_units)
-        return m * m_units
+        """
+        return self.state[:, 1:] * self.topology.mass_units
 
     def get_variable_concentration_1Darray(self, variable):
         """Return concentration [M/M] of variable of all boxes.
@@ -286,22 +480,13 @@ class BoxModelSystem:
                 should be returned.
 
         """
+        column = 1 + self.topology.variable_ids[variable.name]
+        fluid_mass = self.state[:, 0]
+        variable_mass = self.state[:, column]
         c = np.zeros(self.N_boxes)
-
-        units = []
-        for box_name, box in self.boxes.items():
-            variable_mass = box.variables[variable.name].mass
-            if box.fluid.mass.magnitude == 0 or variable_mass.magnitude == 0:
-                concentration = 0 * self.pint_ur.dimensionless
-            else:
-                concentration = (variable_mass / box.fluid.mass).to_base_units()
-            bs_validation.raise_if_not_dimless(concentration)
-            units.append(concentration.units)
-            c[box.id] = concentration.magnitude
-
-        default_units = self.pint_ur.dimensionless
-        c_units = bs_validation.get_single_shared_unit(units, default_units)
-        return c * c_units
+        nonzero = (fluid_mass != 0) & (variable_mass != 0)
+        c[nonzero] = variable_mass[nonzero] / fluid_mass[nonzero]
+        return c * self.topology.dimensionless_units
 
     def get_variable_flow_concentration_1Darray(self, variable, time):
         """Return the concentration within the ouflow from a box.
@@ -344,20 +529,20 @@ class BoxModelSystem:
 
         """
         A = np.zeros([self.N_boxes, self.N_boxes])
-        flows = flows or self.flows
+        flows = flows if flows is not None else self.flows
 
         units = []
         for flow in flows:
             if flow.source_box is None or flow.target_box is None:
                 continue
-            fluid_flow_rate = flow(time, flow.context,
-                    self).to_base_units()
+            fluid_flow_rate = bs_validation.to_base_units(flow(time,
+                    flow.context, self))
             bs_validation.raise_if_not_mass_per_time(fluid_flow_rate)
             units.append(fluid_flow_rate.units)
             A[flow.source_box.id, flow.target_box.id] += \
                     fluid_flow_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         A_units = bs_validation.get_single_shared_unit(units, default_units)
         return A * A_units
 
@@ -377,17 +562,18 @@ class BoxModelSystem:
 
         """
         s = np.zeros(self.N_boxes)
-        flows = flows or self.flows
-        flows = bs_transport.Flow.get_all_to(None, flows)
+        flows = self._select_transports(self.topology.sink_flow_ids,
+                self.flows, flows)
 
         units = []
         for flow in flows:
-            fluid_flow_rate = flow(time, flow.context, self).to_base_units()
+            fluid_flow_rate = bs_validation.to_base_units(flow(time,
+                    flow.context, self))
             bs_validation.raise_if_not_mass_per_time(fluid_flow_rate)
             units.append(fluid_flow_rate.units)
             s[flow.source_box.id] += fluid_flow_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         s_units = bs_validation.get_single_shared_unit(units, default_units)
         return s * s_units
 
@@ -407,17 +593,18 @@ class BoxModelSystem:
 
         """
         q = np.zeros(self.N_boxes)
-        flows = flows or self.flows
-        flows = bs_transport.Flow.get_all_from(None, flows)
+        flows = self._select_transports(self.topology.source_flow_ids,
+                self.flows, flows)
 
         units = []
         for flow in flows:
-            fluid_flow_rate = flow(time, flow.context, self).to_base_units()
+            fluid_flow_rate = bs_validation.to_base_units(flow(time,
+                    flow.context, self))
             bs_validation.raise_if_not_mass_per_time(fluid_flow_rate)
             units.append(fluid_flow_rate.units)
             q[flow.target_box.id] += fluid_flow_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         q_units = bs_validation.get_single_shared_unit(units, default_units)
         return q * q_units
 
@@ -451,7 +638,7 @@ class BoxModelSystem:
 
         """
         A = np.zeros([self.N_boxes, self.N_boxes])
-        flows = flows or self.flows
+        flows = flows if flows is not None else self.flows
         flows = [flow for flow in flows if flow.tracer_transport]
 
         flow_concentrations = self.get_variable_flow_concentration_1Darray(
@@ -461,20 +648,21 @@ class BoxModelSystem:
         for flow in flows:
             if flow.source_box is None or flow.target_box is None:
                 continue
-            fluid_flow_rate = flow(time, flow.context, self).to_base_units()
+            fluid_flow_rate = bs_validation.to_base_units(flow(time,
+                    flow.context, self))
             bs_validation.raise_if_not_mass_per_time(fluid_flow_rate)
             concentration = flow_concentrations[flow.source_box.id]
             bs_validation.raise_if_not_dimless(concentration)
 
 
-            variable_flow_rate = (fluid_flow_rate *
-                    concentration).to_base_units()
+            variable_flow_rate = bs_validation.to_base_units(fluid_flow_rate *
+                    concentration)
             bs_validation.raise_if_not_mass_per_time(variable_flow_rate)
             units.append(variable_flow_rate.units)
             A[flow.source_box.id, flow.target_box.id] += \
                     variable_flow_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         A_units = bs_validation.get_single_shared_unit(units, default_units)
         return A * A_units
 
@@ -503,9 +691,9 @@ class BoxModelSystem:
                 flows of the system are considered.
 
         """
-        flows = flows or self.flows
-        flows = [flow for flow in bs_transport.Flow.get_all_to(None, flows)
-                    if flow.tracer_transport]
+        flows = [flow for flow in self._select_transports(
+                self.topology.sink_flow_ids, self.flows, flows)
+                if flow.tracer_transport]
         fluid_flow_rates = self.get_fluid_mass_flow_sink_1Darray(time,
                 flows=flows) * f_flow
         concentration = self.get_variable_flow_concentration_1Darray(
@@ -539,22 +727,23 @@ class BoxModelSystem:
 
         """
         q = np.zeros(self.N_boxes)
-        flows = flows or self.flows
-        variable_flows = [f for f in flows
-                if variable in f.concentrations.keys()]
+        variable_id = self.topology.variable_ids[variable.name]
+        variable_flows = self._select_transports(
+                self.topology.variable_source_flow_ids[variable_id],
+                self.flows, flows)
 
         units = []
-        for flow in bs_transport.Flow.get_all_from(None, variable_flows):
+        for flow in variable_flows:
             flow_rate = flow(time, flow.context, self)
             flow_var_concentration = flow.concentrations[variable](time,
                     flow.context, self)
-            variable_flow_rate = (flow_rate *
-                    flow_var_concentration).to_base_units()
+            variable_flow_rate = bs_validation.to_base_units(flow_rate *
+                    flow_var_concentration)
             bs_validation.raise_if_not_mass_per_time(variable_flow_rate)
             units.append(variable_flow_rate.units)
             q[flow.target_box.id] += variable_flow_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         q_units = bs_validation.get_single_shared_unit(units, default_units)
         return q * q_units
 
@@ -580,20 +769,20 @@ class BoxModelSystem:
 
         """
         A = np.zeros([self.N_boxes, self.N_boxes])
-        fluxes = fluxes or self.fluxes
-        variable_fluxes = [flux for flux in fluxes
-                if variable == flux.variable]
+        variable_fluxes = self._select_transports(
+                self.get_variable_flux_ids(variable), self.fluxes, fluxes)
 
         units = []
         for flux in variable_fluxes:
             if flux.source_box is None or flux.target_box is None:
                 continue
-            flux_rate = flux(time, flux.context, self).to_base_units()
+            flux_rate = bs_validation.to_base_units(flux(time,
+                    flux.context, self))
             bs_validation.raise_if_not_mass_per_time(flux_rate)
             units.append(flux_rate.units)
             A[flux.source_box.id, flux.target_box.id] += flux_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         A_units = bs_validation.get_single_shared_unit(units, default_units)
         return A * A_units
 
@@ -614,18 +803,19 @@ class BoxModelSystem:
 
         """
         s = np.zeros(self.N_boxes)
-        fluxes = fluxes or self.fluxes
-        variable_fluxes = [flux for flux in bs_transport.Flux.get_all_to(
-            None, fluxes) if variable == flux.variable]
+        variable_fluxes = [flux for flux in self._select_transports(
+                self.get_variable_flux_ids(variable), self.fluxes, fluxes)
+                if flux.target_box is None]
 
         units = []
         for flux in variable_fluxes:
-            flux_rate = flux(time, flux.context, self).to_base_units()
+            flux_rate = bs_validation.to_base_units(flux(time,
+                    flux.context, self))
             bs_validation.raise_if_not_mass_per_time(flux_rate)
             units.append(flux_rate.units)
             s[flux.source_box.id] += flux_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         s_units = bs_validation.get_single_shared_unit(units, default_units)
         return s * s_units
 
@@ -646,19 +836,19 @@ class BoxModelSystem:
 
         """
         q = np.zeros(self.N_boxes)
-        fluxes = fluxes or self.fluxes
-        variable_fluxes = [flux for flux in bs_transport.Flux.get_all_from(
-            None, fluxes) if variable == flux.variable]
+        variable_fluxes = [flux for flux in self._select_transports(
+                self.get_variable_flux_ids(variable), self.fluxes, fluxes)
+                if flux.source_box is None]
 
         units = []
         for flux in variable_fluxes:
-            flux_rate = flux(time, flux.context, flux.source_box,
-                    self).to_base_units()
+            flux_rate = bs_validation.to_base_units(flux(time,
+                    flux.context, self))
             bs_validation.raise_if_not_mass_per_time(flux_rate)
             units.append(flux_rate.units)
             q[flux.target_box.id] += flux_rate.magnitude
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         q_units = bs_validation.get_single_shared_unit(units, default_units)
         return q * q_units
 
@@ -682,16 +872,18 @@ class BoxModelSystem:
 
         """
         s = np.zeros(self.N_boxes)
-        processes = processes or self.processes
-        variable_processes = [p for p in processes if variable == p.variable]
-        variable_process_names = [p.name for p in variable_processes]
+        topology = self.topology
+        processes = processes if processes is not None else self.processes
+        variable_id = topology.variable_ids[variable.name]
+        process_ids = set(topology.process_ids[p.name] for p in processes)
 
         units = []
-        for box_name, box in self.boxes.items():
-            box_processes = [p for p in box.processes
-                    if p.name in variable_process_names]
-            box_process_rates = [p(time, box.context, self).to_base_units()
-                    for p in box_processes]
+        for box in self.box_list:
+            box_processes = [p for p, i in zip(box.processes,
+                    topology.box_process_ids[box.id]) if i in process_ids
+                    and topology.process_variable_ids[i] == variable_id]
+            box_process_rates = [bs_validation.to_base_units(
+                    p(time, box.context, self)) for p in box_processes]
             for rate in box_process_rates:
                 bs_validation.raise_if_not_mass_per_time(rate)
                 units.append(rate.units)
@@ -702,7 +894,7 @@ class BoxModelSystem:
             except AttributeError:
                 s[box.id] += sum(sink_rates)
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         s_units = bs_validation.get_single_shared_unit(units, default_units)
         return s * s_units
 
@@ -723,16 +915,18 @@ class BoxModelSystem:
 
         """
         q = np.zeros(self.N_boxes)
-        processes = processes or self.processes
-        variable_processes = [p for p in processes if variable == p.variable]
-        variable_process_names = [p.name for p in variable_processes]
+        topology = self.topology
+        processes = processes if processes is not None else self.processes
+        variable_id = topology.variable_ids[variable.name]
+        process_ids = set(topology.process_ids[p.name] for p in processes)
 
         units = []
-        for box_name, box in self.boxes.items():
-            box_processes = [p for p in box.processes
-                    if p.name in variable_process_names]
-            box_process_rates = [p(time, box.context, self).to_base_units()
-                    for p in box_processes]
+        for box in self.box_list:
+            box_processes = [p for p, i in zip(box.processes,
+                    topology.box_process_ids[box.id]) if i in process_ids
+                    and topology.process_variable_ids[i] == variable_id]
+            box_process_rates = [bs_validation.to_base_units(
+                    p(time, box.context, self)) for p in box_processes]
             for rate in box_process_rates:
                 bs_validation.raise_if_not_mass_per_time(rate)
                 units.append(rate.units)
@@ -743,7 +937,7 @@ class BoxModelSystem:
             except AttributeError:
                 q[box.id] += sum(source_rates)
 
-        default_units = self.pint_ur.kg / self.pint_ur.second
+        default_units = self.topology.mass_rate_units
         q_units = bs_validation.get_single_shared_unit(units, default_units)
         return q * q_units
 
@@ -754,14 +948,14 @@ class BoxModelSystem:
         """Return reaction rates for all variables and boxes."""
         A = np.zeros([self.N_boxes, self.N_variables])
 
-        units = []
-        for box in self.box_list:
-            if not reaction in box.reactions:
-                continue
+        topology = self.topology
+        reaction_id = topology.reaction_ids[reaction.name]
+        for box_id in topology.reaction_box_ids[reaction_id]:
+            box = topology.box_list[box_id]
             reaction_rates = [r.magnitude for r in reaction(
                 time, box.context, self, self.variable_list)]
-            A[box.id, :] = reaction_rates
-        return A * ur.kg/ur.second
+            A[box_id, :] = reaction_rates
+        return A * topology.mass_rate_units
 
 
     def get_reaction_rate_3Darray(self, time, reactions=None):
@@ -793,12 +987,12 @@ class BoxModelSystem:
 
         """
         # Initialize cube (minimal lenght of the axis of reactions is one)
-        reactions = reactions or self.reactions
+        reactions = reactions if reactions is not None else self.reactions
         N_reactions = len(reactions)
 
         if N_reactions == 0:
             return (np.zeros([self.N_boxes, self.N_variables, 1]) *
-                    self.pint_ur.kg / self.pint_ur.second)
+                    self.topology.mass_rate_units)
 
         C = np.zeros([N_reactions, self.N_boxes, self.N_variables])
 
@@ -807,22 +1001,160 @@ class BoxModelSystem:
             reaction_2Darray = self.get_reaction_rate_2Darray(time, reaction)
             C[i,:,:] = reaction_2Darray.magnitude
 
-        return np.moveaxis(C, 0, -1) * ur.kg/ur.second
+        return np.moveaxis(C, 0, -1) * self.topology.mass_rate_units
+
+
+    #####################################################
+    # Dependencies of user-defined rates
+    #####################################################
+
+    def get_dependency_graph(self, time=None):
+        """Return the DependencyGraph of all rates of the system.
+
+        All Process-, Reaction-, Flow- and Flux-rates are evaluated once
+        with traced arguments in order to find out which Fluid and
+        Variable masses they read. The graph is cached until the system
+        is re-initialized or this method is called with an explicit time.
+
+        Args:
+            time (pint.Quantity [T]): Time at which the rates are traced.
+                Defaults to 0s.
+
+        """
+        if self._dependency_graph is None or time is not None:
+            if time is None:
+                time = 0 * self.pint_ur.second
+            self._dependency_graph = bs_tracing.DependencyGraph(self, time)
+        return self._dependency_graph
+
+    def get_jacobian_sparsity(self, time=None):
+        """Return the sparsity pattern of the Jacobian of the state.
+
+        The state of the system consists of the Fluid mass and all
+        Variable masses of every box. Element [i, j] of the returned
+        boolean 2D array is True if the time derivative of state entry i
+        depends on state entry j (see DependencyGraph.get_state_index).
+
+        """
+        return self.get_dependency_graph(time).get_jacobian_sparsity()
+
+    def enable_incremental_evaluation(self, rtol=0.0, atol=0.0):
+        """Re-evaluate user-defined rates only if their inputs changed.
+
+        Every dynamic rate is evaluated again only if one of its inputs
+        (traced or declared Fluid/Variable masses, and the time) changed
+        by more than the tolerance since its last evaluation. Otherwise
+        the last value is used.
+
+        Args:
+            rtol (float): Relative tolerance of the input comparison.
+                Defaults to 0.
+            atol (float): Absolute tolerance [kg] of the input comparison.
+                Defaults to 0.
+
+        """
+        # The dependency graph is traced without the evaluator
+        self.incremental_evaluator = None
+        self.incremental_evaluator = bs_incremental.IncrementalEvaluator(
+                self, rtol=rtol, atol=atol)
+        return self.incremental_evaluator
+
+    def disable_incremental_evaluation(self):
+        """Evaluate all user-defined rates on every call again."""
+        self.incremental_evaluator = None
 
+    def enable_profiling(self):
+        """Record calls and run time of all dynamic user-defined functions.
+
+        The statistics are grouped by the entity that owns a function
+        (Process, Reaction, Flow, Flux or Fluid). The solver resets them
+        at the start of every simulation and stores a ranked table in
+        Solution.user_function_profile at its end (printed if solve is
+        called with verbose=2).
+
+        """
+        if self.profiler:
+            self.disable_profiling()
+        self.profiler = bs_profiling.UserFunctionProfiler(self)
+        self.profiler.enable()
+        return self.profiler
+
+    def disable_profiling(self):
+        """Stop recording calls of user-defined functions."""
+        if self.profiler:
+            self.profiler.disable()
+        self.profiler = None
 
     # REPRESENTATION functions
 
-    def save_as_svg(self, filename):
+    def save_as_svg(self, filename, layout='layered'):
+        """Save the visualization of the system as a SVG file.
+
+        Args:
+            filename (str): Name of the file ('.svg' is appended if the
+                name has no extension).
+            layout (str): Arrangement of the boxes: 'layered' (default),
+                'force' or 'circle' (see visualize.SystemSvgRenderer).
+                The renderer of each layout is kept until the system is
+                initialized again, so the box positions are reused.
+
+        """
         if '.' not in filename:
             filename += '.svg'
-        system_svg_helper = bs_visualize.BoxModelSystemSvgHelper()
-        system_svg_helper.save_system_as_svg(system=self, filename=filename)
+        renderer = self._svg_renderers.get(layout)
+        if renderer is None:
+            renderer = bs_visualize.SystemSvgRenderer(layout)
+            self._svg_renderers[layout] = renderer
+        renderer.save(self, filename)
+
+    def to_dict(self):
+        """Return the declarative model of the system (see model.py)."""
+        return bs_model.to_dict(self)
+
+    @classmethod
+    def from_dict(cls, model, allowed_modules=()):
+        """Return the system of a declarative model (see model.py).
+
+        Only load models from trusted sources: functions are imported
+        from allowed_modules (see model.from_dict).
+
+        """
+        return bs_model.from_dict(model, allowed_modules)
+
+    def save_model(self, file_name, indent=None):
+        """Save the system as a JSON model file (see model.py).
+
+        Unlike pickling, user-defined functions are saved by reference:
+        they must be Expressions or importable module-level functions.
+
+        """
+        bs_model.save(self, file_name, indent)
+
+    @classmethod
+    def load_model(cls, file_name, allowed_modules=()):
+        """Load a system from a JSON model file (see save_model).
+
+        Security: Model files are code. Their Expressions are evaluated
+        with access to the system and their functions are imported,
+        which runs the code of the modules in allowed_modules. Only load
+        model files from trusted sources.
+
+        Args:
+            file_name (str): JSON model file.
+            allowed_modules (iterable of str): Modules (and submodules)
+                from which functions may be imported. Default: () (only
+                Expressions).
+
+        """
+        return bs_model.load(file_name, allowed_modules)
 
     # SOLVER functions
 
-    def solve(self, total_integration_time, dt, save_frequency=100, debug=False):
+    def solve(self, total_integration_time, dt, save_frequency=100, debug=False,
+            step_timings=False, verbose=True, cache=None):
         # solver = bs_solver.Solver(self)
         # return solver.solve(total_integration_time, dt, debug)
         return bs_solver.solve(self, total_integration_time, dt,
-                save_frequency=save_frequency, debug=debug)
+                save_frequency=save_frequency, debug=debug,
+                step_timings=step_timings, verbose=verbose, cache=cache)
 
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Low-overhead timing of the phases of a simulation.
+
+The solver marks the end of every phase with PhaseTimer.lap(phase). The
+time since the previous mark is added to that phase. Thus, only one call
+of a monotonic clock is needed per phase and no context managers or
+function wrappers are involved.
+
+"""
+
+import time as time_module
+
+import numpy as np
+
+
+class PhaseTimer:
+    """Accumulate the wall-clock time spent in the phases of a run.
+
+    Args:
+        phases (list of str): Names of the phases (in execution order).
+        N_steps (int): Number of timesteps. If given, the times of the
+            phases are also recorded for every timestep. Default: None.
+
+    Attributes:
+        phases (tuple of str): Names of the phases.
+        totals (dict): Phase -> accumulated time [s].
+        calls (dict): Phase -> number of laps.
+        step_times (numpy 2D array): Time [s] of every phase (columns) in
+            every timestep (rows). None if N_steps was not given.
+
+    """
+
+    def __init__(self, phases, N_steps=None):
+        self.phases = tuple(phases)
+        self.totals = {phase: 0.0 for phase in self.phases}
+        self.calls = {phase: 0 for phase in self.phases}
+        self._phase_ids = {phase: i for i, phase in enumerate(self.phases)}
+        self.step_times = None
+        if N_steps is not None:
+            self.step_times = np.zeros((N_steps, len(self.phases)))
+        self._step = None
+        self._last = time_module.perf_counter()
+
+    def start(self, step=None):
+        """Set the mark of the next lap (and the current timestep)."""
+        self._step = step
+        self._last = time_module.perf_counter()
+
+    def lap(self, phase):
+        """Add the time since the last mark to phase and set a new mark."""
+        now = time_module.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.totals[phase] += elapsed
+        self.calls[phase] += 1
+        if self.step_times is not None and self._step is not None:
+            self.step_times[self._step, self._phase_ids[phase]] += elapsed
+
+    @property
+    def total(self):
+        """Return the time [s] of all phases."""
+        return sum(self.totals.values())
+
+    def get_dataframe(self):
+        """Return total time, number of laps and fraction of every phase."""
+        import pandas as pd
+        total = self.total
+        df = pd.DataFrame({
+            'time [s]': [self.totals[p] for p in self.phases],
+            'calls': [self.calls[p] for p in self.phases],
+            'fraction': [self.totals[p] / total if total else 0.0
+                for p in self.phases],
+        }, index=pd.Index(self.phases, name='Phase'))
+        return df
+
+    def get_step_dataframe(self):
+        """Return the time [s] of every phase in every timestep."""
+        import pandas as pd
+        if self.step_times is None:
+            raise ValueError('Timings per timestep were not recorded.')
+        df = pd.DataFrame(self.step_times, columns=self.phases)
+        df.index.name = 'Timestep'
+        return df
+
+    def __str__(self):
+        lines = ['{:<20}{:>12}{:>10}{:>8}'.format(
+            'Phase', 'time [s]', 'calls', '%')]
+        total = self.total
+        for phase in self.phases:
+            fraction = 100 * self.totals[phase] / total if total else 0.0
+            lines.append('{:<20}{:>12.4f}{:>10d}{:>8.1f}'.format(
+                phase, self.totals[phase], self.calls[phase], fraction))
+        lines.append('{:<20}{:>12.4f}'.format('total', total))
+        return '\n'.join(lines)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Immutable index of the structure (topology) of a BoxModelSystem.
+
+The order of the boxes and variables, the processes and reactions of
+every box, and the endpoints of all flows and fluxes do not change
+during a simulation. The TopologyIndex collects this information once
+(in BoxModelSystem.init_system) such that the getters of the system do
+not need to rebuild lists or scan all boxes on every call. The index is
+only rebuilt if the system is re-initialized.
+
+"""
+
+from types import MappingProxyType
+
+import numpy as np
+
+
+# Id used in endpoint arrays for the outside of the system (None)
+OUTSIDE = -1
+
+
+def _get_readonly_array(values, dtype=int):
+    """Return values as a numpy array that cannot be modified."""
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def _get_box_id(box):
+    return box.id if box is not None else OUTSIDE
+
+
+class TopologyIndex:
+    """Index of the boxes, variables, and transports of a system.
+
+    All attributes are read-only (tuples, read-only mappings and
+    read-only numpy arrays).
+
+    Args:
+        system (BoxModelSystem): System that is indexed. Box and variable
+            ids must already be set.
+
+    Attributes:
+        box_names (tuple of str): Box names ordered by id.
+        box_list (tuple of Box): Boxes ordered by id.
+        box_ids (mapping): Box name -> box id.
+        variable_names (tuple of str): Variable names ordered by id.
+        variable_list (tuple of Variable): Variables ordered by id.
+        variable_ids (mapping): Variable name -> variable id.
+        N_boxes (int): Number of boxes.
+        N_variables (int): Number of variables.
+        process_ids (mapping): Process name -> index in system.processes.
+        process_variable_ids (numpy 1D array): Variable id of every
+            process.
+        box_process_ids (tuple of tuple of int): Process ids of every box
+            (ordered by box id).
+        reaction_ids (mapping): Reaction name -> index in
+            system.reactions.
+        box_reaction_ids (tuple of tuple of int): Reaction ids of every
+            box (ordered by box id).
+        reaction_box_ids (tuple of tuple of int): Box ids of every
+            reaction (ordered by reaction id).
+        flow_source_ids (numpy 1D array): Source box id of every flow in
+            system.flows (OUTSIDE if the flow comes from outside).
+        flow_target_ids (numpy 1D array): Target box id of every flow
+            (OUTSIDE if the flow leaves the system).
+        flux_source_ids (numpy 1D array): Source box id of every flux.
+        flux_target_ids (numpy 1D array): Target box id of every flux.
+        flux_variable_ids (numpy 1D array): Variable id of every flux.
+        outgoing_flow_ids, incoming_flow_ids (tuple of tuple of int): Ids
+            of the flows that leave/enter every box (ordered by box id).
+        source_flow_ids, sink_flow_ids (tuple of int): Ids of the flows
+            from outside the system into a box/from a box out of the
+            system.
+        variable_source_flow_ids (tuple of tuple of int): Ids of the
+            flows from outside the system that carry a concentration of
+            every variable (ordered by variable id).
+        outgoing_flux_ids, incoming_flux_ids (tuple of tuple of int): Ids
+            of the fluxes that leave/enter every box.
+        source_flux_ids, sink_flux_ids (tuple of int): Ids of the fluxes
+            from outside/out of the system.
+        variable_flux_ids (tuple of tuple of int): Ids of the fluxes of
+            every variable (ordered by variable id).
+        pint_ur (pint.UnitRegistry): Unit registry of the system.
+        mass_units, mass_rate_units, dimensionless_units (pint.Unit):
+            Base units of masses, mass rates, and concentrations.
+
+    """
+
+    def __init__(self, system):
+        self._frozen = False
+
+        self.box_names = tuple(sorted(system.boxes.keys()))
+        self.box_list = tuple(system.boxes[name] for name in self.box_names)
+        self.box_ids = MappingProxyType(
+                {box.name: box.id for box in self.box_list})
+        self.variable_names = tuple(sorted(system.variables.keys()))
+        self.variable_list = tuple(system.variables[name]
+                for name in self.variable_names)
+        self.variable_ids = MappingProxyType(
+                {var.name: var.id for var in self.variable_list})
+        self.N_boxes = len(self.box_list)
+        self.N_variables = len(self.variable_list)
+
+        # PROCESSES and REACTIONS
+        self.process_ids = MappingProxyType(
+                {p.name: i for i, p in enumerate(system.processes)})
+        self.process_variable_ids = _get_readonly_array(
+                [self.variable_ids[p.variable.name]
+                    for p in system.processes])
+        self.box_process_ids = tuple(
+                tuple(self.process_ids[p.name] for p in box.processes)
+                for box in self.box_list)
+        self.reaction_ids = MappingProxyType(
+                {r.name: i for i, r in enumerate(system.reactions)})
+        self.box_reaction_ids = tuple(
+                tuple(self.reaction_ids[r.name] for r in box.reactions)
+                for box in self.box_list)
+        self.reaction_box_ids = tuple(
+                tuple(box.id for box in self.box_list
+                    if reaction_id in self.box_reaction_ids[box.id])
+                for reaction_id in range(len(system.reactions)))
+
+        # FLOWS and FLUXES
+        self.flow_source_ids = _get_readonly_array(
+                [_get_box_id(f.source_box) for f in system.flows])
+        self.flow_target_ids = _get_readonly_array(
+                [_get_box_id(f.target_box) for f in system.flows])
+        self.flux_source_ids = _get_readonly_array(
+                [_get_box_id(f.source_box) for f in system.fluxes])
+        self.flux_target_ids = _get_readonly_array(
+                [_get_box_id(f.target_box) for f in system.fluxes])
+        self.flux_variable_ids = _get_readonly_array(
+                [self.variable_ids[f.variable.name] for f in system.fluxes])
+
+        # ADJACENCY of boxes and transports
+        self.outgoing_flow_ids = self._get_adjacency(self.flow_source_ids)
+        self.incoming_flow_ids = self._get_adjacency(self.flow_target_ids)
+        self.source_flow_ids = self._get_ids(self.flow_source_ids, OUTSIDE)
+        self.sink_flow_ids = self._get_ids(self.flow_target_ids, OUTSIDE)
+        self.variable_source_flow_ids = tuple(
+                tuple(i for i in self.source_flow_ids
+                    if variable.name in [v.name for v in
+                        system.flows[i].concentrations.keys()])
+                for variable in self.variable_list)
+        self.outgoing_flux_ids = self._get_adjacency(self.flux_source_ids)
+        self.incoming_flux_ids = self._get_adjacency(self.flux_target_ids)
+        self.source_flux_ids = self._get_ids(self.flux_source_ids, OUTSIDE)
+        self.sink_flux_ids = self._get_ids(self.flux_target_ids, OUTSIDE)
+        self.variable_flux_ids = self._get_adjacency(self.flux_variable_ids,
+                self.N_variables)
+
+        # UNITS
+        self.pint_ur = system._find_pint_ur()
+        self.mass_units = self.pint_ur.kg
+        self.mass_rate_units = self.pint_ur.kg / self.pint_ur.second
+        self.dimensionless_units = self.pint_ur.dimensionless
+
+        self._frozen = True
+
+    def _get_ids(self, values, value):
+        """Return the indices of all elements of values equal to value."""
+        return tuple(int(i) for i in np.flatnonzero(values == value))
+
+    def _get_adjacency(self, keys, N_keys=None):
+        """Return the transport ids grouped by keys (e.g. box ids).
+
+        Transport ids whose key is OUTSIDE are not contained.
+
+        """
+        N_keys = N_keys if N_keys is not None else self.N_boxes
+        adjacency = [[] for i in range(N_keys)]
+        for transport_id, key in enumerate(keys):
+            if key != OUTSIDE:
+                adjacency[key].append(transport_id)
+        return tuple(tuple(ids) for ids in adjacency)
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError('TopologyIndex is immutable. Call '
+                    'BoxModelSystem.init_system to rebuild it.')
+        super().__setattr__(name, value)
+
+    # PICKLING (mappingproxy cannot be pickled or deep-copied)
+
+    def __getstate__(self):
+        return {key: dict(value) if isinstance(value, MappingProxyType)
+                else value for key, value in self.__dict__.items()}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            if isinstance(value, dict):
+                value = MappingProxyType(value)
+            elif isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            self.__dict__[key] = value
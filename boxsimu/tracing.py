@@ -0,0 +1,686 @@
+# -*- coding: utf-8 -*-
+"""
+Tracing of user-defined functions.
+
+User-defined rates (Process, Reaction, Flow, Flux) are arbitrary
+callables. In order to know which quantities of the system a rate
+depends on, the rate is evaluated once with traced arguments: the time,
+the context and the system are wrapped in light-weight proxies that
+record every read of a Fluid mass, a Variable mass, a condition
+parameter, or of the time itself.
+
+From these records a DependencyGraph of the system is built. It maps
+every rate to the state entries (Fluid and Variable masses of the boxes)
+it reads and writes, and can be turned into the sparsity pattern of the
+Jacobian of the system's state derivative.
+
+State entries are indexed as (box.id, column): column 0 is the Fluid
+mass of the box, column 1 + variable.id the mass of the Variable.
+
+"""
+
+import math
+import operator
+
+import numpy as np
+
+from . import context as bs_context
+
+
+FLUID_COLUMN = 0
+
+
+def get_state_column(variable=None):
+    """Return the state column of variable (or of the fluid if None)."""
+    if variable is None:
+        return FLUID_COLUMN
+    return 1 + variable.id
+
+
+class AccessRecorder:
+    """Record the inputs read by a user-defined function.
+
+    Attributes:
+        masses (set of tuple): State entries (box_id, column) that were
+            read.
+        conditions (set of tuple): Condition parameters (scope, key) that
+            were read. The scope is the name of the box, the name of the
+            transport, or 'global_condition'.
+        time (bool): True if the time was read.
+        complete (bool): False if the traced function raised an exception.
+            In this case the recorded inputs are incomplete and the
+            function must be assumed to depend on the whole state.
+
+    """
+
+    def __init__(self):
+        self.masses = set()
+        self.conditions = set()
+        self.time = False
+        self.complete = True
+
+    def record_mass(self, box, variable=None):
+        self.masses.add((box.id, get_state_column(variable)))
+
+    def record_box_mass(self, box):
+        self.record_mass(box)
+        for variable_name, variable in box.variables.items():
+            self.record_mass(box, variable)
+
+    def record_condition(self, scope, key):
+        self.conditions.add((scope, key))
+
+    def record_time(self):
+        self.time = True
+
+    @property
+    def is_constant(self):
+        """True if the function neither reads the state nor the time."""
+        return self.complete and not self.masses and not self.time
+
+
+# PROXIES
+
+class _TracedAttributes:
+    """Base class of all tracing proxies.
+
+    Attribute and item access are handled identically. Attributes that
+    describe the structure of the wrapped object (STRUCTURE, e.g. names
+    and ids) are passed through. Every other attribute that is not
+    explicitly traced (e.g. methods like Box.get_concentration or
+    derived quantities like Box.volume) may read any mass; it is passed
+    through as well, but the recorded inputs are marked incomplete.
+
+    """
+
+    STRUCTURE = ('name', 'id', 'description')
+
+    def __init__(self, wrapped, recorder):
+        object.__setattr__(self, '_wrapped', wrapped)
+        object.__setattr__(self, '_recorder', recorder)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._trace(name)
+
+    def __getitem__(self, name):
+        return self._trace(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Traced objects are read-only.')
+
+    def _trace(self, name):
+        value = getattr(self._wrapped, name)
+        if name not in self.STRUCTURE:
+            self._recorder.complete = False
+        return value
+
+
+class TracedContext(_TracedAttributes):
+    """Trace the context passed as second argument to a user function."""
+
+    def __init__(self, context, recorder, scope, box=None):
+        super().__init__(context, recorder)
+        object.__setattr__(self, '_scope', scope)
+        object.__setattr__(self, '_box', box)
+
+    STRUCTURE = ('magnitudes',)
+
+    def _trace(self, name):
+        box = self._box
+        context = self._wrapped
+        if box is not None and name in box.variables:
+            self._recorder.record_mass(box, box.variables[name])
+            return getattr(context, name)
+        elif name in context.keys():
+            self._recorder.record_condition(self._scope, name)
+            return getattr(context, name)
+        elif name == 'condition':
+            return TracedCondition(context.condition, self._recorder,
+                    self._scope)
+        elif name == 'global_condition':
+            return TracedCondition(getattr(context, name), self._recorder,
+                    'global_condition')
+        elif name == 'box' and context.box is not None:
+            return TracedBox(context.box, self._recorder)
+        elif name == 'system' and context.system is not None:
+            return TracedSystem(context.system, self._recorder)
+        value = getattr(context, name)
+        if isinstance(value, bs_context.BoxState):
+            return TracedBoxState(value, self._recorder)
+        return super()._trace(name)
+
+
+class TracedCondition(_TracedAttributes):
+    """Trace reads of condition parameters."""
+
+    def __init__(self, condition, recorder, scope):
+        super().__init__(condition, recorder)
+        object.__setattr__(self, '_scope', scope)
+
+    def _trace(self, name):
+        # Conditions are constant, also their methods (e.g. items)
+        self._recorder.record_condition(self._scope, name)
+        return getattr(self._wrapped, name)
+
+
+class TracedEntity(_TracedAttributes):
+    """Trace reads of the mass of a Fluid or Variable of a box."""
+
+    def __init__(self, entity, recorder, box, variable=None):
+        super().__init__(entity, recorder)
+        object.__setattr__(self, '_box', box)
+        object.__setattr__(self, '_variable', variable)
+
+    STRUCTURE = _TracedAttributes.STRUCTURE + ('molar_mass',)
+
+    def _trace(self, name):
+        if name in ('mass', 'mass_magnitude'):
+            self._recorder.record_mass(self._box, self._variable)
+            return getattr(self._wrapped, name)
+        return super()._trace(name)
+
+
+class TracedVariables(_TracedAttributes):
+    """Trace access to the Variables of a box."""
+
+    def __init__(self, variables, recorder, box):
+        super().__init__(variables, recorder)
+        object.__setattr__(self, '_box', box)
+
+    def _trace(self, name):
+        variable = self._wrapped[name]
+        return TracedEntity(variable, self._recorder, self._box, variable)
+
+    def items(self):
+        return [(name, self._trace(name)) for name in self._wrapped.keys()]
+
+    def values(self):
+        return [self._trace(name) for name in self._wrapped.keys()]
+
+
+class TracedMasses(_TracedAttributes):
+    """Trace reads of the VariableMasses view of a box."""
+
+    def __init__(self, masses, recorder, box):
+        super().__init__(masses, recorder)
+        object.__setattr__(self, '_box', box)
+
+    def _trace(self, name):
+        box = self._box
+        if name not in box.variables:
+            return super()._trace(name)
+        self._recorder.record_mass(box, box.variables[name])
+        return self._wrapped[name]
+
+    def items(self):
+        return [(name, self._trace(name)) for name in self._wrapped.keys()]
+
+    def values(self):
+        return [self._trace(name) for name in self._wrapped.keys()]
+
+
+class TracedBoxState(_TracedAttributes):
+    """Trace access to the BoxState view of a box within a context."""
+
+    def _trace(self, name):
+        state = self._wrapped
+        box = state.box
+        if name in ('variables', 'var'):
+            return TracedMasses(state.variables, self._recorder, box)
+        elif name in ('condition', 'cond'):
+            return TracedCondition(box.condition, self._recorder, box.name)
+        elif name == 'mass':
+            self._recorder.record_box_mass(box)
+            return getattr(state, name)
+        elif name == 'box':
+            return TracedBox(box, self._recorder)
+        return super()._trace(name)
+
+
+class TracedBox(_TracedAttributes):
+    """Trace access to the masses and the condition of a box."""
+
+    def _trace(self, name):
+        box = self._wrapped
+        if name in ('variables', 'var'):
+            return TracedVariables(box.variables, self._recorder, box)
+        elif name == 'fluid':
+            return TracedEntity(box.fluid, self._recorder, box)
+        elif name in ('condition', 'cond'):
+            return TracedCondition(box.condition, self._recorder, box.name)
+        elif name == 'mass':
+            self._recorder.record_box_mass(box)
+            return box.mass
+        elif name == 'context':
+            return TracedContext(box.context, self._recorder, box.name, box)
+        return super()._trace(name)
+
+
+class TracedBoxes(_TracedAttributes):
+    """Trace access to the boxes of a system."""
+
+    def _trace(self, name):
+        return TracedBox(self._wrapped[name], self._recorder)
+
+    def items(self):
+        return [(name, self._trace(name)) for name in self._wrapped.keys()]
+
+    def values(self):
+        return [self._trace(name) for name in self._wrapped.keys()]
+
+
+class TracedSystem(_TracedAttributes):
+    """Trace the system passed as third argument to a user function."""
+
+    # The Variables of system.variables are templates without masses
+    STRUCTURE = ('name', 'variables', 'variable_list', 'variable_names',
+            'box_names', 'N_boxes', 'N_variables')
+
+    def _trace(self, name):
+        system = self._wrapped
+        if name == 'boxes':
+            return TracedBoxes(system.boxes, self._recorder)
+        elif name == 'box_list':
+            return [TracedBox(box, self._recorder)
+                    for box in system.box_list]
+        elif name == 'global_condition':
+            return TracedCondition(system.global_condition, self._recorder,
+                    'global_condition')
+        return super()._trace(name)
+
+
+class TracedNumber:
+    """Number that records every use of its value as a time access.
+
+    Arithmetic, comparisons and conversions (float, numpy arrays) are
+    applied to the wrapped value; the results are plain numbers.
+
+    """
+
+    def __init__(self, value, recorder):
+        self._value = value
+        self._recorder = recorder
+
+    def _get_value(self):
+        self._recorder.record_time()
+        return self._value
+
+    def __array__(self, dtype=None):
+        return np.asarray(self._get_value(), dtype=dtype)
+
+    def __format__(self, format_spec):
+        return format(self._get_value(), format_spec)
+
+    def __repr__(self):
+        return '<TracedNumber {!r}>'.format(self._value)
+
+
+def _get_value(operand):
+    if isinstance(operand, TracedNumber):
+        return operand._get_value()
+    return operand
+
+
+def _add_traced_operators():
+    """Add the numeric special methods of TracedNumber."""
+    binary = ['add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow',
+            'eq', 'ne', 'lt', 'le', 'gt', 'ge']
+    reflected = ['add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow']
+    unary = {'neg': operator.neg, 'pos': operator.pos, 'abs': abs,
+            'float': float, 'int': int, 'bool': bool, 'round': round,
+            'trunc': math.trunc, 'floor': math.floor, 'ceil': math.ceil,
+            'hash': hash}
+
+    def binary_operator(operator_function):
+        def method(self, other):
+            return operator_function(self._get_value(), _get_value(other))
+        return method
+
+    def reflected_operator(operator_function):
+        def method(self, other):
+            return operator_function(_get_value(other), self._get_value())
+        return method
+
+    def unary_operator(function):
+        def method(self, *args):
+            return function(self._get_value(), *args)
+        return method
+
+    for name in binary:
+        setattr(TracedNumber, '__{}__'.format(name),
+                binary_operator(getattr(operator, name)))
+    for name in reflected:
+        setattr(TracedNumber, '__r{}__'.format(name),
+                reflected_operator(getattr(operator, name)))
+    for name, function in unary.items():
+        setattr(TracedNumber, '__{}__'.format(name),
+                unary_operator(function))
+
+
+_add_traced_operators()
+
+
+def get_traced_time(time, recorder):
+    """Return a copy of time that records every use of its magnitude.
+
+    All operations of pint.Quantity (arithmetic, comparisons, unit
+    conversions) use the magnitude of the operands. A quantity whose
+    magnitude is a TracedNumber therefore notices every use of the time.
+
+    """
+    return time.__class__(TracedNumber(time.magnitude, recorder),
+            time.units)
+
+
+# TRACING
+
+def trace_call(function, time, context, system, scope, box=None):
+    """Evaluate function with traced arguments and return the records.
+
+    Args:
+        function (callable): User-defined function called with the
+            arguments time, context, and system.
+        time (pint.Quantity [T]): Time at which function is evaluated.
+        context (AttrDict): Context of the box or transport.
+        system (BoxModelSystem): System the function belongs to.
+        scope (str): Name of the box or transport that owns the context.
+        box (Box): Box whose Variables are part of context. None for
+            transports.
+
+    """
+    recorder = AccessRecorder()
+    try:
+        function(get_traced_time(time, recorder),
+                 TracedContext(context, recorder, scope, box),
+                 TracedSystem(system, recorder))
+    except Exception:
+        recorder.complete = False
+    return recorder
+
+
+def get_declared_inputs(declared_inputs, system, box=None):
+    """Return an AccessRecorder from declared inputs.
+
+    See UserFunction.declare_inputs for the format of declared_inputs.
+
+    """
+    recorder = AccessRecorder()
+    for declared_input in declared_inputs:
+        if declared_input == 'time':
+            recorder.record_time()
+            continue
+        if '.' in declared_input:
+            box_name, entity_name = declared_input.split('.')
+            input_box = system.boxes[box_name]
+        elif box is not None:
+            input_box, entity_name = box, declared_input
+        else:
+            raise ValueError('Input "{}" must be declared as '
+                    '"<box>.<variable>".'.format(declared_input))
+        if entity_name == 'fluid':
+            recorder.record_mass(input_box)
+        else:
+            recorder.record_mass(input_box, input_box.variables[entity_name])
+    return recorder
+
+
+def trace_user_function(user_function, time, context, system, scope,
+        box=None):
+    """Return the AccessRecorder of an evaluation of user_function.
+
+    Static UserFunctions are constants and are not evaluated. If the
+    inputs of user_function were declared, the declaration is used
+    instead of tracing.
+
+    """
+    if user_function.is_static:
+        return AccessRecorder()
+    if user_function.declared_inputs is not None:
+        return get_declared_inputs(user_function.declared_inputs, system, box)
+    return trace_call(user_function.expression, time, context, system,
+            scope, box)
+
+
+class RateNode:
+    """Node of the DependencyGraph: one user-defined rate in one place.
+
+    Attributes:
+        kind (str): 'flow', 'flow_concentration', 'flux', 'process', or
+            'reaction'.
+        owner (Flow, Flux, Process or Reaction): Owner of the rate.
+        box (Box): Box in which a Process/Reaction rate is evaluated.
+            None for transports.
+        variable (Variable): Variable of a flow concentration. None
+            otherwise.
+        user_function (UserFunction): The traced function.
+        inputs (AccessRecorder): Recorded inputs of the rate.
+        targets (set of tuple): State entries (box_id, column) that are
+            changed by the rate.
+
+    """
+
+    def __init__(self, kind, owner, box, user_function, inputs,
+            targets, variable=None):
+        self.kind = kind
+        self.owner = owner
+        self.box = box
+        self.variable = variable
+        self.user_function = user_function
+        self.inputs = inputs
+        self.targets = set(targets)
+
+    def __str__(self):
+        location = self.box.name if self.box else ''
+        return '<RateNode {} {} {}>'.format(self.kind, self.owner.name,
+                location).replace('  ', ' ')
+
+    __repr__ = __str__
+
+    @property
+    def context(self):
+        """Context with which the rate is evaluated by the system."""
+        if self.box is not None:
+            return self.box.context
+        return self.owner.context
+
+    @property
+    def key(self):
+        """Hashable identifier of the node."""
+        box_name = self.box.name if self.box else None
+        variable_name = self.variable.name if self.variable else None
+        return (self.kind, self.owner.name, box_name, variable_name)
+
+
+class DependencyGraph:
+    """Dependencies between the user-defined rates and the system state.
+
+    Args:
+        system (BoxModelSystem): System whose rates are traced.
+        time (pint.Quantity [T]): Time at which the rates are traced.
+
+    Attributes:
+        N_state_columns (int): Number of state columns per box
+            (1 + N_variables).
+        N_states (int): Total number of state entries.
+        nodes (list of RateNode): All traced rates of the system.
+
+    """
+
+    def __init__(self, system, time):
+        self.system = system
+        self.N_state_columns = 1 + system.N_variables
+        self.N_states = system.N_boxes * self.N_state_columns
+        self.nodes = []
+        self._trace_flows(time)
+        self._trace_fluxes(time)
+        self._trace_processes(time)
+        self._trace_reactions(time)
+
+    # TRACING helper functions
+
+    def _add_node(self, *args, **kwargs):
+        node = RateNode(*args, **kwargs)
+        self.nodes.append(node)
+        return node
+
+    def _trace_flows(self, time):
+        system = self.system
+        for flow in system.flows:
+            inputs = trace_user_function(flow.rate, time, flow.context,
+                    system, flow.name)
+            targets = set()
+            for box in (flow.source_box, flow.target_box):
+                if box is None:
+                    continue
+                targets.add((box.id, FLUID_COLUMN))
+                if flow.tracer_transport:
+                    targets.update((box.id, get_state_column(variable))
+                            for variable in system.variable_list)
+            self._add_node('flow', flow, None, flow.rate, inputs, targets)
+
+            for variable, concentration in flow.concentrations.items():
+                variable = system.variables[variable.name]
+                inputs = trace_user_function(concentration, time,
+                        flow.context, system, flow.name)
+                targets = [(flow.target_box.id, get_state_column(variable))]
+                self._add_node('flow_concentration', flow, None,
+                        concentration, inputs, targets, variable=variable)
+
+    def _trace_fluxes(self, time):
+        system = self.system
+        for flux in system.fluxes:
+            variable = system.variables[flux.variable.name]
+            inputs = trace_user_function(flux.rate, time, flux.context,
+                    system, flux.name)
+            targets = [(box.id, get_state_column(variable))
+                    for box in (flux.source_box, flux.target_box)
+                    if box is not None]
+            self._add_node('flux', flux, None, flux.rate, inputs, targets)
+
+    def _trace_processes(self, time):
+        system = self.system
+        for box in system.box_list:
+            for process in box.processes:
+                variable = system.variables[process.variable.name]
+                inputs = trace_user_function(process.rate, time,
+                        box.context, system, box.name, box)
+                targets = [(box.id, get_state_column(variable))]
+                self._add_node('process', process, box, process.rate,
+                        inputs, targets)
+
+    def _trace_reactions(self, time):
+        system = self.system
+        for box in system.box_list:
+            for reaction in box.reactions:
+                inputs = trace_user_function(reaction.rate, time,
+                        box.context, system, box.name, box)
+                targets = [(box.id, get_state_column(
+                        system.variables[variable.name]))
+                        for variable, coeff in
+                        reaction.reaction_coefficients.items() if coeff != 0]
+                self._add_node('reaction', reaction, box, reaction.rate,
+                        inputs, targets)
+
+    # PUBLIC functions
+
+    def get_state_index(self, box_id, column):
+        """Return the flat state index of the entry (box_id, column)."""
+        return box_id * self.N_state_columns + column
+
+    def get_state_labels(self):
+        """Return (box name, fluid/variable name) for every state index."""
+        column_names = ['fluid'] + self.system.variable_names
+        return [(box_name, column_name)
+                for box_name in self.system.box_names
+                for column_name in column_names]
+
+    def get_input_indices(self, node):
+        """Return the flat state indices read by node.
+
+        If the traced function could not be evaluated completely, the
+        node is assumed to depend on the whole state.
+
+        """
+        if not node.inputs.complete:
+            return set(range(self.N_states))
+        indices = {self.get_state_index(*entry)
+                for entry in node.inputs.masses}
+        return indices
+
+    def get_readers(self, box_id, column):
+        """Return all nodes that read the state entry (box_id, column)."""
+        index = self.get_state_index(box_id, column)
+        return [node for node in self.nodes
+                if index in self.get_input_indices(node)]
+
+    def get_writers(self, box_id, column):
+        """Return all nodes that change the state entry (box_id, column)."""
+        return [node for node in self.nodes
+                if (box_id, column) in node.targets]
+
+    def get_node_adjacency(self):
+        """Return boolean matrix: [i, j] is True if node i reads from j.
+
+        Node i reads from node j if any state entry changed by node j is
+        an input of node i. Nodes that are not connected can be evaluated
+        in any order or in parallel.
+
+        """
+        N_nodes = len(self.nodes)
+        # Nodes that read a state index; incomplete nodes read everything
+        readers = {}
+        readers_of_all = []
+        for i, node in enumerate(self.nodes):
+            if not node.inputs.complete:
+                readers_of_all.append(i)
+                continue
+            for entry in node.inputs.masses:
+                readers.setdefault(self.get_state_index(*entry), set()).add(i)
+
+        adjacency = np.zeros([N_nodes, N_nodes], dtype=bool)
+        for j, node in enumerate(self.nodes):
+            if not node.targets:
+                continue
+            adjacency[readers_of_all, j] = True
+            for target in node.targets:
+                index = self.get_state_index(*target)
+                adjacency[list(readers.get(index, ())), j] = True
+        return adjacency
+
+    def get_jacobian_sparsity(self):
+        """Return the sparsity pattern of the Jacobian of the state.
+
+        Returns:
+            sparsity (numpy 2D array of bool): Element [i, j] is True if
+                the time derivative of the state entry i depends on the
+                state entry j. State entries are flat indices as returned
+                by get_state_index.
+
+        """
+        N_states = self.N_states
+        sparsity = np.zeros([N_states, N_states], dtype=bool)
+
+        for node in self.nodes:
+            inputs = list(self.get_input_indices(node))
+            for target in node.targets:
+                sparsity[self.get_state_index(*target), inputs] = True
+
+        # Passive transport of variables with fluid flows: the variable
+        # sink/source depends on the concentration in the source box.
+        for flow in self.system.flows:
+            if not flow.tracer_transport or flow.source_box is None:
+                continue
+            src_id = flow.source_box.id
+            fluid_index = self.get_state_index(src_id, FLUID_COLUMN)
+            for variable in self.system.variable_list:
+                column = get_state_column(variable)
+                input_indices = [fluid_index,
+                        self.get_state_index(src_id, column)]
+                for box in (flow.source_box, flow.target_box):
+                    if box is None:
+                        continue
+                    target = self.get_state_index(box.id, column)
+                    sparsity[target, input_indices] = True
+        return sparsity
@@ -10,6 +10,7 @@ import copy
 
 from . import box as bs_box
 from . import condition as bs_condition
+from . import context as bs_context
 from . import entities as bs_entities
 from . import errors as bs_errors
 from . import descriptors as bs_descriptors
@@ -64,8 +65,8 @@ class BaseTransport:
         self.target_box = target_box
         self.rate = bs_function.UserFunction(rate, ur.kg/ur.second)
         self.condition = condition if condition else bs_condition.Condition()
-        if not description:
-            self.description = name
+        self._context = None
+        self.description = description or name
 
     def __str__(self):
         return '<BaseTransport {}>'.format(self.name)
@@ -94,7 +95,20 @@ class BaseTransport:
 
     @property
     def context(self):
-        return self.condition
+        """Read-only view of the condition of the transport."""
+        if self._context is None:
+            self.init_context()
+        return self._context
+
+    def init_context(self, system=None):
+        """Create the context view of the transport.
+
+        The condition of the transport is merged with the global condition
+        of system. Run by BoxModelSystem.init_system.
+
+        """
+        self._context = bs_context.BoxContext(None, system,
+                condition=self.condition)
 
     @classmethod
     def get_all_from(cls, source_box, transports):
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Creation of the pint.UnitRegistry of boxsimu with an on-disk cache.
+
+Creating a pint.UnitRegistry parses the definition files of pint (several
+hundred units) and then resolves the dimensionality and base units of
+every unit. Both steps together take a noticeable part of the import time
+of boxsimu. A UnitRegistry itself cannot be pickled (it holds local
+functions and weak references), therefore the parsed definitions and the
+resolved unit cache are pickled instead. The cache file is keyed by a
+hash of the pint version and the content of its definition files; it is
+rebuilt automatically if pint changes.
+
+The cache is stored in the directory given by the environment variable
+BOXSIMU_CACHE_DIR, or in $XDG_CACHE_HOME/boxsimu (default:
+~/.cache/boxsimu). Set BOXSIMU_CACHE_DIR to an empty string to disable
+the cache. Cache files that are not owned by the current user or that
+can be written by other users are ignored (they are unpickled).
+
+The cache relies on internals of pint 0.16 and 0.17 (see
+requirements.txt). With other versions of pint, or if the cache cannot
+be read or written, a plain pint.UnitRegistry is created as usual.
+
+"""
+
+import os
+import sys
+import pickle
+import hashlib
+import copyreg
+
+import pint
+try:
+    from pint.definitions import Definition
+    from pint.util import SourceIterator, UnitsContainer, ParserHelper
+    CACHE_SUPPORTED = True
+except ImportError:
+    CACHE_SUPPORTED = False
+
+
+DEFINITION_FILE = 'default_en.txt'
+
+
+def get_cache_dir():
+    """Return the cache directory of boxsimu (None if it is disabled)."""
+    cache_dir = os.environ.get('BOXSIMU_CACHE_DIR')
+    if cache_dir is not None:
+        return cache_dir or None
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'boxsimu')
+
+
+class _UnitRegistry(pint.UnitRegistry):
+    """UnitRegistry that caches the units of attribute access (ur.kg).
+
+    pint parses the name of a unit on every attribute access, which takes
+    about 0.1 ms for symbols such as kg. Units are immutable, thus the
+    unit of every attribute is created only once.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._attribute_units = {}
+        super().__init__(*args, **kwargs)
+
+    def __getattr__(self, item):
+        if item[0] == '_':
+            return super().__getattr__(item)
+        try:
+            return self._attribute_units[item]
+        except KeyError:
+            units = self._attribute_units[item] = super().__getattr__(item)
+            return units
+
+
+class _CachedUnitRegistry(_UnitRegistry):
+    """UnitRegistry built from parsed definitions and a unit cache.
+
+    The definitions are given as a list of pint Definitions (single line
+    definitions) and lists of lines (@context, @group, @system and
+    @defaults blocks, which are cheap to parse). If unit_cache is given it
+    replaces the first (expensive) build of the unit cache.
+
+    Building the unit cache defines some prefixed units (e.g. kilometer)
+    as a side effect; their names are stored in prefixed_names and these
+    units are defined again if the registry is built from a unit_cache.
+
+    """
+
+    def __init__(self, definitions, unit_cache=None, prefixed_names=(),
+            **kwargs):
+        self._unit_cache = unit_cache
+        self._prefixed_names = list(prefixed_names)
+        super().__init__(filename=definitions, **kwargs)
+
+    def load_definitions(self, file, is_resource=False):
+        if not isinstance(file, _ParsedDefinitions):
+            return super().load_definitions(file, is_resource)
+        for definition in file:
+            if isinstance(definition, list):
+                super().load_definitions(definition)
+            else:
+                self.define(definition)
+
+    def _build_cache(self):
+        unit_cache = self.__dict__.pop('_unit_cache', None)
+        if unit_cache is None:
+            unit_names = set(self._units)
+            super()._build_cache()
+            self._prefixed_names = [name for name in self._units
+                    if name not in unit_names]
+            return
+        for name in self._prefixed_names:
+            self.get_name(name)
+        self._cache = unit_cache
+        self._caches[()] = unit_cache
+
+
+class _ParsedDefinitions(list):
+    """List of the parsed definitions of a definition file."""
+
+
+def _read_definition_file(file_name):
+    return pint.registry.importlib_resources.read_binary(
+            'pint', file_name).decode('utf-8')
+
+
+def _parse_definitions(file_name=DEFINITION_FILE):
+    """Parse a definition file of pint (including all @import files)."""
+    definitions = _ParsedDefinitions()
+    source = SourceIterator(_read_definition_file(file_name).splitlines())
+    for lineno, line in source:
+        if line.startswith('@import'):
+            definitions += _parse_definitions(line[7:].strip())
+        elif line.startswith('@') and not line.startswith('@alias'):
+            definitions.append([part for lineno, part in
+                source.block_iter()] + ['@end'])
+        else:
+            definitions.append(Definition.from_string(line))
+    return definitions
+
+
+def _reduce_units_container(units_container):
+    # UnitsContainer pickles its cached hash, which is only valid within
+    # one process (hash randomization of str): drop it.
+    state = units_container.__getstate__()
+    return (object.__new__, (type(units_container),),
+            (state[0], None) + state[2:])
+
+
+def _dump(obj, f):
+    pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[UnitsContainer] = _reduce_units_container
+    pickler.dispatch_table[ParserHelper] = _reduce_units_container
+    pickler.dump(obj)
+
+
+def _get_cache_key():
+    key = hashlib.sha1()
+    key.update('{} {}'.format(pint.__version__, sys.version).encode())
+    key.update(_read_definition_file(DEFINITION_FILE).encode())
+    key.update(_read_definition_file('constants_en.txt').encode())
+    return key.hexdigest()[:16]
+
+
+def _is_trusted_file(file_name):
+    """Return True if only the current user can have written file_name."""
+    stat = os.stat(file_name)
+    if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+        return False
+    return not stat.st_mode & 0o022
+
+
+def _load_cached_unit_registry(file_name):
+    if not _is_trusted_file(file_name):
+        raise ValueError('Untrusted cache file: {}'.format(file_name))
+    with open(file_name, 'rb') as f:
+        definitions, unit_cache, prefixed_names = pickle.load(f)
+    return _CachedUnitRegistry(definitions, unit_cache, prefixed_names)
+
+
+def _save_cached_unit_registry(file_name, registry, definitions):
+    os.makedirs(os.path.dirname(file_name), mode=0o700, exist_ok=True)
+    # Write to a temporary file first: concurrent imports must never
+    # read a partially written cache file.
+    tmp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    with open(tmp_file_name, 'wb') as f:
+        os.chmod(tmp_file_name, 0o600)
+        _dump((definitions, registry._cache, registry._prefixed_names), f)
+    os.replace(tmp_file_name, file_name)
+
+
+def _get_plain_unit_registry():
+    try:
+        return _UnitRegistry()
+    except Exception:
+        return pint.UnitRegistry()
+
+
+def get_unit_registry(cache_dir=None):
+    """Return a new pint.UnitRegistry with the default definitions.
+
+    Args:
+        cache_dir (str): Directory of the cache file. Default: see
+            get_cache_dir.
+
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if not cache_dir or not CACHE_SUPPORTED:
+        return _get_plain_unit_registry()
+
+    try:
+        file_name = os.path.join(cache_dir,
+                'unit_registry_{}.pickle'.format(_get_cache_key()))
+    except Exception:
+        # Internals of pint changed (e.g. location of definition files)
+        return _get_plain_unit_registry()
+
+    try:
+        return _load_cached_unit_registry(file_name)
+    except Exception:
+        pass
+
+    try:
+        definitions = _parse_definitions()
+        registry = _CachedUnitRegistry(definitions)
+    except Exception:
+        return _get_plain_unit_registry()
+    try:
+        _save_cached_unit_registry(file_name, registry, definitions)
+    except Exception:
+        pass
+    return registry
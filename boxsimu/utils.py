@@ -55,8 +55,8 @@ def stack(arrays, *args, **kwargs):
     tmp_units = []
     for a in arrays:
         try:
-            tmp_arrays.append(a.to_base_units().magnitude)
-            tmp_units.append(a.to_base_units().units)
+            tmp_arrays.append(bs_validation.get_base_magnitude(a))
+            tmp_units.append(bs_validation.get_unit_info(a.units).base_units)
         except AttributeError:
             tmp_arrays.append(a)
     units = bs_validation.get_single_shared_unit(tmp_units)
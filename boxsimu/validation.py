@@ -20,6 +20,18 @@ from . import errors as bs_errors
 from . import ur
 
 
+# Units of the dimensionality checks below. They are defined once since
+# building them (e.g. ur.kg / ur.second) is expensive.
+_MASS = ur.kg
+_DENSITY = ur.kg / ur.meter**3
+_MOLAR_MASS = ur.kg / ur.mole
+_TIME = ur.second
+_VOLUME_PER_TIME = ur.meter**3 / ur.second
+_MASS_PER_TIME = ur.kg / ur.second
+_MOLE_PER_TIME = ur.mole / ur.second
+_DIMENSIONLESS = ur.dimensionless
+
+
 # OBJECT VALIDATION 
 
 def raise_if_not_pint_quantity(value):
@@ -27,6 +39,84 @@ def raise_if_not_pint_quantity(value):
         raise ValueError('The given value is not a pint.Quantity!')
 
 
+# CACHED UNIT CONVERSION
+
+class UnitInfo:
+    """Base-unit conversion factor and dimensionality of a pint unit.
+
+    Args:
+        units (pint.Unit): Units that are described.
+
+    Attributes:
+        units (pint.Unit): Units that are described.
+        base_units (pint.Unit): Base units of the same dimensionality.
+        factor (float): Factor that converts a magnitude given in units
+            into a magnitude given in base_units.
+        dimensionality (pint.util.UnitsContainer): Dimensionality of units.
+        is_multiplicative (bool): False for units with an offset (e.g.
+            degree Celsius) which cannot be converted by a factor.
+
+    """
+
+    def __init__(self, units):
+        one = units._REGISTRY.Quantity(1, units)
+        self.units = units
+        self.dimensionality = one.dimensionality
+        self.is_multiplicative = one._is_multiplicative
+        base = one.to_base_units()
+        self.base_units = base.units
+        self.factor = base.magnitude
+
+
+_unit_info_cache = {}
+
+
+def get_unit_info(units):
+    """Return the (cached) UnitInfo of units.
+
+    Repeated calls with equal units are a dictionary lookup.
+
+    """
+    try:
+        return _unit_info_cache[units]
+    except KeyError:
+        info = UnitInfo(units)
+        _unit_info_cache[units] = info
+        return info
+
+
+def clear_unit_info_cache():
+    """Remove all cached UnitInfo instances."""
+    _unit_info_cache.clear()
+
+
+def get_dimensionality(units):
+    """Return the (cached) dimensionality of a pint Unit or Quantity."""
+    return get_unit_info(getattr(units, 'units', units)).dimensionality
+
+
+def to_base_units(quantity):
+    """Return quantity converted to base units.
+
+    Equivalent to quantity.to_base_units() but the conversion factor is
+    looked up in the unit cache instead of being derived on every call.
+
+    """
+    info = get_unit_info(quantity.units)
+    if not info.is_multiplicative:
+        return quantity.to_base_units()
+    return quantity.__class__(quantity.magnitude * info.factor,
+            info.base_units)
+
+
+def get_base_magnitude(quantity):
+    """Return the magnitude of quantity in base units."""
+    info = get_unit_info(quantity.units)
+    if not info.is_multiplicative:
+        return quantity.to_base_units().magnitude
+    return quantity.magnitude * info.factor
+
+
 # DIMENSIONALITY VALIDATION
 
 def is_quantity_of_dimensionality(quantity, *units):
@@ -44,55 +134,57 @@ def is_quantity_of_dimensionality(quantity, *units):
 
     """
     try:
-        for u in units:
-            if quantity.dimensionality == u.dimensionality:
-                return True
+        dimensionality = get_unit_info(quantity.units).dimensionality
     except AttributeError:
-        dimensions = [u.dimensionality for u in units]
         if isinstance(quantity, float) or isinstance(quantity, int):
-            if ur.dimensionless.dimensionality in dimensions:
+            dimensions = [get_dimensionality(u) for u in units]
+            if _DIMENSIONLESS.dimensionality in dimensions:
                 return True
+        return False
+    for u in units:
+        if get_dimensionality(u) == dimensionality:
+            return True
     return False
 
 
 def is_mass(quantity):
     """Check if quantity has dimensions of [M]."""
-    return is_quantity_of_dimensionality(quantity, ur.kg)
+    return is_quantity_of_dimensionality(quantity, _MASS)
 
 
 def is_density(quantity):
     """Check if quantity has dimensions of [M/L^3]."""
-    return is_quantity_of_dimensionality(quantity, ur.kg / ur.meter**3)
+    return is_quantity_of_dimensionality(quantity, _DENSITY)
 
 
 def is_molar_mass(quantity):
     """Check if quantity has dimensions of [M/N]."""
-    return is_quantity_of_dimensionality(quantity, ur.kg / ur.mole)
+    return is_quantity_of_dimensionality(quantity, _MOLAR_MASS)
 
 
 def is_time(quantity):
     """Check if quantity has dimensions of [T]."""
-    return is_quantity_of_dimensionality(quantity, ur.second)
+    return is_quantity_of_dimensionality(quantity, _TIME)
 
 
 def is_volume_per_time(quantity):
     """Check if quantity has dimensions of [L^3/T]."""
-    return is_quantity_of_dimensionality(quantity, ur.meter**3 / ur.second)
+    return is_quantity_of_dimensionality(quantity, _VOLUME_PER_TIME)
 
 
 def is_mass_per_time(quantity):
     """Check if quantity has dimensions of [M/T]."""
-    return is_quantity_of_dimensionality(quantity, ur.kg / ur.second)
+    return is_quantity_of_dimensionality(quantity, _MASS_PER_TIME)
 
 
 def is_mole_per_time(quantity):
     """Check if quantity has dimensions of [N/T]."""
-    return is_quantity_of_dimensionality(quantity, ur.mole / ur.second)
+    return is_quantity_of_dimensionality(quantity, _MOLE_PER_TIME)
 
 
 def is_dimless(quantity):
     """Check if quantity has dimensions of [1]."""
-    return is_quantity_of_dimensionality(quantity, ur.kg / ur.kg)
+    return is_quantity_of_dimensionality(quantity, _DIMENSIONLESS)
 
 
 # EXCEPTION RAISING VALIDATION METHODS
@@ -105,8 +197,8 @@ def raise_if_not(quantity, *units):
         *units (pint.Quantity): Quantity of the desired dimensions.
 
     """
-    dimensions = [u.dimensionality for u in units]
     if not is_quantity_of_dimensionality(quantity, *units):
+        dimensions = [get_dimensionality(u) for u in units]
         if len(units) > 1:
             raise bs_errors.WrongUnitsDimensionalityError('Invalid units!\n'
                     'Must be given in one of the dimensions: '
@@ -118,42 +210,42 @@ def raise_if_not(quantity, *units):
 
 def raise_if_not_mass(quantity):
     """Raise DimensionalityError if quantity has not dimensions [M]."""
-    raise_if_not(quantity, ur.kg)
+    raise_if_not(quantity, _MASS)
 
 
 def raise_if_not_density(quantity):
     """Raise DimensionalityError if quantity has not dimensions [M/L^3]."""
-    raise_if_not(quantity, ur.kg / ur.meter**3)
+    raise_if_not(quantity, _DENSITY)
 
 
 def raise_if_not_molar_mass(quantity):
     """Raise DimensionalityError if quantity has not dimensions [M/N]."""
-    raise_if_not(quantity, ur.kg / ur.mole)
+    raise_if_not(quantity, _MOLAR_MASS)
 
 
 def raise_if_not_time(quantity):
     """Raise DimensionalityError if quantity has not dimensions [T]."""
-    raise_if_not(quantity, ur.second)
+    raise_if_not(quantity, _TIME)
 
 
 def raise_if_not_volume_per_time(quantity):
     """Raise DimensionalityError if quantity has not dimensions [L^3/T]."""
-    raise_if_not(quantity, ur.meter**3 / ur.second)
+    raise_if_not(quantity, _VOLUME_PER_TIME)
 
 
 def raise_if_not_mass_per_time(quantity):
     """Raise DimensionalityError if quantity has not dimensions [M/T]."""
-    raise_if_not(quantity, ur.kg / ur.second)
+    raise_if_not(quantity, _MASS_PER_TIME)
 
 
 def raise_if_not_mole_per_time(quantity):
     """Raise DimensionalityError if quantity has not dimensions [N/T]."""
-    raise_if_not(quantity, ur.mole / ur.second)
+    raise_if_not(quantity, _MOLE_PER_TIME)
 
 
 def raise_if_not_dimless(quantity):
     """Raise DimensionalityError if quantity has not dimensions [1]."""
-    raise_if_not(quantity, ur.dimensionless)
+    raise_if_not(quantity, _DIMENSIONLESS)
 
 
 # VECTOR/List validation
@@ -195,11 +287,10 @@ def decorator_raise_if_not(*units):
                         'return a quantity with the needed '
                         'dimensionality: {}'.format(
                             function.__name__, dimensionalities))
-            return result.to_base_units()
+            return to_base_units(result)
         return wrapper
     return decorator
 
 decorator_raise_if_not_mass_per_time = decorator_raise_if_not(
         ur.kg/ur.second)
 decorator_raise_if_not_density = decorator_raise_if_not(ur.kg/ur.meter**3)
-
@@ -10,10 +10,12 @@ import os
 import re
 import copy
 import importlib
-import svgwrite
-from svgwrite import cm, mm
+import collections
+from xml.sax.saxutils import escape, quoteattr
+
 import numpy as np
 
+from . import topology as bs_topology
 from . import utils as bs_utils
 
 
@@ -54,8 +56,9 @@ class BoxModelSystemSvgHelper:
         elif system.N_boxes == 6:
             self.system_boxes_arrangement_factor = 1.8
 
+        import svgwrite
         # self.dwg = svgwrite.Drawing(size=self._get_system_svg_size())
-        self.dwg = svgwrite.Drawing(size=('32cm', '10cm'), debug=True)
+        self.dwg = svgwrite.Drawing(size=('32cm', '10cm'), debug=False)
         self.dwg.viewbox(-100, 0, 600, 400)
 
         if not self.box_svg_helpers:
@@ -81,6 +84,7 @@ class BoxModelSystemSvgHelper:
 
     def save_box_as_svg(self, box, filename=None):
         """Return a SVG representation of the Box instance."""
+        import svgwrite
 
         self.dwg = svgwrite.Drawing(size=self._get_box_svg_size())
         self._save_group_as_svg(self.get_box_svg_group(box), filename)
@@ -99,11 +103,8 @@ class BoxModelSystemSvgHelper:
     def _save_group_as_svg(self, group, filename):
         """Save a svgwrite group instance as a SVG file."""
 
-        # dwg = svgwrite.Drawing(filename=filename)
-        dwg = copy.deepcopy(self.dwg)
-        dwg.filename = filename
-        dwg.add(group)
-        dwg.save()
+        self.dwg.add(group)
+        self.dwg.saveas(filename)
 
     def _get_system_box_svg_helpers(self, system):
         """Return a list of BoxSvgHelper for all boxes of the system."""
@@ -184,7 +185,6 @@ class BoxModelSystemSvgHelper:
         reference_point = np.array(reference_point)
         corners = helper.get_box_rect_corner_coordinates()
         np_corners = [np.array(c) for c in corners]
-        print('corners', corners)
         distances = [np.linalg.norm(c-reference_point) for c in np_corners]
         sorted_corners = [c for (distance,c) in sorted(zip(distances,corners))]
         return sorted_corners
@@ -327,6 +327,7 @@ class BoxSvgHelper:
 
         self.children = []
 
+        import svgwrite
         self.dwg = svgwrite.Drawing()
         self.group = self.dwg.g(id=group_id)
 
@@ -661,3 +662,402 @@ class BoxSvgHelper:
             boxrect._content_absolute_margin = self.content_absolute_margin
             boxrect._adjust_children_width()
 
+
+
+class SystemSvgRenderer:
+    """Scalable SVG renderer of a BoxModelSystem.
+
+    In contrast to BoxModelSystemSvgHelper, the renderer does not build a
+    svgwrite document: the geometry of all boxes is computed once (numpy
+    arrays of the box sizes and positions) and the SVG elements are
+    written to the file as they are generated. The layout of a system is
+    cached and reused as long as its boxes and transports do not change.
+    Systems of thousands of boxes are rendered within seconds.
+
+    Layouts:
+        - layered (default): Boxes are assigned to layers by their
+          distance (in flows/fluxes) from the boxes without incoming
+          transports; the boxes of a layer are ordered by the barycenters
+          of their neighbours to reduce edge crossings. Layers with many
+          boxes are wrapped into several rows.
+        - force: Force-directed layout (Fruchterman-Reingold). For large
+          systems the repulsion is computed from a random sample of the
+          boxes.
+        - circle: All boxes on a circle.
+
+    Args:
+        layout (str): 'layered' (default), 'force' or 'circle'.
+
+    """
+
+    LAYOUTS = ('layered', 'force', 'circle')
+
+    def __init__(self, layout='layered'):
+        if layout not in self.LAYOUTS:
+            raise ValueError('layout must be one of {}, not {}'.format(
+                self.LAYOUTS, layout))
+        self.layout = layout
+
+        self.title_font_size = 20
+        self.text_font_size = 12
+        # Approx. average character width relative to the font size
+        self.avg_char_width = 0.6
+        self.max_line_length = 60
+        self.box_min_width = 150
+        self.box_margin = 10
+        self.box_spacing = 60
+        self.layer_spacing = 120
+        self.max_row_boxes = 25
+
+        self.box_color = 'lightgrey'
+        self.box_opacity = 0.7
+        self.box_stroke_color = 'black'
+        self.box_stroke_width = 3
+
+        self.flow_color = 'darkblue'
+        self.flow_stroke_width = 2
+        self.flux_color = 'darkred'
+        self.flux_stroke_width = 1
+        self.outside_arrow_length = 40
+        # Distance between the arrows of opposite transports
+        self.arrow_offset = 4
+
+        self.force_iterations = 80
+        self.force_sample_size = 128
+        self.random_seed = 0
+
+        self._layout_cache = {}
+
+    # PUBLIC functions
+
+    def save(self, system, filename):
+        """Save the visualization of system as a SVG file."""
+        with open(filename, 'w', encoding='utf-8') as f:
+            self.write(system, f)
+
+    def write(self, system, f):
+        """Write the visualization of system as SVG to the file object f."""
+        lines, titles = self._get_box_texts(system)
+        widths, heights = self._get_box_sizes(lines, titles)
+        positions = self.get_positions(system, widths, heights)
+        transports = self._get_transport_arrows(system, positions, widths,
+                heights)
+
+        half_sizes = np.stack([widths, heights], axis=1) / 2
+        points = [positions - half_sizes, positions + half_sizes]
+        points += [arrows[0] for arrows in transports.values()]
+        points += [arrows[1] for arrows in transports.values()]
+        points = np.concatenate([p.reshape(-1, 2) for p in points])
+        padding = self.box_spacing
+        x_min, y_min = points.min(axis=0) - padding
+        x_max, y_max = points.max(axis=0) + padding
+
+        f.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+                'width="{0:.0f}" height="{1:.0f}" '
+                'viewBox="{2:.1f} {3:.1f} {0:.1f} {1:.1f}">\n'.format(
+                    x_max - x_min, y_max - y_min, x_min, y_min))
+        f.write('<defs>\n')
+        for kind, color in (('flow', self.flow_color),
+                ('flux', self.flux_color)):
+            f.write('<marker id="{}_arrow" markerWidth="10" '
+                    'markerHeight="10" refX="9" refY="5" orient="auto" '
+                    'markerUnits="userSpaceOnUse"><path d="M0,0 L10,5 '
+                    'L0,10 z" fill="{}" /></marker>\n'.format(kind, color))
+        f.write('</defs>\n')
+
+        f.write('<g id={}>\n'.format(quoteattr(
+            bs_utils.get_valid_svg_id_from_string(system.name))))
+        f.write('<g id="boxes" fill={} fill-opacity="{}" stroke={} '
+                'stroke-width="{}">\n'.format(quoteattr(self.box_color),
+                    self.box_opacity, quoteattr(self.box_stroke_color),
+                    self.box_stroke_width))
+        for i, box in enumerate(system.box_list):
+            f.write(self._get_box_svg(box, lines[i], titles[i],
+                positions[i], widths[i], heights[i]))
+        f.write('</g>\n')
+
+        for kind, (starts, ends, names) in transports.items():
+            color = self.flow_color if kind == 'flows' else self.flux_color
+            stroke_width = (self.flow_stroke_width if kind == 'flows' else
+                    self.flux_stroke_width)
+            f.write('<g id="{}" stroke={} stroke-width="{}" '
+                    'marker-end="url(#{}_arrow)">\n'.format(kind,
+                        quoteattr(color), stroke_width,
+                        'flow' if kind == 'flows' else 'flux'))
+            f.writelines('<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" '
+                    'y2="{:.1f}"><title>{}</title></line>\n'.format(
+                        x1, y1, x2, y2, escape(name))
+                    for (x1, y1), (x2, y2), name in zip(starts, ends, names))
+            f.write('</g>\n')
+        f.write('</g>\n</svg>\n')
+
+    def get_positions(self, system, widths, heights):
+        """Return the center of every box (numpy 2D array: N_boxes, 2).
+
+        The positions are cached per layout, boxes, transports and box
+        sizes.
+
+        """
+        sources, targets = self._get_edges(system)
+        key = (self.layout, tuple(system.box_names), sources.tobytes(),
+                targets.tobytes(), widths.tobytes(), heights.tobytes())
+        if key not in self._layout_cache:
+            get_layout = getattr(self, '_get_{}_layout'.format(self.layout))
+            self._layout_cache[key] = get_layout(sources, targets, widths,
+                    heights)
+        return self._layout_cache[key]
+
+    # GEOMETRY functions
+
+    def _get_box_texts(self, system):
+        """Return the text lines and the title of every box."""
+        lines, titles = [], []
+        for box in system.box_list:
+            box_lines = []
+            if box.fluid:
+                box_lines += ['Fluid: {}'.format(box.fluid.name),
+                        'Mass: {:.3e}'.format(box.mass)]
+            for label, entities in (('Processes', box.processes),
+                    ('Reactions', box.reactions)):
+                if entities:
+                    box_lines.append('{}: {}'.format(label,
+                        ', '.join(entity.name for entity in entities)))
+            lines.append([self._truncate(line) for line in box_lines])
+            titles.append(self._truncate(box.description or box.name))
+        return lines, titles
+
+    def _truncate(self, line):
+        line = str(line).strip()
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length-3] + '...'
+        return line
+
+    def _get_box_sizes(self, lines, titles):
+        """Return the widths and heights of all boxes (numpy 1D arrays)."""
+        title_lengths = np.array([len(title) for title in titles])
+        text_lengths = np.array([max([len(line) for line in box_lines] or
+            [0]) for box_lines in lines])
+        N_lines = np.array([len(box_lines) for box_lines in lines])
+        widths = self.avg_char_width * np.maximum(
+                title_lengths * self.title_font_size,
+                text_lengths * self.text_font_size) + 2 * self.box_margin
+        widths = np.maximum(widths, self.box_min_width)
+        heights = (1.5 * self.title_font_size + (N_lines * 1.5 + 0.5) *
+                self.text_font_size + self.box_margin)
+        return widths.astype(float), heights.astype(float)
+
+    def _get_edges(self, system):
+        """Return source and target box ids of all box-to-box transports."""
+        topology = system.topology
+        sources = np.concatenate([topology.flow_source_ids,
+            topology.flux_source_ids]).astype(int)
+        targets = np.concatenate([topology.flow_target_ids,
+            topology.flux_target_ids]).astype(int)
+        internal = ((sources != bs_topology.OUTSIDE) &
+                (targets != bs_topology.OUTSIDE))
+        edges = np.unique(np.stack([sources[internal], targets[internal]],
+            axis=1).reshape(-1, 2), axis=0)
+        return edges[:, 0].copy(), edges[:, 1].copy()
+
+    # LAYOUT functions
+
+    def _get_layers(self, N, sources, targets):
+        """Return the BFS distance of every box from the root boxes."""
+        order = np.argsort(sources, kind='stable')
+        neighbours = targets[order]
+        starts = np.searchsorted(sources[order], np.arange(N+1))
+        has_incoming = np.zeros(N, dtype=bool)
+        has_incoming[targets] = True
+
+        layers = np.full(N, -1)
+        queue = collections.deque(np.flatnonzero(~has_incoming))
+        layers[list(queue)] = 0
+        while True:
+            while queue:
+                node = queue.popleft()
+                for neighbour in neighbours[starts[node]:starts[node+1]]:
+                    if layers[neighbour] < 0:
+                        layers[neighbour] = layers[node] + 1
+                        queue.append(neighbour)
+            if layers.min() >= 0:
+                return layers
+            # Cycle without a root: start from its first box
+            root = int(np.argmin(layers))
+            layers[root] = 0
+            queue.append(root)
+
+    def _get_layered_layout(self, sources, targets, widths, heights):
+        N = len(widths)
+        layers = self._get_layers(N, sources, targets)
+        layer_sizes = np.bincount(layers)
+
+        # Barycenter ordering: every box moves to the mean relative
+        # position of its neighbours within their layers.
+        keys = np.arange(N, dtype=float)
+        degree = (np.bincount(sources, minlength=N) +
+                np.bincount(targets, minlength=N))
+        for _ in range(8):
+            order = np.lexsort((keys, layers))
+            ranks = np.empty(N)
+            ranks[order] = np.arange(N) - np.repeat(
+                    np.cumsum(layer_sizes) - layer_sizes, layer_sizes)
+            relative = (ranks + 0.5) / layer_sizes[layers]
+            sums = (np.bincount(sources, relative[targets], minlength=N) +
+                    np.bincount(targets, relative[sources], minlength=N))
+            keys = np.where(degree > 0, sums / np.maximum(degree, 1),
+                    relative)
+        order = np.lexsort((keys, layers))
+        ranks = np.empty(N, dtype=int)
+        ranks[order] = np.arange(N) - np.repeat(
+                np.cumsum(layer_sizes) - layer_sizes, layer_sizes)
+
+        # Wrap large layers into rows of at most max_row_boxes boxes
+        layer_rows = -(-layer_sizes // self.max_row_boxes)
+        rows = ((np.cumsum(layer_rows) - layer_rows)[layers] +
+                ranks // self.max_row_boxes)
+        order = np.lexsort((ranks, rows))
+        N_rows = rows.max() + 1
+
+        spaced_widths = widths + self.box_spacing
+        row_widths = np.bincount(rows, spaced_widths, minlength=N_rows)
+        lefts = np.empty(N)
+        cumulated = np.cumsum(spaced_widths[order])
+        row_starts = np.cumsum(row_widths) - row_widths
+        lefts[order] = cumulated - spaced_widths[order] - row_starts[
+                rows[order]]
+        x = lefts + widths / 2 - row_widths[rows] / 2
+
+        row_heights = np.zeros(N_rows)
+        np.maximum.at(row_heights, rows, heights)
+        row_tops = np.cumsum(row_heights + self.layer_spacing) - (
+                row_heights + self.layer_spacing)
+        y = row_tops[rows] + heights / 2
+        return np.stack([x, y], axis=1)
+
+    def _get_force_layout(self, sources, targets, widths, heights):
+        N = len(widths)
+        random_state = np.random.RandomState(self.random_seed)
+        # Ideal distance between connected boxes
+        k = np.hypot(widths, heights).mean() + self.box_spacing
+        positions = random_state.uniform(-1, 1, (N, 2)) * k * np.sqrt(N)
+        temperature = k * np.sqrt(N) / 4
+        cooling = (0.01 ** (1 / self.force_iterations))
+
+        for _ in range(self.force_iterations):
+            if N > self.force_sample_size:
+                sample = random_state.choice(N, self.force_sample_size,
+                        replace=False)
+                scale = N / self.force_sample_size
+            else:
+                sample, scale = slice(None), 1
+            # Repulsion k^2/d between all boxes (and the sample)
+            dx = np.subtract.outer(positions[:, 0], positions[sample, 0])
+            dy = np.subtract.outer(positions[:, 1], positions[sample, 1])
+            factors = dx * dx
+            factors += dy * dy
+            np.maximum(factors, 1e-9, out=factors)
+            np.divide(scale * k**2, factors, out=factors)
+            displacements = np.stack([(dx * factors).sum(axis=1),
+                (dy * factors).sum(axis=1)], axis=1)
+            # Attraction d^2/k along all transports
+            deltas = positions[sources] - positions[targets]
+            forces = deltas * (np.sqrt((deltas**2).sum(axis=1)) / k)[:, None]
+            np.subtract.at(displacements, sources, forces)
+            np.add.at(displacements, targets, forces)
+
+            lengths = np.maximum(np.sqrt((displacements**2).sum(axis=1)),
+                    1e-9)
+            positions += displacements * (np.minimum(lengths, temperature) /
+                    lengths)[:, None]
+            temperature *= cooling
+        return positions - positions.mean(axis=0)
+
+    def _get_circle_layout(self, sources, targets, widths, heights):
+        N = len(widths)
+        circumference = (np.hypot(widths, heights) + self.box_spacing).sum()
+        radius = max(circumference / (2 * np.pi), widths.max()) if N > 1 \
+                else 0
+        angles = 2 * np.pi * np.arange(N) / N
+        return radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+
+    # TRANSPORT functions
+
+    def _clip_to_boxes(self, centers, directions, half_sizes):
+        """Return the points where the rays centers+t*directions leave the
+        boxes."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.min(half_sizes / np.abs(directions), axis=1)
+        t = np.where(np.isfinite(t), t, 0)
+        return centers + t[:, None] * directions
+
+    def _get_transport_arrows(self, system, positions, widths, heights):
+        """Return start points, end points and names of all arrows."""
+        half_sizes = np.stack([widths, heights], axis=1) / 2
+        topology = system.topology
+        arrows = {}
+        for kind, transports, sources, targets in (
+                ('flows', system.flows, topology.flow_source_ids,
+                    topology.flow_target_ids),
+                ('fluxes', system.fluxes, topology.flux_source_ids,
+                    topology.flux_target_ids)):
+            sources = np.asarray(sources, dtype=int)
+            targets = np.asarray(targets, dtype=int)
+            starts = np.empty((len(transports), 2))
+            ends = np.empty((len(transports), 2))
+
+            internal = ((sources != bs_topology.OUTSIDE) &
+                    (targets != bs_topology.OUTSIDE))
+            s, t = sources[internal], targets[internal]
+            directions = positions[t] - positions[s]
+            lengths = np.maximum(np.sqrt((directions**2).sum(axis=1)), 1e-9)
+            # Shift the arrows to the right (relative to their direction)
+            # such that the arrows of opposite transports do not overlap
+            normals = np.stack([-directions[:, 1], directions[:, 0]],
+                    axis=1) / lengths[:, None]
+            offsets = self.arrow_offset * normals
+            starts[internal] = self._clip_to_boxes(positions[s],
+                    directions, half_sizes[s]) + offsets
+            ends[internal] = self._clip_to_boxes(positions[t], -directions,
+                    half_sizes[t]) + offsets
+
+            # Transports from outside enter at the top of their box and
+            # transports out of the system leave at its bottom.
+            inflow = sources == bs_topology.OUTSIDE
+            t = targets[inflow]
+            ends[inflow] = positions[t] - np.stack([np.zeros(len(t)),
+                half_sizes[t, 1]], axis=1)
+            starts[inflow] = ends[inflow] - [0, self.outside_arrow_length]
+            outflow = targets == bs_topology.OUTSIDE
+            s = sources[outflow]
+            starts[outflow] = positions[s] + np.stack([np.zeros(len(s)),
+                half_sizes[s, 1]], axis=1)
+            ends[outflow] = starts[outflow] + [0, self.outside_arrow_length]
+
+            arrows[kind] = (starts, ends, [transport.name for transport in
+                transports])
+        return arrows
+
+    # SVG functions
+
+    def _get_box_svg(self, box, lines, title, position, width, height):
+        """Return the SVG elements of one box."""
+        x, y = position[0] - width / 2, position[1] - height / 2
+        elements = ['<g id={}>'.format(quoteattr(
+            bs_utils.get_valid_svg_id_from_string('{}_box'.format(
+                box.name)))),
+            '<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" '
+            'height="{:.1f}" />'.format(x, y, width, height),
+            '<text x="{:.1f}" y="{:.1f}" font-size="{}" '
+            'text-anchor="middle" stroke="none" fill="black">{}'
+            '</text>'.format(position[0], y + 1.1 * self.title_font_size,
+                self.title_font_size, escape(title))]
+        text_x = x + self.box_margin
+        text_y = y + 1.5 * self.title_font_size + 1.25 * self.text_font_size
+        for i, line in enumerate(lines):
+            elements.append('<text x="{:.1f}" y="{:.1f}" font-size="{}" '
+                    'stroke="none" fill="black">{}</text>'.format(text_x,
+                        text_y + 1.5 * i * self.text_font_size,
+                        self.text_font_size, escape(line)))
+        elements.append('</g>\n')
+        return ''.join(elements)
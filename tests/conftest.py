@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Configuration of pytest for the tests of boxsimu.
+
+All caches of boxsimu (see units.py and cache.py) are written to a
+temporary directory instead of the cache directory of the user. The
+variable is set before the test modules import boxsimu (which creates
+the unit registry) and is inherited by subprocesses of the tests.
+
+"""
+
+import os
+import tempfile
+
+
+_cache_dir = None
+
+
+def pytest_configure(config):
+    global _cache_dir
+    _cache_dir = tempfile.TemporaryDirectory(prefix='boxsimu-tests-')
+    os.environ['BOXSIMU_CACHE_DIR'] = _cache_dir.name
+
+
+def pytest_unconfigure(config):
+    if _cache_dir is not None:
+        _cache_dir.cleanup()
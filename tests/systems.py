@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Systems shared by the tests of boxsimu.
+
+Most tests use a system of an upper and a deep ocean box of seawater.
+get_ocean_system builds the variants of this system; the tests only pass
+the variables, rates and transports they need.
+
+"""
+
+import os
+import sys
+
+if not os.path.abspath(__file__ + "/../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../"))
+
+from boxsimu.entities import Fluid, Variable
+from boxsimu.box import Box
+from boxsimu.transport import Flow
+from boxsimu.system import BoxModelSystem
+from boxsimu.process import Process
+from boxsimu import ur
+
+
+def get_po4_decay():
+    """Return the decay of po4 by 10% per year."""
+    return Process('po4_decay', variable=Variable('po4'),
+            rate=lambda t, c, s: -c.po4 * 0.1 / ur.year)
+
+
+def get_downwelling(upper_ocean, deep_ocean):
+    """Return the flows and fluxes of a downwelling of 1e15 kg/year."""
+    return [Flow('downwelling', upper_ocean, deep_ocean,
+        1e15*ur.kg/ur.year)], []
+
+
+def _get_variables(masses):
+    return [(Variable(variable) if isinstance(variable, str) else
+        variable).q(mass) for variable, mass in masses.items()]
+
+
+def get_ocean_system(upper_variables=None, deep_variables=None,
+        upper_processes=None, deep_processes=None, upper_reactions=None,
+        deep_reactions=None, upper_condition=None, deep_condition=None,
+        global_condition=None, transports=get_downwelling,
+        name='test_system'):
+    """Return a system of an upper and a deep ocean box of seawater.
+
+    Args:
+        upper_variables (dict): Initial masses of the variables (Variables
+            or their names) in the upper ocean box (default: 1kg po4).
+        deep_variables (dict): Initial masses of the variables in the
+            deep ocean box (default: 2kg po4).
+        upper_processes, deep_processes (list): Processes of the boxes.
+        upper_reactions, deep_reactions (list): Reactions of the boxes.
+        upper_condition, deep_condition (Condition): Conditions of the
+            boxes.
+        global_condition (Condition): Global condition of the system.
+        transports (callable): Called with the upper and the deep ocean
+            box; returns the flows and the fluxes of the system (default:
+            get_downwelling).
+        name (str): Name of the system.
+
+    """
+    if upper_variables is None:
+        upper_variables = {'po4': 1*ur.kg}
+    if deep_variables is None:
+        deep_variables = {'po4': 2*ur.kg}
+    seawater = Fluid('seawater', rho=1000*ur.kg/ur.meter**3)
+    upper_ocean = Box('upper_ocean', 'Upper Ocean Box',
+        fluid=seawater.q(1e16*ur.kg), condition=upper_condition,
+        variables=_get_variables(upper_variables),
+        processes=upper_processes, reactions=upper_reactions)
+    deep_ocean = Box('deep_ocean', 'Deep Ocean Box',
+        fluid=seawater.q(1e18*ur.kg), condition=deep_condition,
+        variables=_get_variables(deep_variables),
+        processes=deep_processes, reactions=deep_reactions)
+    flows, fluxes = transports(upper_ocean, deep_ocean)
+    return BoxModelSystem(name, [upper_ocean, deep_ocean],
+            global_condition=global_condition, flows=flows, fluxes=fluxes)
+
+
+def get_decay_system():
+    """Return the ocean system with a decay of po4 in the upper box."""
+    return get_ocean_system(upper_processes=[get_po4_decay()])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import json
+import tempfile
+import unittest
+from unittest import TestCase
+
+import sys
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from benchmarks.generator import get_synthetic_system
+from benchmarks.runner import (get_sweep, run_benchmark, write_csv,
+        write_json)
+
+
+class GeneratorTest(TestCase):
+    """Test the generator of synthetic systems."""
+
+    def test_counts(self):
+        system = get_synthetic_system(N_boxes=8, N_variables=3,
+                N_reactions=2, N_processes=1, N_flows=10, N_fluxes=5)
+        self.assertEqual(system.N_boxes, 8)
+        self.assertEqual(system.N_variables, 3)
+        self.assertEqual(len(system.reactions), 2)
+        self.assertEqual(len(system.processes), 1)
+        self.assertEqual(len(system.flows), 10)
+        self.assertEqual(len(system.fluxes), 5)
+
+    def test_dynamic_fraction(self):
+        static = get_synthetic_system(N_boxes=8, dynamic_fraction=0)
+        self.assertTrue(all(f.rate.is_static for f in static.flows))
+        dynamic = get_synthetic_system(N_boxes=8, dynamic_fraction=1)
+        self.assertTrue(all(f.rate.is_dynamic
+            for f in dynamic.flows + dynamic.fluxes))
+
+    def test_reproducible(self):
+        system1 = get_synthetic_system(N_boxes=6, N_variables=2, seed=3)
+        system2 = get_synthetic_system(N_boxes=6, N_variables=2, seed=3)
+        self.assertEqual(system1.state.tolist(), system2.state.tolist())
+
+
+class RunnerTest(TestCase):
+    """Test the benchmark runner."""
+
+    def test_run_and_write(self):
+        result = run_benchmark(N_timesteps=2, N_boxes=4, N_variables=2)
+        self.assertEqual(result['N_boxes'], 4)
+        self.assertGreater(result['steps_per_second'], 0)
+        self.assertIn('time_reactions', result)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'results')
+            write_csv([result], file_name + '.csv')
+            write_json([result], file_name + '.json')
+            with open(file_name + '.csv') as f:
+                rows = list(csv.DictReader(f))
+            with open(file_name + '.json') as f:
+                data = json.load(f)
+        self.assertEqual(rows[0]['N_variables'], '2')
+        self.assertEqual(data[0]['N_timesteps'], 2)
+
+    def test_sweep_limits(self):
+        configs = get_sweep('boxes', max_boxes=64)
+        self.assertEqual([c['N_boxes'] for c in configs], [4, 16, 64])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.condition import Condition
+from boxsimu.transport import Flow, Flux
+from boxsimu.process import Reaction
+from boxsimu.solver import StaticContributions
+from boxsimu import cache as bs_cache
+from boxsimu import ur
+
+from tests.systems import get_ocean_system, get_po4_decay
+
+
+def get_system(river_rate=1e12*ur.kg/ur.year, po4_mass=1*ur.kg):
+    po4 = Variable('po4')
+    phyto = Variable('phyto')
+
+    def get_transports(upper_ocean, deep_ocean):
+        flows = [
+            Flow('downwelling', upper_ocean, deep_ocean,
+                1e15*ur.kg/ur.year),
+            Flow('upwelling', deep_ocean, upper_ocean,
+                lambda t, c, s: 1e15*ur.kg/ur.year),
+            Flow('river', None, upper_ocean, river_rate,
+                concentrations={po4: 1e-9*ur.kg/ur.kg}),
+        ]
+        fluxes = [Flux('sedimentation', upper_ocean, deep_ocean, phyto,
+            0.1*ur.kg/ur.year)]
+        return flows, fluxes
+
+    uptake = Reaction('uptake', {po4: -1, phyto: 1}, 1*ur.kg/ur.year)
+    return get_ocean_system(
+        upper_variables={po4: po4_mass, phyto: 3*ur.kg},
+        upper_processes=[get_po4_decay()], upper_reactions=[uptake],
+        upper_condition=Condition(T=290*ur.kelvin),
+        transports=get_transports, name='ocean')
+
+
+class ModelHashTest(TestCase):
+    """Test the content hash of the compiled parts of a system."""
+
+    def test_masses_are_not_hashed(self):
+        self.assertEqual(bs_cache.get_model_hash(get_system()),
+                bs_cache.get_model_hash(get_system(po4_mass=5*ur.kg)))
+
+    def test_static_rates_and_topology_are_hashed(self):
+        system_hash = bs_cache.get_model_hash(get_system())
+        self.assertNotEqual(system_hash, bs_cache.get_model_hash(
+            get_system(river_rate=2e12*ur.kg/ur.year)))
+        system = get_system()
+        system.boxes.upper_ocean.condition.T = 280*ur.kelvin
+        self.assertNotEqual(system_hash, bs_cache.get_model_hash(system))
+        system = get_system()
+        system.fluxes[0].target_box = None
+        self.assertNotEqual(system_hash, bs_cache.get_model_hash(system))
+
+
+class CompilationCacheTest(TestCase):
+    """Test the on-disk cache of compiled arrays."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = bs_cache.CompilationCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+        A = np.zeros((100, 100))
+        A[3, 4] = 2.5
+        self.cache.put('key', {'A': A, 's': np.arange(3.0)})
+        arrays = self.cache.get('key')
+        np.testing.assert_array_equal(arrays['A'], A)
+        np.testing.assert_array_equal(arrays['s'], np.arange(3.0))
+        self.assertIsNone(self.cache.get('other'))
+        # Only the nonzero elements are stored
+        self.assertLess(self.cache.size, A.nbytes / 10)
+
+    def test_least_recently_used_files_are_evicted(self):
+        arrays = {'s': np.arange(1.0, 1001.0)}
+        for i, key in enumerate(['a', 'b', 'c']):
+            self.cache.put(key, arrays)
+            os.utime(self.cache._get_file_name(key), (i, i))
+        self.cache.get('a')
+        self.cache.max_size = self.cache.size - 1
+        self.cache.evict()
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+
+    def test_corrupt_file_is_removed(self):
+        with open(self.cache._get_file_name('key'), 'wb') as f:
+            f.write(b'corrupt')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_static_contributions(self):
+        system = get_system()
+        expected = StaticContributions(system)
+        compiled = StaticContributions(system, self.cache)
+        cached = StaticContributions(get_system(po4_mass=5*ur.kg),
+                self.cache)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        for static in [compiled, cached]:
+            arrays = static._get_arrays()
+            for name, array in expected._get_arrays().items():
+                np.testing.assert_array_equal(arrays[name], array)
+            self.assertEqual([f.name for f in static.dynamic_flows],
+                    ['upwelling'])
+
+        # The arrays of a known model are not compiled again
+        key = bs_cache.get_model_hash(system)
+        arrays = expected._get_arrays()
+        arrays['A_fluid'] = np.full((2, 2), 7.0)
+        self.cache.put(key, arrays)
+        static = StaticContributions(system, self.cache)
+        self.assertEqual(static.A_fluid[0, 1], 7*ur.kg/ur.second)
+
+    def test_solve_uses_the_cache(self):
+        first = get_system().solve(5*ur.year, 1*ur.year, cache=self.cache)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        second = get_system().solve(5*ur.year, 1*ur.year, cache=self.cache)
+        np.testing.assert_array_equal(second.data, first.data)
+
+    def test_cache_is_opt_in(self):
+        environ = os.environ.get('BOXSIMU_CACHE_DIR')
+        os.environ['BOXSIMU_CACHE_DIR'] = self.directory.name
+        try:
+            get_system().solve(2*ur.year, 1*ur.year)
+            self.assertEqual(os.listdir(self.directory.name), [])
+            get_system().solve(2*ur.year, 1*ur.year, cache=True)
+        finally:
+            if environ is None:
+                del os.environ['BOXSIMU_CACHE_DIR']
+            else:
+                os.environ['BOXSIMU_CACHE_DIR'] = environ
+        self.assertEqual(len(os.listdir(os.path.join(self.directory.name,
+            'compiled'))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from unittest import TestCase
+
+import sys
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.transport import  Flux
+from boxsimu.condition import Condition
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def get_transports(upper_ocean, deep_ocean):
+    fluxes = [
+        Flux('mixing', deep_ocean, upper_ocean, Variable('po4'),
+            lambda t, c, s: c.upper_ocean.variables.po4 / ur.year),
+    ]
+    return [], fluxes
+
+
+def get_system():
+    return get_ocean_system(
+        upper_variables={'po4': 5*ur.kg},
+        deep_variables={'po4': 10*ur.kg},
+        upper_condition=Condition(T=333*ur.kelvin),
+        deep_condition=Condition(T=222*ur.kelvin, pH=8.1),
+        global_condition=Condition(T=111*ur.kelvin, pH=7.0),
+        transports=get_transports)
+
+
+class BoxContextTest(TestCase):
+    """Test the context views passed to user-defined functions."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.uo = self.system.boxes.upper_ocean
+        self.do = self.system.boxes.deep_ocean
+
+    def test_context_of_box(self):
+        global_context = self.system.get_box_context()
+        uo_context = self.system.get_box_context(self.uo)
+        self.assertEqual(global_context.T, 111 * ur.kelvin)
+        self.assertEqual(uo_context.T, 333 * ur.kelvin)
+        self.assertEqual(uo_context.pH, 7.0)
+        self.assertEqual(uo_context.global_condition.T, 111 * ur.kelvin)
+        self.assertEqual(uo_context.deep_ocean.condition.T, 222 * ur.kelvin)
+        self.assertEqual(global_context.upper_ocean.variables.po4,
+                5 * ur.kg)
+
+    def test_masses_are_read_lazily(self):
+        context = self.uo.context
+        self.assertEqual(context.po4, 5 * ur.kg)
+        self.uo.variables.po4.mass = 7 * ur.kg
+        self.assertIs(self.uo.context, context)
+        self.assertEqual(context.po4, 7 * ur.kg)
+        self.assertEqual(context['po4'], 7 * ur.kg)
+
+    def test_condition_is_not_modified(self):
+        self.uo.context.po4
+        self.assertNotIn('po4', self.uo.condition)
+        self.assertNotIn('pH', self.uo.condition)
+        with self.assertRaises(AttributeError):
+            self.uo.context.po4 = 1 * ur.kg
+
+    def test_magnitudes(self):
+        context = self.system.get_box_context(self.uo, magnitudes=True)
+        self.assertEqual(context.po4, 5.0)
+        self.assertEqual(context.T, 333.0)
+        self.assertEqual(context.pH, 7.0)
+        self.assertEqual(context.deep_ocean.variables.po4, 10.0)
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            self.uo.context.no3
+        with self.assertRaises(KeyError):
+            self.uo.context['no3']
+
+    def test_tracing_of_other_boxes(self):
+        graph = self.system.get_dependency_graph()
+        node = [n for n in graph.nodes if n.kind == 'flux'][0]
+        self.assertEqual(node.inputs.masses,
+                {(self.uo.id, 1 + self.system.variables.po4.id)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from unittest import TestCase
+
+import sys
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.transport import  Flow, Flux
+from boxsimu.condition import Condition
+from boxsimu.process import Process, Reaction
+from boxsimu.tracing import AccessRecorder, get_traced_time
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def get_transports(upper_ocean, deep_ocean):
+    flows = [
+        Flow('downwelling', upper_ocean, deep_ocean, 1e15*ur.kg/ur.year),
+        Flow('upwelling', deep_ocean, upper_ocean, 1e15*ur.kg/ur.year),
+    ]
+    fluxes = [
+        Flux('biological_pump', upper_ocean, deep_ocean, Variable('phyto'),
+            lambda t, c, s: (s.boxes.upper_ocean.variables.phyto.mass *
+                s.boxes.upper_ocean.condition.T / (290*ur.kelvin) / ur.year)),
+    ]
+    return flows, fluxes
+
+
+def get_system():
+    po4 = Variable('po4')
+    phyto = Variable('phyto')
+
+    po4_release = Process(
+        name='po4_release',
+        variable=po4,
+        rate=lambda t, c, s: 1e3*ur.kg/ur.year * (1 + t/ur.year),
+    )
+    photosynthesis = Reaction(
+        name='photosynthesis',
+        reaction_coefficients={po4: -1, phyto: 114},
+        rate=lambda t, c, s: c.po4 * 0.8 / ur.year,
+    )
+    return get_ocean_system(
+        upper_variables={po4: 1*ur.kg, phyto: 2*ur.kg},
+        deep_variables={po4: 3*ur.kg, phyto: 4*ur.kg},
+        upper_processes=[po4_release],
+        upper_reactions=[photosynthesis],
+        upper_condition=Condition(T=290*ur.kelvin),
+        deep_condition=Condition(T=275*ur.kelvin),
+        transports=get_transports)
+
+
+class DependencyGraphTest(TestCase):
+    """Test the tracing of the inputs of user-defined rates."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.graph = self.system.get_dependency_graph()
+        self.uo = self.system.boxes.upper_ocean
+        self.do = self.system.boxes.deep_ocean
+        self.po4 = self.system.variables.po4
+        self.phyto = self.system.variables.phyto
+
+    def get_node(self, kind, name):
+        return [n for n in self.graph.nodes
+                if n.kind == kind and n.owner.name == name][0]
+
+    def test_static_flow_has_no_inputs(self):
+        node = self.get_node('flow', 'downwelling')
+        self.assertTrue(node.inputs.is_constant)
+        self.assertEqual(node.targets,
+                {(self.uo.id, 0), (self.uo.id, 1 + self.po4.id),
+                 (self.uo.id, 1 + self.phyto.id), (self.do.id, 0),
+                 (self.do.id, 1 + self.po4.id),
+                 (self.do.id, 1 + self.phyto.id)})
+
+    def test_process_reads_time_only(self):
+        node = self.get_node('process', 'po4_release')
+        self.assertTrue(node.inputs.time)
+        self.assertEqual(node.inputs.masses, set())
+        self.assertEqual(node.targets, {(self.uo.id, 1 + self.po4.id)})
+
+    def test_traced_time(self):
+        time = 2*ur.year
+        for function, value in [
+                (lambda t: t.to(ur.day), 730.5*ur.day),
+                (lambda t: 1*ur.year + t, 3*ur.year),
+                (lambda t: np.exp(-t.magnitude), np.exp(-2)),
+                (lambda t: t > 1*ur.year, True),
+                (lambda t: float(t / ur.year), 2.0)]:
+            recorder = AccessRecorder()
+            traced_time = get_traced_time(time, recorder)
+            self.assertFalse(recorder.time)
+            self.assertEqual(function(traced_time), value)
+            self.assertTrue(recorder.time)
+
+    def test_reaction_reads_context_variable(self):
+        node = self.get_node('reaction', 'photosynthesis')
+        self.assertFalse(node.inputs.time)
+        self.assertEqual(node.inputs.masses, {(self.uo.id, 1 + self.po4.id)})
+
+    def test_flux_reads_system(self):
+        node = self.get_node('flux', 'biological_pump')
+        self.assertEqual(node.inputs.masses,
+                {(self.uo.id, 1 + self.phyto.id)})
+        self.assertEqual(node.inputs.conditions, {('upper_ocean', 'T')})
+
+    def test_untraced_methods_depend_on_everything(self):
+        rate = self.uo.reactions[0].rate
+        rate.expression = lambda t, c, s: (c.T / (290*ur.kelvin) *
+                s.boxes.upper_ocean.get_concentration(s.variables.po4) *
+                1e16*ur.kg / ur.year)
+        graph = self.system.get_dependency_graph(0*ur.second)
+        node = [n for n in graph.nodes if n.kind == 'reaction'][0]
+        self.assertFalse(node.inputs.complete)
+        # Names and conditions are not state dependent
+        rate.expression = lambda t, c, s: (len(s.boxes.upper_ocean.name) *
+                c.T / (290*ur.kelvin) * ur.kg / ur.year)
+        graph = self.system.get_dependency_graph(0*ur.second)
+        node = [n for n in graph.nodes if n.kind == 'reaction'][0]
+        self.assertTrue(node.inputs.is_constant)
+
+    def test_failing_function_depends_on_everything(self):
+        self.uo.reactions[0].rate.expression = lambda t, c, s: 1/0
+        graph = self.system.get_dependency_graph(0*ur.second)
+        node = [n for n in graph.nodes if n.kind == 'reaction'][0]
+        self.assertFalse(node.inputs.complete)
+        self.assertEqual(len(graph.get_input_indices(node)), graph.N_states)
+
+    def test_jacobian_sparsity(self):
+        S = self.system.get_jacobian_sparsity()
+        idx = self.graph.get_state_index
+        self.assertEqual(S.shape, (6, 6))
+        # The reaction in the upper ocean reads PO4 and changes PO4/phyto
+        self.assertTrue(S[idx(self.uo.id, 1 + self.phyto.id),
+                          idx(self.uo.id, 1 + self.po4.id)])
+        # The deep ocean phyto receives the biological pump
+        self.assertTrue(S[idx(self.do.id, 1 + self.phyto.id),
+                          idx(self.uo.id, 1 + self.phyto.id)])
+        # Static fluid flows do not depend on any state
+        self.assertFalse(np.any(S[idx(self.uo.id, 0), :]))
+        # Passive transport depends on the source box concentration
+        self.assertTrue(S[idx(self.uo.id, 1 + self.po4.id),
+                          idx(self.do.id, 0)])
+        # PO4 in the deep ocean does not depend on the upper ocean phyto
+        self.assertFalse(S[idx(self.do.id, 1 + self.po4.id),
+                           idx(self.uo.id, 1 + self.phyto.id)])
+
+    def test_node_adjacency(self):
+        adjacency = self.graph.get_node_adjacency()
+        pump = self.graph.nodes.index(self.get_node('flux', 'biological_pump'))
+        reaction = self.graph.nodes.index(
+                self.get_node('reaction', 'photosynthesis'))
+        self.assertTrue(adjacency[pump, reaction])
+        self.assertFalse(adjacency[reaction, pump])
+
+
+class IncrementalEvaluationTest(TestCase):
+    """Test the re-evaluation of rates only on changed inputs."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.uo = self.system.boxes.upper_ocean
+        self.reaction = self.uo.reactions[0]
+        self.calls = []
+        expression = self.reaction.rate.expression
+        def counted_expression(t, c, s):
+            self.calls.append(t)
+            return expression(t, c, s)
+        self.reaction.rate.expression = counted_expression
+        self.evaluator = self.system.enable_incremental_evaluation(
+                rtol=1e-6)
+        # Forget the evaluation used for tracing
+        del self.calls[:]
+
+    def evaluate_reaction(self, time):
+        return self.reaction.rate(time, self.uo.context, self.system)
+
+    def test_unchanged_inputs_are_served_from_cache(self):
+        self.evaluate_reaction(0*ur.second)
+        self.evaluate_reaction(1*ur.second)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.evaluator.hits, 1)
+
+    def test_changed_inputs_are_reevaluated(self):
+        r1 = self.evaluate_reaction(0*ur.second)
+        self.uo.variables.po4.mass = 2 * ur.kg
+        r2 = self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 2)
+        self.assertAlmostEqual((r2 / r1).magnitude, 2)
+
+    def test_changes_within_tolerance_are_ignored(self):
+        self.evaluate_reaction(0*ur.second)
+        self.uo.variables.po4.mass = (1 + 1e-8) * ur.kg
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_time_dependent_rate_is_reevaluated(self):
+        process = self.uo.processes[0]
+        r1 = process.rate(0*ur.second, self.uo.context, self.system)
+        r2 = process.rate(0*ur.second, self.uo.context, self.system)
+        r3 = process.rate(1*ur.year, self.uo.context, self.system)
+        self.assertEqual(r1, r2)
+        self.assertAlmostEqual(r3.magnitude, 2 * r1.magnitude)
+
+    def test_declared_inputs(self):
+        self.system.disable_incremental_evaluation()
+        self.reaction.rate.declare_inputs('phyto')
+        self.system.get_dependency_graph(0*ur.second)
+        self.system.enable_incremental_evaluation()
+        self.evaluate_reaction(0*ur.second)
+        # po4 is not a declared input: its change is not noticed
+        self.uo.variables.po4.mass = 2 * ur.kg
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 1)
+        self.uo.variables.phyto.mass = 5 * ur.kg
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_disable(self):
+        self.system.disable_incremental_evaluation()
+        self.evaluate_reaction(0*ur.second)
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 2)
+
+    def set_reaction_rate(self, function):
+        self.reaction.rate.expression = function
+        self.system.get_dependency_graph(0*ur.second)
+        self.evaluator = self.system.enable_incremental_evaluation(
+                rtol=1e-6)
+
+    def test_rate_reading_untraced_methods(self):
+        def rate(t, c, s):
+            self.calls.append(t)
+            po4 = s.variables.po4
+            return s.boxes.upper_ocean.get_concentration(po4) * 1e16 * \
+                    ur.kg / ur.year
+        self.set_reaction_rate(rate)
+        r1 = self.evaluate_reaction(0*ur.second)
+        self.uo.variables.po4.mass = 2 * ur.kg
+        r2 = self.evaluate_reaction(0*ur.second)
+        self.assertAlmostEqual((r2 / r1).magnitude, 2)
+
+    def test_inputs_of_branches_are_added(self):
+        def rate(t, c, s):
+            self.calls.append(t)
+            if c.phyto > 5*ur.kg:
+                return c.po4 * 0.8 / ur.year
+            return 0 * ur.kg / ur.year
+        self.set_reaction_rate(rate)
+        del self.calls[:]
+        self.assertEqual(self.evaluate_reaction(0*ur.second).magnitude, 0)
+        self.uo.variables.phyto.mass = 10 * ur.kg
+        r1 = self.evaluate_reaction(0*ur.second)
+        # po4 was not read by the first evaluation
+        self.uo.variables.po4.mass = 2 * ur.kg
+        r2 = self.evaluate_reaction(0*ur.second)
+        self.assertAlmostEqual((r2 / r1).magnitude, 2)
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_solution_equals_full_evaluation(self):
+        def get_data(incremental):
+            system = get_system()
+            uo = system.boxes.upper_ocean
+            uo.reactions[0].rate.expression = lambda t, c, s: (
+                    s.boxes.upper_ocean.get_concentration(s.variables.po4)
+                    * 1e16 * ur.kg / ur.year)
+            if incremental:
+                system.enable_incremental_evaluation()
+            sol = system.solve(5*ur.year, 1*ur.year, verbose=False)
+            return sol.data
+        np.testing.assert_array_equal(get_data(True), get_data(False))
+
+    def test_clones_have_their_own_evaluator(self):
+        clone = self.system.clone()
+        uo = clone.boxes.upper_ocean
+        self.assertIs(uo.reactions[0].rate, self.reaction.rate)
+        self.assertIsNot(clone.incremental_evaluator, self.evaluator)
+        self.evaluate_reaction(0*ur.second)
+        # The clone's state is independent of the cache of the original
+        uo.variables.po4.mass = 2 * ur.kg
+        r1 = self.evaluate_reaction(0*ur.second)
+        r2 = self.reaction.rate(0*ur.second, uo.context, clone)
+        r3 = self.reaction.rate(0*ur.second, uo.context, clone)
+        self.assertAlmostEqual((r2 / r1).magnitude, 2)
+        self.assertEqual(r2, r3)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.evaluator.evaluations, 1)
+        self.assertEqual(clone.incremental_evaluator.hits, 1)
+        clone.disable_incremental_evaluation()
+        self.evaluate_reaction(0*ur.second)
+        self.assertEqual(self.evaluator.hits, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu import downsampling as bs_downsampling
+from boxsimu import ur
+
+from tests.systems import get_decay_system
+
+
+class DownsamplingTest(TestCase):
+    """Test the visual downsampling of long time series."""
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.x = np.arange(100000, dtype=float)
+        self.y = np.cumsum(random_state.normal(size=100000))
+        self.y[12345] = 1e3
+
+    def test_minmax(self):
+        x, y = bs_downsampling.downsample(self.x, self.y, 1000)
+        self.assertLessEqual(len(x), 1000)
+        self.assertEqual(y.max(), self.y.max())
+        self.assertEqual(y.min(), self.y.min())
+        self.assertTrue(np.all(np.diff(x) > 0))
+        np.testing.assert_array_equal(y, self.y[x.astype(int)])
+
+    def test_minmax_ignores_nan(self):
+        self.y[:50000] = np.nan
+        x, y = bs_downsampling.downsample(self.x, self.y, 1000)
+        self.assertEqual(np.nanmin(y), np.nanmin(self.y))
+        self.assertEqual(np.nanmax(y), np.nanmax(self.y))
+
+    def test_lttb(self):
+        x, y = bs_downsampling.downsample(self.x, self.y, 1000,
+                method='lttb')
+        self.assertEqual(len(x), 1000)
+        self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertIn(1e3, y)
+
+    def test_short_series_are_unchanged(self):
+        for method in bs_downsampling.METHODS:
+            x, y = bs_downsampling.downsample(self.x[:10], self.y[:10], 10,
+                    method)
+            np.testing.assert_array_equal(y, self.y[:10])
+        x, y = bs_downsampling.downsample(self.x, self.y, None)
+        self.assertEqual(len(x), len(self.x))
+        with self.assertRaises(ValueError):
+            bs_downsampling.downsample(self.x, self.y, 10, method='mean')
+
+    def test_budget_too_small(self):
+        for N_out in range(1, 11):
+            for method in bs_downsampling.METHODS:
+                if N_out < bs_downsampling.MIN_POINTS[method]:
+                    with self.assertRaises(ValueError):
+                        bs_downsampling.downsample(self.x[:10],
+                                self.y[:10], N_out, method)
+                else:
+                    x, y = bs_downsampling.downsample(self.x[:10],
+                            self.y[:10], N_out, method)
+                    self.assertLessEqual(len(x), N_out)
+
+
+class DownsampledPlotTest(TestCase):
+    """Test that plots of a Solution respect the point budget."""
+
+    def test_plot_masses(self):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        system = get_decay_system()
+        sol = system.solve(200*ur.year, 1*ur.year)
+        sol.default_max_points = 50
+        fig, ax = sol.plot_masses(system.variables.po4)
+        for line in ax.get_lines():
+            self.assertLessEqual(len(line.get_xdata()), 50)
+        self.assertEqual(len(sol._plot_cache), 2)
+        fig, ax = sol.plot_variable_concentration(system.variables.po4,
+                ['deep_ocean'], max_points=20, downsampling='lttb')
+        self.assertEqual(len(ax.get_lines()[0].get_xdata()), 20)
+        self.assertEqual(len(sol._plot_cache), 3)
+        plt.close('all')
+
+        sol.extend(system.solve(2*ur.year, 1*ur.year))
+        self.assertEqual(sol._plot_cache, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
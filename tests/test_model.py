@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pickle
+import tempfile
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.condition import Condition
+from boxsimu.function import Expression
+from boxsimu.transport import Flow, Flux
+from boxsimu.system import BoxModelSystem
+from boxsimu.process import Process, Reaction
+from boxsimu import model as bs_model
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def uptake_rate(t, c, s):
+    return c.po4 * c.uptake_factor / ur.year
+
+
+def get_system():
+    po4 = Variable('po4', molar_mass=30.97*ur.gram/ur.mole)
+    phyto = Variable('phyto', mobility=False, description='Phytoplankton')
+    decay = Process('po4_decay', variable=po4,
+            rate=Expression('-c.po4 * 0.1 / ur.year'))
+    uptake = Reaction('uptake', {po4: -1, phyto: 1}, uptake_rate)
+
+    def get_transports(upper_ocean, deep_ocean):
+        flows = [
+            Flow('downwelling', upper_ocean, deep_ocean,
+                1e15*ur.kg/ur.year),
+            Flow('river', None, upper_ocean, 1e12*ur.kg/ur.year,
+                concentrations={po4: 1e-9*ur.kg/ur.kg}),
+        ]
+        fluxes = [Flux('sedimentation', upper_ocean, deep_ocean, phyto,
+            Expression('0.01 * c.upper_ocean.variables.phyto / ur.day'))]
+        fluxes[0].rate.declare_inputs('upper_ocean.phyto')
+        return flows, fluxes
+
+    return get_ocean_system(
+        upper_variables={po4: 0.1*ur.mole, phyto: 3*ur.kg},
+        deep_variables={po4: 2*ur.kg},
+        upper_processes=[decay], deep_processes=[decay],
+        upper_reactions=[uptake],
+        upper_condition=Condition(uptake_factor=0.5, T=(20*ur.kelvin)),
+        deep_condition=Condition(uptake_factor=0),
+        global_condition=Condition(salinity=35),
+        transports=get_transports, name='ocean')
+
+
+class ModelFormatTest(TestCase):
+    """Test the declarative model format of BoxModelSystems."""
+
+    def setUp(self):
+        self.system = get_system()
+
+    def test_round_trip(self):
+        model = self.system.to_dict()
+        # The model is plain JSON
+        model = json.loads(json.dumps(model))
+        system = BoxModelSystem.from_dict(model, allowed_modules=[__name__])
+        self.assertEqual(system.to_dict(), model)
+        self.assertEqual(system.box_names, self.system.box_names)
+        np.testing.assert_array_equal(system.state, self.system.state)
+        self.assertEqual(system.boxes.upper_ocean.condition.T,
+                20*ur.kelvin)
+        self.assertEqual(system.variables.phyto.description,
+                'Phytoplankton')
+        self.assertEqual(system.fluxes[0].rate.declared_inputs,
+                ['upper_ocean.phyto'])
+
+        # Processes defined once are shared by the boxes
+        self.assertIs(system.boxes.upper_ocean.processes[0],
+                system.boxes.deep_ocean.processes[0])
+
+        expected = self.system.solve(5*ur.year, 1*ur.year)
+        solution = system.solve(5*ur.year, 1*ur.year)
+        np.testing.assert_array_equal(solution.data, expected.data)
+
+    def test_masses_with_units(self):
+        model = self.system.to_dict()
+        box = model['boxes']['upper_ocean']
+        box['fluid_mass'] = {'magnitude': 1e13, 'units': 'tonne'}
+        box['variables']['phyto'] = {'magnitude': 3000, 'units': 'gram'}
+        system = BoxModelSystem.from_dict(model, allowed_modules=[__name__])
+        np.testing.assert_allclose(system.state, self.system.state)
+        # Masses are saved in base units
+        model = system.to_dict()
+        self.assertAlmostEqual(model['boxes']['upper_ocean']['fluid_mass'],
+                1e16)
+        system = BoxModelSystem.from_dict(model, allowed_modules=[__name__])
+        np.testing.assert_allclose(system.state, self.system.state)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'ocean.json')
+            self.system.save_model(file_name, indent=2)
+            system = BoxModelSystem.load_model(file_name,
+                    allowed_modules=[__name__])
+        self.assertEqual(system.to_dict(), self.system.to_dict())
+
+    def test_lambdas_are_rejected(self):
+        self.system.processes[0].rate.expression = lambda t, c, s: 0
+        with self.assertRaises(ValueError):
+            self.system.to_dict()
+
+    def test_expression(self):
+        expression = Expression('c.x * ur.kg')
+        self.assertEqual(expression(None, Condition(x=2), None), 2*ur.kg)
+        self.assertEqual(pickle.loads(pickle.dumps(expression)), expression)
+        with self.assertRaises(ValueError):
+            Expression('c.x *')
+        for source in ['__import__("os").system("true")', 'open("f")',
+                'c.__class__', 't.__init__.__globals__']:
+            with self.assertRaises(ValueError):
+                Expression(source)
+        with self.assertRaises(AttributeError):
+            Expression('ur.load_definitions')(None, None, None)
+
+    def test_functions_are_only_imported_from_allowed_modules(self):
+        model = self.system.to_dict()
+        with self.assertRaises(ValueError):
+            bs_model.from_dict(model)
+        model['reactions']['uptake']['rate'] = {'function': 'os:system'}
+        with self.assertRaises(ValueError):
+            bs_model.from_dict(model, allowed_modules=[__name__])
+        with self.assertRaises(ValueError):
+            bs_model.from_dict(model, allowed_modules=['o'])
+
+    def test_invalid_models(self):
+        with self.assertRaises(ValueError):
+            bs_model.from_dict({'format': 'other'})
+        model = self.system.to_dict()
+        model['version'] = bs_model.VERSION + 1
+        with self.assertRaises(ValueError):
+            bs_model.from_dict(model)
+
+    def test_bulk_loading(self):
+        N_boxes = 2000
+        model = {
+            'format': 'boxsimu-model', 'version': 1, 'name': 'chain',
+            'fluids': {'water': {'rho': 1000}},
+            'variables': {'po4': {}},
+            'processes': {'decay': {'variable': 'po4',
+                'rate': {'expression': '-c.po4 / ur.year'}}},
+            'boxes': {'box{}'.format(i): {'fluid': 'water',
+                'fluid_mass': 1e6, 'variables': {'po4': float(i)},
+                'processes': ['decay']} for i in range(N_boxes)},
+            'flows': [{'name': 'flow{}'.format(i), 'source':
+                'box{}'.format(i), 'target': 'box{}'.format(i+1),
+                'rate': 1} for i in range(N_boxes - 1)],
+        }
+        system = bs_model.from_dict(model)
+        self.assertEqual(system.N_boxes, N_boxes)
+        self.assertEqual(system.boxes.box42.variables.po4.mass, 42*ur.kg)
+        self.assertEqual(system.flows[0].rate(None, None, None),
+                1*ur.kg/ur.second)
+
+
+if __name__ == "__main__":
+    unittest.main()
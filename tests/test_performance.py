@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Performance regression check of the reference systems against the
+stored baseline (benchmarks/baseline.json). The check is only run if the
+environment variable BOXSIMU_BENCHMARK is set:
+    BOXSIMU_BENCHMARK=1 python -m pytest tests/test_performance.py
+The relative threshold can be set with BOXSIMU_BENCHMARK_THRESHOLD.
+
+"""
+
+import os
+import unittest
+from unittest import TestCase
+
+import sys
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from benchmarks import regression
+
+
+def get_measurement(steps_per_second, peak_memory):
+    phases = {phase: 0.0 for phase in regression.SOLVER_PHASES}
+    return {'N_timesteps': 10, 'steps_per_second': steps_per_second,
+            'peak_memory': peak_memory, 'phases': phases}
+
+
+class CompareTest(TestCase):
+    """Test the comparison of measurements with a baseline."""
+
+    def setUp(self, *args, **kwargs):
+        self.baseline = {'systems': {
+            'system': get_measurement(100.0, 1000)}}
+
+    def test_within_threshold(self):
+        measurements = {'system': get_measurement(80.0, 1200)}
+        self.assertEqual(regression.compare(self.baseline, measurements,
+            threshold=0.25), [])
+
+    def test_slower(self):
+        measurements = {'system': get_measurement(70.0, 1000)}
+        measurements['system']['phases']['reactions'] = 1.0
+        regressions = regression.compare(self.baseline, measurements,
+                threshold=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('reactions', regressions[0])
+
+    def test_more_memory(self):
+        measurements = {'system': get_measurement(100.0, 2000)}
+        regressions = regression.compare(self.baseline, measurements,
+                threshold=0.25)
+        self.assertIn('peak memory', regressions[0])
+
+    def test_baseline_covers_reference_systems(self):
+        baseline = regression.load_baseline()
+        self.assertEqual(sorted(baseline['systems']),
+                sorted(regression.REFERENCE_RUNS))
+
+
+@unittest.skipUnless(os.environ.get('BOXSIMU_BENCHMARK'),
+        'Set BOXSIMU_BENCHMARK to run the performance regression check.')
+class PerformanceRegressionTest(TestCase):
+    """Compare the performance of the reference systems to the baseline."""
+
+    def test_no_regression(self):
+        threshold = float(os.environ.get('BOXSIMU_BENCHMARK_THRESHOLD',
+            regression.DEFAULT_THRESHOLD))
+        regressions = regression.check(threshold=threshold)
+        self.assertEqual(regressions, [], '\n'.join(regressions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+from unittest import TestCase
+
+import sys
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.transport import  Flow, Flux
+from boxsimu.process import Process
+from boxsimu.solver import Solver
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def slow_decay(t, c, s):
+    time.sleep(0.002)
+    return -c.po4 * 0.1 / ur.year
+
+
+def get_transports(upper_ocean, deep_ocean):
+    flows = [Flow('downwelling', upper_ocean, deep_ocean,
+        lambda t, c, s: 1e15*ur.kg/ur.year)]
+    fluxes = [Flux('sinking', upper_ocean, deep_ocean, Variable('po4'),
+        lambda t, c, s: c.upper_ocean.variables.po4 * 0.01 / ur.year)]
+    return flows, fluxes
+
+
+def get_system():
+    po4 = Variable('po4')
+    po4_input = Process('po4_input', variable=po4, rate=1*ur.kg/ur.year)
+    po4_decay = Process('po4_decay', variable=po4, rate=slow_decay)
+    return get_ocean_system(
+        upper_variables={po4: 1*ur.kg},
+        deep_variables={po4: 1*ur.kg},
+        upper_processes=[po4_input, po4_decay],
+        transports=get_transports)
+
+
+class UserFunctionProfilerTest(TestCase):
+    """Test the profiling of user-defined functions."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+
+    def test_only_dynamic_functions_are_profiled(self):
+        profiler = self.system.enable_profiling()
+        names = [(s.kind, s.name) for s in profiler.statistics]
+        self.assertEqual(sorted(names), [('flow', 'downwelling'),
+            ('flux', 'sinking'), ('process', 'po4_decay')])
+        self.assertIsNotNone(self.system.processes[0].rate.profile)
+        self.system.disable_profiling()
+        self.assertIsNone(self.system.processes[0].rate.profile)
+
+    def test_ranking_after_solve(self):
+        self.system.enable_profiling()
+        sol = self.system.solve(3*ur.year, 1*ur.year, verbose=False)
+        df = sol.user_function_profile
+        self.assertEqual(df.loc[0, 'name'], 'po4_decay')
+        self.assertGreater(df.loc[0, 'max [s]'], 0.002)
+        self.assertEqual(df.loc[0, 'calls'],
+                self.system.profiler.statistics[
+                    [s.name for s in self.system.profiler.statistics
+                        ].index('po4_decay')].calls)
+        self.assertGreaterEqual(df.loc[0, 'calls'], 3)
+        self.assertIn('po4_decay', str(self.system.profiler))
+
+    def test_solver_profiles_its_clone(self):
+        self.system.enable_profiling()
+        solver = Solver(self.system)
+        sol = solver.solve(2*ur.year, 1*ur.year, verbose=False)
+        self.assertIsNotNone(sol.user_function_profile)
+        self.assertTrue(all(s.calls == 0
+            for s in self.system.profiler.statistics))
+        self.assertIsNot(solver.system.processes[0].rate,
+                self.system.processes[0].rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.solution import Solution
+from boxsimu import ur
+
+from tests.systems import get_decay_system
+
+
+YEAR = (1*ur.year).to(ur.second).magnitude
+
+
+class ConcatTest(TestCase):
+    """Test the concatenation of Solutions of consecutive simulations."""
+
+    def test_time_axis(self):
+        sol = get_decay_system().solve(4*ur.year, 1*ur.year)
+        np.testing.assert_allclose(sol.time_array / YEAR, [1, 2, 3, 4])
+
+    def test_concat_equals_single_simulation(self):
+        full = get_decay_system().solve(10*ur.year, 1*ur.year)
+        system = get_decay_system()
+        first = system.solve(4*ur.year, 1*ur.year)
+        second = system.solve(6*ur.year, 1*ur.year)
+        sol = Solution.concat([first, second])
+        self.assertEqual(sol.N_timesteps, 10)
+        np.testing.assert_array_equal(sol.data, full.data)
+        np.testing.assert_allclose(sol.time_array, full.time_array)
+        self.assertEqual(sol.dt, full.dt)
+        self.assertTrue(sol.df.equals(full.df))
+
+    def test_extend_with_different_dt(self):
+        system = get_decay_system()
+        sol = system.solve(2*ur.year, 1*ur.year)
+        sol.extend(system.solve(4*ur.year, 2*ur.year))
+        self.assertIsNone(sol.dt)
+        np.testing.assert_allclose(sol.time_array / YEAR, [1, 2, 4, 6])
+        self.assertAlmostEqual(sol.total_integration_time.to(
+            ur.year).magnitude, 6)
+        self.assertEqual(sol.df.shape[0], 4)
+
+    def test_mismatching_systems(self):
+        sol = get_decay_system().solve(2*ur.year, 1*ur.year)
+        other_sol = get_decay_system().solve(2*ur.year, 1*ur.year)
+        other_sol.box_names = ['abyss', 'upper_ocean']
+        with self.assertRaises(ValueError):
+            Solution.concat([sol, other_sol])
+        other_sol.box_names = sol.box_names
+        other_sol.quantities = other_sol.quantities[:-1]
+        with self.assertRaises(ValueError):
+            sol.extend(other_sol)
+        with self.assertRaises(ValueError):
+            Solution.concat([])
+
+
+class TimeQueryTest(TestCase):
+    """Test the time queries at, window and resample of a Solution."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.solution = get_decay_system().solve(10*ur.year, 1*ur.year)
+
+    def test_at(self):
+        sol = self.solution
+        po4 = sol.get_series('upper_ocean', 'po4')
+        values = sol.at([3.5, 1, 10, 0.5, 11] * ur.year, ['upper_ocean'],
+                ['po4'])[0, 0]
+        self.assertAlmostEqual(values[0], (po4[2] + po4[3]) / 2)
+        self.assertAlmostEqual(values[1], po4[0])
+        self.assertAlmostEqual(values[2], po4[-1])
+        self.assertTrue(np.all(np.isnan(values[3:])))
+        self.assertEqual(sol.at(2*YEAR).shape, (2, 3, 1))
+        with self.assertRaises(Exception):
+            sol.at(2*ur.kg)
+
+    def test_window(self):
+        sol = self.solution
+        window = sol.window(3*ur.year, 5*ur.year)
+        self.assertEqual(window.N_timesteps, 3)
+        np.testing.assert_array_equal(window.data, sol.data[:, :, 2:5])
+        self.assertAlmostEqual(window.start_time.to(ur.year).magnitude, 2)
+        self.assertEqual(sol.window(t1=0.5*ur.year).N_timesteps, 0)
+        self.assertEqual(sol.window().N_timesteps, 10)
+
+    def test_resample(self):
+        sol = self.solution
+        mean = sol.resample(4*ur.year)
+        np.testing.assert_allclose(mean.time_array / YEAR, [4, 8, 12])
+        np.testing.assert_allclose(mean.data[:, :, 0],
+                sol.data[:, :, :4].mean(axis=2))
+        np.testing.assert_allclose(mean.data[:, :, 2],
+                sol.data[:, :, 8:].mean(axis=2))
+        last = sol.resample(4*ur.year, how='last')
+        np.testing.assert_array_equal(last.data,
+                sol.data[:, :, [3, 7, 9]])
+        maximum = sol.resample(5*ur.year, how='max')
+        np.testing.assert_array_equal(maximum.data,
+                np.stack([sol.data[:, :, :5].max(axis=2),
+                    sol.data[:, :, 5:].max(axis=2)], axis=2))
+        with self.assertRaises(ValueError):
+            sol.resample(4*ur.year, how='median')
+
+
+class ExportFiguresTest(TestCase):
+    """Test the parallel export of figures."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.system = get_decay_system()
+        cls.solution = cls.system.solve(10*ur.year, 1*ur.year)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertIsPNG(self, file_name):
+        with open(file_name, 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+    def test_export_figures(self):
+        spec = [(kind, variable, [box]) for kind in Solution.FIGURE_KINDS
+                for variable in self.system.variables.values()
+                for box in self.system.boxes.values()]
+        spec.append(('masses', self.system.boxes.upper_ocean.fluid))
+        for workers in (1, 2):
+            directory = os.path.join(self.directory.name, str(workers))
+            file_names = self.solution.export_figures(spec, directory,
+                    workers=workers, dpi=20)
+            self.assertEqual(len(file_names), 5)
+            self.assertEqual(os.path.basename(file_names[0]),
+                    'masses_po4_upper_ocean.png')
+            self.assertEqual(os.path.basename(file_names[-1]),
+                    'masses_mass.png')
+            for file_name in file_names:
+                self.assertIsPNG(file_name)
+
+    def test_export_from_solution_file(self):
+        file_name = os.path.join(self.directory.name, 'solution.bss')
+        self.solution.save(file_name, storage='memmap')
+        loaded = Solution.load(file_name)
+        file_names = loaded.export_figures([('concentration', 'po4'),
+            ('masses', 'volume')], self.directory.name, workers=2)
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                sorted(['solution.bss', 'concentration_po4.png',
+                    'masses_volume.png']))
+        self.assertIsNone(loaded._data)
+
+    def test_invalid_spec(self):
+        with self.assertRaises(ValueError):
+            self.solution.export_figures([('histogram', 'po4')],
+                    self.directory.name)
+        with self.assertRaises(ValueError):
+            self.solution.export_figures([('masses', 'no3')],
+                    self.directory.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
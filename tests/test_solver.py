@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import time
+import asyncio
+import unittest
+import contextlib
+import concurrent.futures
+from unittest import TestCase
+
+import sys
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Fluid, Variable
+from boxsimu.box import Box
+from boxsimu.transport import  Flow, Flux
+from boxsimu.condition import Condition
+from boxsimu.system import BoxModelSystem
+from boxsimu.process import Process, Reaction
+from boxsimu.function import UserFunction
+from boxsimu.solver import StaticContributions, Solver, SOLVER_PHASES
+from boxsimu.timing import PhaseTimer
+from boxsimu import ur
+
+from tests.systems import get_ocean_system, get_po4_decay
+
+
+def get_transports(upper_ocean, deep_ocean):
+    flows = [
+        Flow('river', None, upper_ocean, 1e15*ur.kg/ur.year,
+            concentrations={Variable('po4'): 1e-12*ur.kg/ur.kg}),
+        Flow('evaporation', upper_ocean, None, 1e15*ur.kg/ur.year,
+            tracer_transport=False),
+        Flow('downwelling', upper_ocean, deep_ocean, 1e15*ur.kg/ur.year),
+        Flow('upwelling', deep_ocean, upper_ocean,
+            lambda t, c, s: 1e15*ur.kg/ur.year),
+    ]
+    fluxes = [
+        Flux('biological_pump', upper_ocean, deep_ocean, Variable('phyto'),
+            lambda t, c, s: (s.boxes.upper_ocean.variables.phyto.mass *
+                0.1 / ur.year)),
+        Flux('sedimentation', deep_ocean, upper_ocean, Variable('phyto'),
+            1*ur.kg/ur.year),
+    ]
+    return flows, fluxes
+
+
+def get_system():
+    po4 = Variable('po4')
+    phyto = Variable('phyto')
+
+    po4_input = Process('po4_input', variable=po4, rate=1e3*ur.kg/ur.year)
+    growth = Reaction('growth', {po4: -1, phyto: 1}, rate=2*ur.kg/ur.year)
+    mortality = Reaction('mortality', {po4: 1, phyto: -1},
+            rate=lambda t, c, s: c.phyto * 0.5 / ur.year)
+    return get_ocean_system(
+        upper_variables={po4: 10*ur.kg, phyto: 20*ur.kg},
+        deep_variables={po4: 30*ur.kg, phyto: 40*ur.kg},
+        upper_processes=[po4_input, get_po4_decay()],
+        upper_reactions=[growth, mortality],
+        deep_reactions=[mortality],
+        upper_condition=Condition(T=290*ur.kelvin),
+        deep_condition=Condition(T=275*ur.kelvin),
+        transports=get_transports)
+
+
+class StaticContributionsTest(TestCase):
+    """Test the precomputation of static rates."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.static = StaticContributions(self.system)
+        self.time = 1 * ur.year
+        self.f_flow = np.ones(self.system.N_boxes)
+
+    def assertQuantityEqual(self, a, b):
+        np.testing.assert_allclose(a.to_base_units().magnitude,
+                b.to_base_units().magnitude, rtol=1e-12)
+
+    def test_dynamic_lists(self):
+        static = self.static
+        self.assertEqual([f.name for f in static.dynamic_flows],
+                ['upwelling'])
+        self.assertEqual([f.name for f in static.dynamic_fluxes],
+                ['biological_pump'])
+        self.assertEqual([p.name for p in static.dynamic_processes],
+                ['po4_decay'])
+
+    def test_fluid_flows(self):
+        system, static, time = self.system, self.static, self.time
+        flows = static.dynamic_flows
+        self.assertQuantityEqual(
+                static.A_fluid + system.get_fluid_mass_internal_flow_2Darray(
+                    time, flows),
+                system.get_fluid_mass_internal_flow_2Darray(time))
+        self.assertQuantityEqual(
+                static.s_fluid + system.get_fluid_mass_flow_sink_1Darray(
+                    time, flows),
+                system.get_fluid_mass_flow_sink_1Darray(time))
+        self.assertQuantityEqual(
+                static.q_fluid + system.get_fluid_mass_flow_source_1Darray(
+                    time, flows),
+                system.get_fluid_mass_flow_source_1Darray(time))
+
+    def test_variable_flows(self):
+        system, static, time = self.system, self.static, self.time
+        for variable in system.variable_list:
+            concentration = system.get_variable_flow_concentration_1Darray(
+                    variable, time)
+            self.assertQuantityEqual(
+                    (static.A_tracer.T * concentration).T +
+                    system.get_variable_internal_flow_2Darray(variable, time,
+                        self.f_flow, static.dynamic_tracer_flows),
+                    system.get_variable_internal_flow_2Darray(variable, time,
+                        self.f_flow))
+            self.assertQuantityEqual(
+                    static.q_flow[variable.id] +
+                    system.get_variable_flow_source_1Darray(variable, time,
+                        static.dynamic_source_flows[variable.id]),
+                    system.get_variable_flow_source_1Darray(variable, time))
+
+    def test_fluxes_and_processes(self):
+        system, static, time = self.system, self.static, self.time
+        for variable in system.variable_list:
+            fluxes = static.dynamic_fluxes
+            self.assertQuantityEqual(
+                    static.A_flux[variable.id] +
+                    system.get_variable_internal_flux_2Darray(variable, time,
+                        fluxes),
+                    system.get_variable_internal_flux_2Darray(variable, time))
+            processes = static.dynamic_processes
+            self.assertQuantityEqual(
+                    static.s_process[variable.id] +
+                    system.get_variable_process_sink_1Darray(variable, time,
+                        processes),
+                    system.get_variable_process_sink_1Darray(variable, time))
+            self.assertQuantityEqual(
+                    static.q_process[variable.id] +
+                    system.get_variable_process_source_1Darray(variable,
+                        time, processes),
+                    system.get_variable_process_source_1Darray(variable, time))
+
+    def test_reactions(self):
+        self.assertIsNotNone(self.static.reaction_rates[
+            self.system.reactions.index(
+                self.system.boxes.upper_ocean.reactions[0])])
+        self.assertQuantityEqual(
+                self.static.get_reaction_rate_3Darray(self.time),
+                self.system.get_reaction_rate_3Darray(self.time))
+
+    def test_non_tracer_sink_does_not_remove_variables(self):
+        s = self.system.get_variable_flow_sink_1Darray(
+                self.system.variables.po4, self.time, self.f_flow)
+        self.assertEqual(s.magnitude.tolist(), [0, 0])
+
+
+class TimingsTest(TestCase):
+    """Test the phase timings of the solver."""
+
+    def test_phase_timer(self):
+        timer = PhaseTimer(['a', 'b'], N_steps=2)
+        timer.lap('a')
+        timer.start(1)
+        timer.lap('b')
+        timer.lap('b')
+        self.assertEqual(timer.calls, {'a': 1, 'b': 2})
+        self.assertEqual(timer.step_times[0].tolist(), [0, 0])
+        self.assertEqual(timer.step_times[1, 0], 0)
+        self.assertAlmostEqual(timer.step_times[1, 1], timer.totals['b'])
+        df = timer.get_dataframe()
+        self.assertAlmostEqual(df['fraction'].sum(), 1)
+        with self.assertRaises(ValueError):
+            PhaseTimer(['a']).get_step_dataframe()
+
+    def test_solution_timings(self):
+        system = get_system()
+        sol = system.solve(3*ur.year, 1*ur.year, step_timings=True,
+                verbose=False)
+        timings = sol.timings
+        self.assertEqual(timings.phases, SOLVER_PHASES)
+        self.assertEqual(timings.calls['setup'], 1)
+        self.assertEqual(timings.calls['state_update'], 3)
+        self.assertEqual(timings.calls['flows'],
+                timings.calls['reactions'])
+        self.assertGreaterEqual(timings.calls['flows'],
+                3 * system.N_variables)
+        self.assertEqual(timings.get_step_dataframe().shape,
+                (3, len(SOLVER_PHASES)))
+
+    def test_diagnostics_are_printed_on_request(self):
+        for verbose, step_timings, timings, diagnostics in [
+                (False, True, False, False), (True, False, False, False),
+                (True, True, True, False), (2, False, True, True)]:
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                get_system().solve(2*ur.year, 1*ur.year, verbose=verbose,
+                        step_timings=step_timings)
+            output = stdout.getvalue()
+            self.assertEqual(bool(output), bool(verbose))
+            self.assertEqual('Phase' in output, timings)
+            self.assertEqual('Limiter active' in output, diagnostics)
+
+
+class LimiterLogTest(TestCase):
+    """Test the recording of the limiter activity."""
+
+    def test_limited_boxes_and_variables(self):
+        seawater = Fluid('seawater', rho=1000*ur.kg/ur.meter**3)
+        po4 = Variable('po4')
+        po4_decay = Process('po4_decay', variable=po4,
+                rate=-5*ur.kg/ur.year)
+        lake = Box('lake', 'Lake', fluid=seawater.q(1e3*ur.kg),
+                variables=[po4.q(1*ur.kg)], processes=[po4_decay])
+        ocean = Box('ocean', 'Ocean', fluid=seawater.q(1e6*ur.kg),
+                variables=[po4.q(1*ur.kg)])
+        flows = [Flow('outflow', lake, ocean, 3e3*ur.kg/ur.year)]
+        system = BoxModelSystem('test_system', [lake, ocean], flows=flows)
+        sol = system.solve(3*ur.year, 1*ur.year, verbose=False)
+        log = sol.limiter_log
+        self.assertTrue(np.all(log.fluid_iterations >= 1))
+        self.assertEqual(log.limited_timesteps.tolist(), [0, 1, 2])
+        fluid = log.get_fluid_dataframe()
+        self.assertEqual(set(fluid['box']), {'lake'})
+        self.assertTrue(np.all(fluid['f_flow'] < 1))
+        variables = log.get_variable_dataframe()
+        self.assertEqual(variables.loc[0, 'variable'], 'po4')
+        self.assertEqual(variables.loc[0, 'box'], 'lake')
+        self.assertGreaterEqual(system.boxes.lake.fluid.mass_magnitude, 0)
+        self.assertGreaterEqual(
+                system.boxes.lake.variables.po4.mass_magnitude, 0)
+
+
+class SolverTest(TestCase):
+    """Test repeated simulations of the same system."""
+
+    def solve(self, solver):
+        return solver.solve(3*ur.year, 1*ur.year, verbose=False)
+
+    def test_changes_of_the_system_are_simulated(self):
+        system = get_system()
+        solver = Solver(system)
+        first = self.solve(solver)
+        simulated = solver.system
+        np.testing.assert_array_equal(self.solve(solver).data, first.data)
+        self.assertIs(solver.system, simulated)
+
+        # Changed masses are copied to the simulated clone
+        system.boxes.upper_ocean.variables.po4.mass = 20*ur.kg
+        second = self.solve(solver)
+        self.assertIs(solver.system, simulated)
+        self.assertFalse(np.array_equal(second.data, first.data))
+
+        # Other changes require a new clone
+        system.boxes.upper_ocean.processes[0].rate = UserFunction(
+                2e3*ur.kg/ur.year, ur.kg/ur.second)
+        third = self.solve(solver)
+        self.assertIsNot(solver.system, simulated)
+        np.testing.assert_array_equal(third.data,
+                self.solve(Solver(system)).data)
+        self.assertFalse(np.array_equal(third.data, second.data))
+
+
+class SolveAsyncTest(TestCase):
+    """Test simulations that run in the background."""
+
+    def setUp(self):
+        self.solver = Solver(get_system())
+
+    def wait_for_timesteps(self, future, timesteps):
+        start = time.time()
+        while future.timesteps_done < timesteps:
+            self.assertLess(time.time() - start, 30)
+            time.sleep(0.01)
+
+    def test_result(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            future = self.solver.solve_async(10*ur.year, 1*ur.year)
+            solution = future.result(timeout=60)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertFalse(future.running())
+        self.assertEqual(future.progress, 1)
+        expected = self.solver.solve(10*ur.year, 1*ur.year, verbose=False)
+        np.testing.assert_array_equal(solution.data, expected.data)
+        np.testing.assert_array_equal(future.partial_solution().data,
+                expected.data)
+
+    def test_cancel_and_partial_solution(self):
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            future = self.solver.solve_async(1e5*ur.year, 1*ur.year,
+                    executor=executor)
+            self.wait_for_timesteps(future, 3)
+            self.assertTrue(future.running())
+            self.assertTrue(0 < future.progress < 1)
+            self.assertTrue(future.cancel())
+            # The future is cancelled once the simulation has stopped
+            with self.assertRaises(concurrent.futures.CancelledError):
+                future.result(timeout=30)
+        self.assertTrue(future.cancelled())
+        self.assertFalse(future.running())
+        partial = future.partial_solution()
+        self.assertEqual(partial.N_timesteps, future.timesteps_done)
+        self.assertLess(future.timesteps_done, 1e5)
+        self.assertFalse(np.isnan(partial.data).any())
+        self.assertTrue(np.isnan(future.solution.data[:, :, -1]).all())
+
+    def test_cancel_pending(self):
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            running = self.solver.solve_async(1e5*ur.year, 1*ur.year,
+                    executor=executor)
+            pending = self.solver.solve_async(1e5*ur.year, 1*ur.year,
+                    executor=executor)
+            self.assertFalse(pending.running())
+            self.assertTrue(pending.cancel())
+            self.assertTrue(pending.cancelled())
+            running.cancel()
+        self.assertIsNone(pending.partial_solution())
+        self.assertEqual(pending.progress, 0)
+        self.assertEqual(concurrent.futures.wait([running, pending],
+            timeout=30).not_done, set())
+
+    def test_await(self):
+        async def solve():
+            return await self.solver.solve_async(3*ur.year, 1*ur.year)
+
+        async def solve_with_timeout():
+            future = self.solver.solve_async(1e5*ur.year, 1*ur.year)
+            try:
+                await asyncio.wait_for(future, 0.5)
+            except asyncio.TimeoutError:
+                pass
+            return future
+
+        self.assertEqual(asyncio.run(solve()).N_timesteps, 3)
+        # Cancelling the awaiting task stops the simulation
+        future = asyncio.run(solve_with_timeout())
+        concurrent.futures.wait([future], timeout=30)
+        self.assertTrue(future.cancelled())
+        self.assertLess(future.timesteps_done, 1e5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.solver import Solver
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def get_system():
+    return get_ocean_system(deep_variables={'no3': 2*ur.kg})
+
+
+class StateTest(TestCase):
+    """Test the state array of a BoxModelSystem."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.uo = self.system.boxes.upper_ocean
+        self.do = self.system.boxes.deep_ocean
+        self.po4 = self.system.variables.po4
+        self.no3 = self.system.variables.no3
+
+    def test_layout(self):
+        state = self.system.state
+        self.assertEqual(state.shape, (2, 3))
+        self.assertEqual(state[self.uo.id, 0], 1e16)
+        self.assertEqual(state[self.uo.id, 1 + self.po4.id], 1)
+        self.assertEqual(state[self.do.id, 1 + self.no3.id], 2)
+        self.assertEqual(state[self.do.id, 1 + self.po4.id], 0)
+
+    def test_masses_are_views(self):
+        state = self.system.state
+        state[self.uo.id, 1 + self.po4.id] = 3
+        self.assertEqual(self.uo.variables.po4.mass, 3 * ur.kg)
+        self.uo.fluid.mass = 5 * ur.gram
+        self.assertEqual(state[self.uo.id, 0], 0.005)
+        self.assertEqual(self.uo.fluid.mass_magnitude, 0.005)
+        self.assertEqual(self.system.get_fluid_mass_1Darray()[self.uo.id],
+                0.005 * ur.kg)
+
+    def test_user_writes_are_validated(self):
+        with self.assertRaises(Exception):
+            self.uo.variables.po4.mass = 3 * ur.meter
+        self.assertEqual(self.uo.variables.po4.mass, 1 * ur.kg)
+
+    def test_set_state(self):
+        self.system.set_state(np.ones((2, 3)))
+        self.assertEqual(self.do.fluid.mass, 1 * ur.kg)
+        with self.assertRaises(ValueError):
+            self.system.set_state(np.ones((3, 2)))
+
+    def test_concentration(self):
+        c = self.system.get_variable_concentration_1Darray(self.po4)
+        self.assertEqual(c[self.uo.id].magnitude, 1e-16)
+        self.assertEqual(c[self.do.id].magnitude, 0)
+
+    def test_quantified_copy_is_unbound(self):
+        po4 = self.uo.variables.po4.q(7*ur.kg)
+        self.assertFalse(po4.is_bound)
+        self.assertEqual(self.uo.variables.po4.mass, 1 * ur.kg)
+
+    def test_deepcopy(self):
+        system = copy.deepcopy(self.system)
+        system.state[:] = 0
+        self.assertEqual(system.boxes.upper_ocean.fluid.mass, 0 * ur.kg)
+        self.assertEqual(self.uo.fluid.mass, 1e16 * ur.kg)
+
+    def test_solve_updates_state(self):
+        system = self.system
+        total_mass = system.state[:, 0].sum()
+        sol = system.solve(2*ur.year, 1*ur.year, verbose=False)
+        self.assertAlmostEqual(system.state[:, 0].sum() / total_mass, 1)
+        self.assertLess(system.state[self.uo.id, 0], 1e16)
+        self.assertEqual(sol.df[('upper_ocean', 'mass')].iloc[-1],
+                system.state[self.uo.id, 0])
+
+
+class SnapshotTest(TestCase):
+    """Test snapshots and clones of a BoxModelSystem."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.uo = self.system.boxes.upper_ocean
+
+    def test_snapshot_and_restore(self):
+        snapshot = self.system.snapshot()
+        self.uo.variables.po4.mass = 5 * ur.kg
+        po4 = self.system.variables.po4
+        self.assertEqual(snapshot[self.uo.id, 1 + po4.id], 1)
+        self.system.restore(snapshot)
+        self.assertEqual(self.uo.variables.po4.mass, 1 * ur.kg)
+
+    def test_clone(self):
+        clone = self.system.clone()
+        clone_uo = clone.boxes.upper_ocean
+        self.assertIsNot(clone.state, self.system.state)
+        self.assertIs(clone_uo.fluid.rho, self.uo.fluid.rho)
+        self.assertIs(clone.flows[0].rate, self.system.flows[0].rate)
+        self.assertIs(clone.topology.flow_source_ids,
+                self.system.topology.flow_source_ids)
+        self.assertIs(clone.topology.box_list[clone_uo.id], clone_uo)
+        self.assertIs(clone_uo.context.box, clone_uo)
+        clone_uo.variables.po4.mass = 5 * ur.kg
+        self.assertEqual(self.uo.variables.po4.mass, 1 * ur.kg)
+
+    def test_solver_restores_initial_state(self):
+        solver = Solver(self.system)
+        sol1 = solver.solve(2*ur.year, 1*ur.year, verbose=False)
+        sol2 = solver.solve(2*ur.year, 1*ur.year, verbose=False)
+        self.assertTrue(sol1.df.equals(sol2.df))
+        self.assertEqual(self.uo.fluid.mass, 1e16 * ur.kg)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.solution import Solution
+from boxsimu import storage as bs_storage
+from boxsimu import ur
+
+from tests.systems import get_ocean_system, get_po4_decay
+
+
+def get_system():
+    return get_ocean_system(
+        upper_variables={'po4': 1*ur.kg, 'no3': 3*ur.kg},
+        deep_variables={'no3': 2*ur.kg},
+        upper_processes=[get_po4_decay()])
+
+
+class SolutionStorageTest(TestCase):
+    """Test the memory-mapped and compressed storage of a Solution."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.system = get_system()
+        cls.solution = cls.system.solve(10*ur.year, 1*ur.year)
+
+    def setUp(self, *args, **kwargs):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, 'solution.bss')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_dataframe_is_view_of_data(self):
+        sol = self.solution
+        self.assertTrue(np.shares_memory(sol.df.values, sol.data))
+        self.assertEqual(sol.df[('upper_ocean', 'po4')].iloc[3],
+                sol.data[sol.box_names.index('upper_ocean'),
+                    sol.quantities.index('po4'), 3])
+
+    def test_get_values(self):
+        sol = self.solution
+        po4 = sol.get_series(self.system.boxes.upper_ocean,
+                self.system.variables.po4)
+        self.assertEqual(len(po4), 10)
+        self.assertTrue(np.all(np.diff(po4) < 0))
+        values = sol.get_values(['deep_ocean'], ['mass', 'no3'],
+                slice(2, 5))
+        self.assertEqual(values.shape, (1, 2, 3))
+        np.testing.assert_array_equal(values[0, 1],
+                sol.df[('deep_ocean', 'no3')].values[2:5])
+
+    def test_memmap_round_trip(self):
+        self.solution.save(self.file_name, storage='memmap')
+        self.assertTrue(bs_storage.is_solution_file(self.file_name))
+        loaded = Solution.load(self.file_name)
+        self.assertIsNone(loaded.system)
+        self.assertEqual(loaded.box_names, self.solution.box_names)
+        self.assertEqual(loaded.quantities, self.solution.quantities)
+        self.assertEqual(loaded.dt, self.solution.dt)
+        np.testing.assert_array_equal(loaded.time_array,
+                self.solution.time_array)
+
+        # Partial reads do not load the whole solution
+        timesteps = np.array([0, 4, 9])
+        np.testing.assert_array_equal(
+                loaded.get_values(['upper_ocean'], ['po4', 'volume'],
+                    timesteps),
+                self.solution.get_values(['upper_ocean'], ['po4', 'volume'],
+                    timesteps))
+        self.assertIsNone(loaded._data)
+
+        self.assertTrue(loaded.df.equals(self.solution.df))
+
+    def test_compressed_round_trip(self):
+        for compression in ('zlib', 'lzma'):
+            self.solution.save(self.file_name, storage='memmap',
+                    compression=compression, chunk_size=3)
+            loaded = Solution.load(self.file_name)
+            np.testing.assert_array_equal(
+                    loaded.get_values(['deep_ocean', 'upper_ocean'],
+                        ['no3', 'mass'], slice(2, 8, 2)),
+                    self.solution.get_values(['deep_ocean', 'upper_ocean'],
+                        ['no3', 'mass'], slice(2, 8, 2)))
+            np.testing.assert_array_equal(loaded.data, self.solution.data)
+
+    def test_delta_encoding_is_lossless(self):
+        values = np.cumsum(np.random.RandomState(0).normal(size=1000))
+        values[[3, 500]] = np.nan, -np.inf
+        for dtype in ('<f8', '<f4'):
+            chunk = bs_storage._encode_chunk(values.astype(dtype), 'zlib')
+            np.testing.assert_array_equal(bs_storage._decode_chunk(chunk,
+                np.dtype(dtype), 'zlib'), values.astype(dtype))
+
+    def test_reduced_precision(self):
+        self.solution.save(self.file_name, storage='memmap',
+                dtypes={'volume': 'float32'}, compression='zlib')
+        loaded = Solution.load(self.file_name)
+        header = loaded._file.header['arrays']
+        self.assertEqual(header['volume']['dtype'], '<f4')
+        self.assertEqual(header['mass']['dtype'], '<f8')
+        np.testing.assert_array_equal(loaded.get_values(quantities=['mass']),
+                self.solution.get_values(quantities=['mass']))
+        np.testing.assert_allclose(loaded.get_values(quantities=['volume']),
+                self.solution.get_values(quantities=['volume']), rtol=1e-7)
+
+    def test_invalid_files(self):
+        with self.assertRaises(ValueError):
+            self.solution.save(self.file_name, storage='unknown')
+        with self.assertRaises(ValueError):
+            self.solution.save(self.file_name, compression='zlib')
+        with self.assertRaises(ValueError):
+            self.solution.save(self.file_name, storage='memmap',
+                    compression='bz2')
+        with self.assertRaises(ValueError):
+            self.solution.save(self.file_name, storage='memmap',
+                    dtypes='int32')
+        with open(self.file_name, 'wb') as f:
+            f.write(b'no solution file' * 4)
+        with self.assertRaises(ValueError):
+            bs_storage.SolutionFile(self.file_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
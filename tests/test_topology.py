@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import unittest
+from unittest import TestCase
+
+import sys
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Variable
+from boxsimu.transport import  Flow, Flux
+from boxsimu.process import Process, Reaction
+from boxsimu.topology import OUTSIDE
+from boxsimu import ur
+
+from tests.systems import get_ocean_system
+
+
+def get_transports(upper_ocean, deep_ocean):
+    flows = [
+        Flow('river', None, upper_ocean, 1e15*ur.kg/ur.year),
+        Flow('downwelling', upper_ocean, deep_ocean, 1e15*ur.kg/ur.year),
+    ]
+    fluxes = [Flux('sinking', upper_ocean, deep_ocean, Variable('phyto'),
+        1*ur.kg/ur.year)]
+    return flows, fluxes
+
+
+def get_system():
+    po4 = Variable('po4')
+    phyto = Variable('phyto')
+
+    po4_input = Process('po4_input', variable=po4, rate=1*ur.kg/ur.year)
+    growth = Reaction('growth', {po4: -1, phyto: 1}, rate=1*ur.kg/ur.year)
+    return get_ocean_system(
+        upper_variables={po4: 1*ur.kg},
+        deep_variables={phyto: 1*ur.kg},
+        upper_processes=[po4_input], upper_reactions=[growth],
+        transports=get_transports)
+
+
+class TopologyIndexTest(TestCase):
+    """Test the TopologyIndex of a BoxModelSystem."""
+
+    def setUp(self, *args, **kwargs):
+        self.system = get_system()
+        self.topology = self.system.topology
+        self.uo = self.system.boxes.upper_ocean
+        self.do = self.system.boxes.deep_ocean
+
+    def test_order_and_ids(self):
+        self.assertEqual(self.topology.box_names,
+                ('deep_ocean', 'upper_ocean'))
+        self.assertEqual(self.system.box_list, (self.do, self.uo))
+        self.assertEqual(self.topology.box_ids['upper_ocean'], self.uo.id)
+        self.assertEqual(self.topology.variable_names, ('phyto', 'po4'))
+        self.assertEqual(self.topology.variable_ids['po4'],
+                self.system.variables.po4.id)
+        self.assertEqual(self.system.N_boxes, 2)
+        self.assertEqual(self.system.N_variables, 2)
+        self.assertIs(self.system.pint_ur, ur)
+
+    def test_processes_and_reactions(self):
+        topology = self.topology
+        self.assertEqual(topology.box_process_ids[self.uo.id], (0,))
+        self.assertEqual(topology.box_process_ids[self.do.id], ())
+        self.assertEqual(topology.process_variable_ids.tolist(),
+                [self.system.variables.po4.id])
+        self.assertEqual(topology.reaction_box_ids, ((self.uo.id,),))
+
+    def test_transport_endpoints(self):
+        topology = self.topology
+        self.assertEqual(topology.flow_source_ids.tolist(),
+                [OUTSIDE, self.uo.id])
+        self.assertEqual(topology.flow_target_ids.tolist(),
+                [self.uo.id, self.do.id])
+        self.assertEqual(topology.flux_variable_ids.tolist(),
+                [self.system.variables.phyto.id])
+
+    def test_adjacency(self):
+        topology = self.topology
+        self.assertEqual(topology.outgoing_flow_ids[self.uo.id], (1,))
+        self.assertEqual(topology.incoming_flow_ids[self.uo.id], (0,))
+        self.assertEqual(topology.incoming_flow_ids[self.do.id], (1,))
+        self.assertEqual(topology.source_flow_ids, (0,))
+        self.assertEqual(topology.sink_flow_ids, ())
+        self.assertEqual(topology.outgoing_flux_ids[self.uo.id], (0,))
+        self.assertEqual(topology.variable_flux_ids[
+            self.system.variables.phyto.id], (0,))
+        self.assertEqual(topology.variable_flux_ids[
+            self.system.variables.po4.id], ())
+
+    def test_transport_lookups(self):
+        system = self.system
+        self.assertEqual([f.name for f in system.get_flows_from(None)],
+                ['river'])
+        self.assertEqual([f.name for f in system.get_flows_to(self.do)],
+                ['downwelling'])
+        self.assertEqual(system.get_flows_to(None), [])
+        self.assertEqual([f.name for f in system.get_fluxes_to(self.do)],
+                ['sinking'])
+        self.assertEqual(system.get_fluxes_from(self.do), [])
+        self.assertEqual([f.name for f in system.get_variable_fluxes(
+            system.variables.phyto)], ['sinking'])
+
+    def test_select_transports(self):
+        system = self.system
+        flows = system._select_transports((0, 1), system.flows,
+                [system.flows[1]])
+        self.assertEqual([f.name for f in flows], ['downwelling'])
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.topology.N_boxes = 3
+        with self.assertRaises(TypeError):
+            self.topology.box_ids['upper_ocean'] = 0
+        with self.assertRaises(ValueError):
+            self.topology.flow_source_ids[0] = 0
+
+    def test_deepcopy(self):
+        system = copy.deepcopy(self.system)
+        topology = system.topology
+        self.assertIs(topology.box_list[1], system.boxes.upper_ocean)
+        with self.assertRaises(TypeError):
+            topology.box_ids['upper_ocean'] = 0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import subprocess
+import unittest
+from unittest import TestCase
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+import pint
+
+from boxsimu import units as bs_units
+
+
+REPOSITORY_DIR = os.path.abspath(__file__ + "/../../")
+
+
+def run_python(code, **environ):
+    """Run code in a new interpreter and return its stdout."""
+    env = dict(os.environ, **environ)
+    return subprocess.check_output([sys.executable, '-c', code],
+            cwd=REPOSITORY_DIR, env=env, universal_newlines=True)
+
+
+class UnitRegistryCacheTest(TestCase):
+    """Test the on-disk cache of the unit registry."""
+
+    CODE = ('from boxsimu import units\n'
+            'ur = units.get_unit_registry()\n'
+            'print(type(ur).__name__, len(ur._units), ur.default_system)\n'
+            'print((1*ur.year).to(ur.second).magnitude)\n'
+            'print((3*ur.km/ur.hour).to_base_units())\n'
+            'print((ur.kg/ur.meter**3).dimensionality == '
+            'ur.parse_units("g/l").dimensionality)\n'
+            'print(ur.Quantity(20, "degC").to("kelvin"))\n')
+
+    def test_cached_registry_equals_registry(self):
+        ur = pint.UnitRegistry()
+        expected = run_python(self.CODE, BOXSIMU_CACHE_DIR='')
+        self.assertIn(str(len(ur._units)), expected)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # The first run writes the cache, the second run reads it
+            first = run_python(self.CODE, BOXSIMU_CACHE_DIR=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            second = run_python(self.CODE, BOXSIMU_CACHE_DIR=cache_dir)
+        self.assertTrue(first.startswith('_CachedUnitRegistry'))
+        self.assertEqual(first.split('\n', 1)[1], expected.split('\n', 1)[1])
+        self.assertEqual(second, first)
+
+    def test_corrupt_cache_is_rebuilt(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ur = bs_units.get_unit_registry(cache_dir)
+            file_name = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            with open(file_name, 'wb') as f:
+                f.write(b'corrupt')
+            ur = bs_units.get_unit_registry(cache_dir)
+            self.assertEqual((1*ur.kg).to(ur.gram).magnitude, 1000)
+            self.assertGreater(os.path.getsize(file_name), 1000)
+
+    def test_untrusted_cache_is_ignored(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bs_units.get_unit_registry(cache_dir)
+            file_name = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            self.assertEqual(os.stat(file_name).st_mode & 0o077, 0)
+            os.chmod(file_name, 0o666)
+            with self.assertRaises(ValueError):
+                bs_units._load_cached_unit_registry(file_name)
+            # The cache file is replaced by a trusted one
+            ur = bs_units.get_unit_registry(cache_dir)
+            self.assertEqual((1*ur.kg).to(ur.gram).magnitude, 1000)
+            self.assertEqual(os.stat(file_name).st_mode & 0o077, 0)
+
+    def test_unsupported_pint_falls_back(self):
+        supported = bs_units.CACHE_SUPPORTED
+        bs_units.CACHE_SUPPORTED = False
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                ur = bs_units.get_unit_registry(cache_dir)
+                self.assertEqual(os.listdir(cache_dir), [])
+        finally:
+            bs_units.CACHE_SUPPORTED = supported
+        self.assertNotIsInstance(ur, bs_units._CachedUnitRegistry)
+        self.assertEqual((1*ur.kg).to(ur.gram).magnitude, 1000)
+
+    def test_cache_disabled(self):
+        environ = os.environ.get('BOXSIMU_CACHE_DIR')
+        os.environ['BOXSIMU_CACHE_DIR'] = ''
+        try:
+            self.assertIsNone(bs_units.get_cache_dir())
+        finally:
+            if environ is None:
+                del os.environ['BOXSIMU_CACHE_DIR']
+            else:
+                os.environ['BOXSIMU_CACHE_DIR'] = environ
+
+
+class LazyImportTest(TestCase):
+    """Test that plotting, SVG and pickling libraries are loaded lazily."""
+
+    def test_import_is_headless(self):
+        output = run_python('import sys\n'
+                'import boxsimu\n'
+                'print(sorted(m for m in ("matplotlib", "svgwrite", "dill")'
+                ' if m in sys.modules))\n')
+        self.assertEqual(output.strip(), '[]')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from unittest import TestCase
+
+import sys
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu import validation as bs_validation
+from boxsimu import errors as bs_errors
+from boxsimu import ur
+
+
+class UnitCacheTest(TestCase):
+    """Test the cached unit conversion and validation."""
+
+    def setUp(self, *args, **kwargs):
+        bs_validation.clear_unit_info_cache()
+
+    def test_unit_info_is_cached(self):
+        info1 = bs_validation.get_unit_info(ur.kg / ur.year)
+        info2 = bs_validation.get_unit_info(ur.kilogram / ur.year)
+        self.assertIs(info1, info2)
+        self.assertEqual(info1.base_units, ur.kg / ur.second)
+
+    def test_to_base_units(self):
+        for q in [3 * ur.kg / ur.year, 5 * ur.gram, 2 * ur.dimensionless,
+                np.array([1.0, 2.0]) * ur.km**3 / ur.day]:
+            converted = bs_validation.to_base_units(q)
+            expected = q.to_base_units()
+            self.assertEqual(converted.units, expected.units)
+            np.testing.assert_allclose(converted.magnitude,
+                    expected.magnitude, rtol=1e-15)
+
+    def test_offset_units(self):
+        T = ur.Quantity(10, ur.degC)
+        self.assertAlmostEqual(bs_validation.get_base_magnitude(T), 283.15)
+
+    def test_dimensionality_validation(self):
+        bs_validation.raise_if_not_mass_per_time(1 * ur.kg / ur.year)
+        with self.assertRaises(bs_errors.WrongUnitsDimensionalityError):
+            bs_validation.raise_if_not_mass_per_time(1 * ur.kg)
+        self.assertTrue(bs_validation.is_dimless(0.5))
+        self.assertFalse(bs_validation.is_mass(0.5))
+        self.assertTrue(bs_validation.is_quantity_of_dimensionality(
+            1 * ur.mole, ur.kg, ur.mole))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import time
+import tempfile
+import unittest
+from unittest import TestCase
+import xml.etree.ElementTree as ET
+
+import sys
+
+import numpy as np
+
+if not os.path.abspath(__file__ + "/../../../") in sys.path:
+    sys.path.append(os.path.abspath(__file__ + "/../../../"))
+
+from boxsimu.entities import Fluid, Variable
+from boxsimu.box import Box
+from boxsimu.transport import Flow, Flux
+from boxsimu.system import BoxModelSystem
+from boxsimu import visualize as bs_visualize
+from boxsimu import ur
+
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+def get_system(N_boxes):
+    """Return a chain of N_boxes boxes with random fluxes between them."""
+    water = Fluid('water', rho=1000*ur.kg/ur.meter**3)
+    po4 = Variable('po4')
+    boxes = [Box('box{}'.format(i), 'Box <{}>'.format(i),
+        fluid=water.q(1e3*ur.kg), variables=[po4.q(1*ur.kg)])
+        for i in range(N_boxes)]
+    flows = [Flow('flow{}'.format(i), boxes[i], boxes[i+1], 1*ur.kg/ur.year)
+            for i in range(N_boxes-1)]
+    flows += [Flow('inflow', None, boxes[0], 1*ur.kg/ur.year),
+            Flow('outflow', boxes[-1], None, 1*ur.kg/ur.year)]
+    pairs = np.random.RandomState(0).randint(0, N_boxes, (N_boxes // 2, 2))
+    fluxes = [Flux('flux{}'.format(i), boxes[a], boxes[b], po4,
+        1*ur.kg/ur.year) for i, (a, b) in enumerate(pairs) if a != b]
+    return BoxModelSystem('system', boxes, flows=flows, fluxes=fluxes)
+
+
+class SystemSvgRendererTest(TestCase):
+    """Test the scalable SVG renderer of BoxModelSystems."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.system = get_system(300)
+
+    def render(self, layout):
+        f = io.StringIO()
+        bs_visualize.SystemSvgRenderer(layout).write(self.system, f)
+        return ET.fromstring(f.getvalue().encode('utf-8'))
+
+    def test_layouts(self):
+        for layout in bs_visualize.SystemSvgRenderer.LAYOUTS:
+            start = time.time()
+            svg = self.render(layout)
+            self.assertLess(time.time() - start, 10)
+            self.assertEqual(len(svg.findall('.//{}rect'.format(SVG))), 300)
+            lines = svg.findall('.//{}line'.format(SVG))
+            self.assertEqual(len(lines), len(self.system.flows) +
+                    len(self.system.fluxes))
+            self.assertEqual(svg.find('.//{}title'.format(SVG)).text,
+                    'flow0')
+        with self.assertRaises(ValueError):
+            bs_visualize.SystemSvgRenderer('grid')
+
+    def test_layered_layout(self):
+        renderer = bs_visualize.SystemSvgRenderer('layered')
+        system = get_system(5)
+        widths = np.full(5, 100.0)
+        heights = np.full(5, 50.0)
+        positions = renderer.get_positions(system, widths, heights)
+        # The boxes of the chain are placed in consecutive layers
+        self.assertTrue(np.all(np.diff(positions[:, 1]) > 0))
+        self.assertIs(renderer.get_positions(system, widths, heights),
+                positions)
+
+    def test_boxes_do_not_overlap(self):
+        renderer = bs_visualize.SystemSvgRenderer('layered')
+        renderer.max_row_boxes = 10
+        lines, titles = renderer._get_box_texts(self.system)
+        widths, heights = renderer._get_box_sizes(lines, titles)
+        positions = renderer.get_positions(self.system, widths, heights)
+        dx = np.abs(np.subtract.outer(positions[:, 0], positions[:, 0]))
+        dy = np.abs(np.subtract.outer(positions[:, 1], positions[:, 1]))
+        overlap = ((dx < np.add.outer(widths, widths) / 2) &
+                (dy < np.add.outer(heights, heights) / 2))
+        np.fill_diagonal(overlap, False)
+        self.assertFalse(overlap.any())
+
+    def test_save_as_svg(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'system')
+            get_system(3).save_as_svg(file_name, layout='circle')
+            root = ET.parse(file_name + '.svg').getroot()
+        self.assertEqual(root.find('{}g'.format(SVG)).get('id'), 'system')
+
+    def test_save_as_svg_reuses_layout(self):
+        system = get_system(3)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'system.svg')
+            system.save_as_svg(file_name)
+            renderer = system._svg_renderers['layered']
+            system.save_as_svg(file_name)
+            self.assertIs(system._svg_renderers['layered'], renderer)
+            self.assertEqual(len(renderer._layout_cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()